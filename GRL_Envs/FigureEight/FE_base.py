@@ -352,11 +352,12 @@ class Env(gym.Env):
 
             for veh_id in self.k.vehicle.get_ids():
 
-                if self.k.vehicle.get_routing_controller(veh_id) \
-                        is not None:
+                route_contr = self.k.vehicle.get_routing_controller(veh_id)
+                # routers subscribed to edge/lane events are only called
+                # after these events (see BaseRouter.route_events)
+                if route_contr is not None and \
+                        route_contr.has_route_event(self):
                     routing_ids.append(veh_id)
-                    route_contr = self.k.vehicle.get_routing_controller(
-                        veh_id)
                     routing_actions.append(route_contr.choose_route(self))
 
             # print(changing_color_list)
@@ -2,13 +2,13 @@
 import torch
 from flow.core import rewards
 from GRL_Envs.FigureEight.FE_base import Env
+from GRL_Envs.graph_observation import neighbor_edges
 # from flow.envs.base import Env
 
 from gym.spaces.box import Box
 from gym.spaces import Tuple
 
 import numpy as np
-from sklearn.metrics import euclidean_distances
 
 ADDITIONAL_ENV_PARAMS = {
     # maximum acceleration for autonomous vehicles, in m/s^2
@@ -179,22 +179,16 @@ class AccelEnv(Env):
             states = np.c_[speeds_norm, xs_norm]
 
             # ------Adjacency matrix------ #
-            # Calculate the horizontal distance between two vehicles
-            dist_matrix = euclidean_distances(xs)
-            # Generate an all-zero adjacency matrix of the same dimension from dist_matrix
-            adjacency_small = np.zeros_like(dist_matrix)
-            # Assigning values to the adjacency matrix based on the perceived range of CAVs
-            adjacency_small[dist_matrix < 20] = 1
+            # Node slots of the vehicles, HVs are followed by the CAVs starting at num_HVs
+            index_observations = np.r_[np.arange(len(human_ids)), num_HVs + np.arange(len(rl_ids))]
+            index_RL = index_observations[len(human_ids):]
+            # Connections based on the perceived range of CAVs (horizontal distance between two vehicles)
+            perception_range = self.env_params.additional_params.get('perception_range', 20)
+            num_neighbors = self.env_params.additional_params.get('perception_neighbors', None)
+            edges = index_observations[neighbor_edges(xs, perception_range, num_neighbors)]
+            adjacency[edges[0], edges[1]] = 1
             # Assignment of communication between CAVs in the adjacency matrix
-            adjacency_small[-len(rl_ids):, -len(rl_ids):] = 1
-            # adjacency = adjacency_small
-
-            # assemble into the NxN adjacency matrix
-            adjacency[:len(human_ids), :len(human_ids)] = adjacency_small[:len(human_ids), :len(human_ids)]
-            adjacency[num_HVs:num_HVs + len(rl_ids), :len(human_ids)] = adjacency_small[len(human_ids):, :len(human_ids)]
-            adjacency[:len(human_ids), num_HVs:num_HVs + len(rl_ids)] = adjacency_small[:len(human_ids), len(human_ids):]
-            adjacency[num_HVs:num_HVs + len(rl_ids), num_HVs:num_HVs + len(rl_ids)] = adjacency_small[len(human_ids):,
-                                                                                  len(human_ids):]
+            adjacency[np.ix_(index_RL, index_RL)] = 1
 
             # ------Index matrix------ #
             mask[num_HVs:num_HVs + len(rl_ids)] = np.ones(len(rl_ids))
@@ -31,6 +31,9 @@ from flow.controllers.base_routing_controller import BaseRouter
 class SpecificMergeRouter(BaseRouter):
     """docstring for ClassName"""
 
+    # the route choice only depends on the edge and lane of the vehicle
+    route_events = frozenset(['edge', 'lane'])
+
     def choose_route(self, env):
         """See parent class.
 
@@ -59,6 +62,9 @@ class SpecificMergeRouter(BaseRouter):
 
 
 class NearestMergeRouter(BaseRouter):
+    # the route choice only depends on the edge and lane of the vehicle
+    route_events = frozenset(['edge', 'lane'])
+
     def choose_route(self, env):
         veh_type = env.k.vehicle.get_type(self.veh_id)
         current_lane = env.k.vehicle.get_lane(self.veh_id)
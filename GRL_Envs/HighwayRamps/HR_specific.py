@@ -1,8 +1,8 @@
 import torch
 
 from GRL_Envs.HighwayRamps.HR_base import Env
+from GRL_Envs.graph_observation import GraphObservationBuilder
 import numpy as np
-from sklearn.metrics.pairwise import euclidean_distances
 
 from gym.spaces.box import Box
 from gym.spaces import Tuple
@@ -10,18 +10,34 @@ from gym.spaces import Tuple
 
 class MergeEnv(Env):
 
+    @property
+    def sparse_observation(self):
+        """Whether the observations only contain the vehicles in the network
+        (additional_params['sparse_observation']), see get_state.
+        """
+        return self.env_params.additional_params.get('sparse_observation', False)
+
     @property
     def observation_space(self):
         """Identify the dimensions and bounds of the observation space.
+
+        For sparse observations the sizes vary every step, the spaces give
+        their maximum sizes.
         """
         N = self.net_params.additional_params['num_vehicles']
         F = 2 + self.net_params.additional_params['highway_lanes'] \
             + self.n_unique_intentions
 
         states = Box(low=-np.inf, high=np.inf, shape=(N, F), dtype=np.float32)
-        adjacency = Box(low=0, high=1, shape=(N, N), dtype=np.int32)
         mask = Box(low=0, high=1, shape=(N,), dtype=np.int32)
 
+        if self.sparse_observation:
+            edge_index = Box(low=0, high=N - 1, shape=(2, N * N), dtype=np.int64)
+            node_map = Box(low=-1, high=N - 1, shape=(N,), dtype=np.int64)
+            return Tuple([states, edge_index, mask, node_map])
+
+        adjacency = Box(low=0, high=1, shape=(N, N), dtype=np.int32)
+
         return Tuple([states, adjacency, mask])
 
     @property
@@ -33,6 +49,12 @@ class MergeEnv(Env):
     def get_state(self):
         """
             construct a graph representation each time step
+
+            Dense observations (states NxF, adjacency NxN, mask_RL N) give every
+            vehicle of additional_params['vehicles_ids'] a fixed row. Sparse
+            observations (states nxF, edge_index 2xE, mask_RL n, node_map N) only
+            contain the n observed vehicles, node_map gives the row of each vehicle
+            (-1 if not observed).
         """
         N = self.net_params.additional_params['num_vehicles']
         # num_cav = self.net_params.additional_params['num_cav'] # maximum number of CAVs
@@ -40,9 +62,6 @@ class MergeEnv(Env):
 
         num_lanes = self.net_params.additional_params['highway_lanes']
 
-        # id acquiring
-        vehicle_ids = self.net_params.additional_params['vehicles_ids']
-
         # CAVs id acquiring
         rl_ids = self.k.vehicle.get_rl_ids()
         # filter the ones on the ramps
@@ -56,71 +75,72 @@ class MergeEnv(Env):
         if len(human_ids) > num_hv:
             human_ids = human_ids[:num_hv]
 
-        # Initialise the node feature matrix, adjacency matrix and index matrix
-        states = np.zeros([N, 2 + num_lanes + self.n_unique_intentions])
-        adjacency = np.zeros([N, N])
-        mask_RL = np.zeros(N)
-
-        # when there is rl_vehicles in the scenario
-        if rl_ids:
-            ids = human_ids + rl_ids
-
-            # Index matrix
-            mask_observations = np.zeros(N)
-            index_observations = [vehicle_ids.index(elem) for elem in ids]
-            mask_observations[index_observations] = 1
-
-            index_RL = [vehicle_ids.index(elem) for elem in rl_ids]
-            mask_RL[index_RL] = 1
-
-            # numerical data (speed, location)
-            speeds = np.array(self.k.vehicle.get_speed(ids)).reshape(-1, 1)
-
-            # positions = np.array([self.k.vehicle.get_absolute_position(i) for i in ids])  # x y location
-            xs = np.array([self.k.vehicle.get_x_by_id(i) for i in ids]).reshape(-1, 1)
-
-            # categorical data 1 hot encoding: (lane location, intention)
-            # The number of the lane in which the vehicle is currently located in the environment
-            lanes_column = np.array(self.k.vehicle.get_lane(ids))
-            # Initialise the lane onehot matrix (current number of vehicles x number of lanes)
-            lanes = np.zeros([len(ids), num_lanes])
-            # Each vehicle is assigned a value of 1 in the corresponding position of the matrix
-            # according to the lane position
-            lanes[np.arange(len(ids)), lanes_column] = 1
-            # print(np.arange(len(ids)))
-            # print("lanes_column", lanes_column)
-            # print("lanes:", lanes)
-
-            # intention encoding
-            types_column = np.array([self.intention_dict[self.k.vehicle.get_type(i)] for i in ids])
-            # Initialise the intention matrix (current number of vehicles x vehicle type)
-            intention = np.zeros([len(ids), self.n_unique_intentions])
-            # Assign values to the intention matrix according to the type of vehicle in the current environment
-            intention[np.arange(len(ids)), types_column] = 1
-
-            # Feature fusion
-            observed_states = np.c_[xs, speeds, lanes, intention]
-
-            # assemble into the NxF states matrix
-            states[index_observations, :] = observed_states
-            states[:, 0] /= self.net_params.additional_params['highway_length']
-
-            # construct the adjacency matrix
-            dist_matrix = euclidean_distances(xs)
-            # Generate an all-zero adjacency matrix of the same dimension from dist_matrix
-            adjacency_small = np.zeros_like(dist_matrix)
-
-            adjacency_small[dist_matrix < 20] = 1
-            for count in range(len(index_observations)):  # Connection between CAVs and HVs
-                adjacency[index_observations[count], index_observations] = adjacency_small[count, :]
-            for count in range(len(index_RL)):  # Connection between CAVs
-                adjacency[index_RL[count], index_RL] = 1
-
-            self.observed_cavs = rl_ids
-            self.observed_all_vehs = ids
+        # when there is no rl_vehicles in the scenario, the graph is empty
+        if not rl_ids:
+            if self.sparse_observation:
+                num_features = 2 + num_lanes + self.n_unique_intentions
+                return self.graph_builder.build_sparse([], [], np.zeros([0, num_features]), np.zeros(0))
+            states = np.zeros([N, 2 + num_lanes + self.n_unique_intentions])
+            adjacency = np.zeros([N, N])
+            mask_RL = np.zeros(N)
+            return states, adjacency, mask_RL
+
+        ids = human_ids + rl_ids
+
+        # numerical data (speed, location)
+        speeds = np.array(self.k.vehicle.get_speed(ids)).reshape(-1, 1)
+
+        # positions = np.array([self.k.vehicle.get_absolute_position(i) for i in ids])  # x y location
+        xs = np.array(self.k.vehicle.get_x_by_id(ids)).reshape(-1, 1)
+
+        # categorical data 1 hot encoding: (lane location, intention)
+        # The number of the lane in which the vehicle is currently located in the environment
+        lanes_column = np.array(self.k.vehicle.get_lane(ids))
+        # Initialise the lane onehot matrix (current number of vehicles x number of lanes)
+        lanes = np.zeros([len(ids), num_lanes])
+        # Each vehicle is assigned a value of 1 in the corresponding position of the matrix
+        # according to the lane position
+        lanes[np.arange(len(ids)), lanes_column] = 1
+
+        # intention encoding
+        types_column = np.array([self.intention_dict[self.k.vehicle.get_type(i)] for i in ids])
+        # Initialise the intention matrix (current number of vehicles x vehicle type)
+        intention = np.zeros([len(ids), self.n_unique_intentions])
+        # Assign values to the intention matrix according to the type of vehicle in the current environment
+        intention[np.arange(len(ids)), types_column] = 1
+
+        # Feature fusion, the location is normalized by the highway length
+        xs_norm = xs / self.net_params.additional_params['highway_length']
+        observed_states = np.c_[xs_norm, speeds, lanes, intention]
+
+        self.observed_cavs = rl_ids
+        self.observed_all_vehs = ids
+
+        if self.sparse_observation:
+            return self.graph_builder.build_sparse(ids, rl_ids, observed_states, xs)
+
+        # assemble into the NxF states matrix and construct the adjacency matrix
+        states, adjacency, mask_RL = self.graph_builder.build(ids, rl_ids, observed_states, xs)
 
         return states, adjacency, mask_RL
 
+    @property
+    def graph_builder(self):
+        """
+            Graph observation builder, the node slots of the vehicles are given
+            by additional_params['vehicles_ids'] (created on first use)
+        """
+        vehicle_ids = self.net_params.additional_params['vehicles_ids']
+        if getattr(self, '_graph_builder', None) is None or \
+                self._graph_builder.vehicle_ids is not vehicle_ids:
+            num_features = 2 + self.net_params.additional_params['highway_lanes'] \
+                + self.n_unique_intentions
+            self._graph_builder = GraphObservationBuilder(
+                vehicle_ids, num_features,
+                perception_range=self.env_params.additional_params.get('perception_range', 20),
+                num_neighbors=self.env_params.additional_params.get('perception_neighbors', None))
+        return self._graph_builder
+
     def compute_reward(self, rl_actions, **kwargs):
         # w_intention = 10
         w_intention = 3
@@ -250,8 +270,7 @@ class MergeEnv(Env):
             # print("rl_actions2:", rl_actions2)
 
             # The core controller is in /flow/core/kernel/vehicle/traci.py (apply_lane_change)
-            vehicle_ids = self.net_params.additional_params['vehicles_ids']
-            index_RL = [vehicle_ids.index(elem) for elem in rl_ids]
+            index_RL = self.graph_builder.slot_indexes(rl_ids)
             rl_actions2 = rl_actions2[index_RL]
             if len(rl_ids) != 0:
                 self.k.vehicle.apply_lane_change(rl_ids, rl_actions2)
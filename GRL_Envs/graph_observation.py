@@ -0,0 +1,193 @@
+"""
+    This function is used to build the graph observations (node feature matrix,
+    adjacency matrix and RL mask) of the GRL environments
+"""
+
+import numpy as np
+
+
+def neighbor_edges(xs, perception_range, num_neighbors=None):
+    """
+        <Neighbor search function>
+        Return the COO edge list of the vehicle pairs closer than perception_range,
+        without building the all-pairs distance matrix.
+
+        The positions are sorted once and the neighbors of every vehicle are the
+        contiguous window of the sorted positions found by bisection (searchsorted),
+        so the cost is O(n log n + E) in time and O(E) in memory instead of O(n^2).
+        Every vehicle is connected with itself.
+
+        Parameters：
+        ------
+        xs: positions of the vehicles, shape [n] or [n, 1]
+        perception_range: the distance below which two vehicles are connected
+        num_neighbors: if given, every vehicle only receives the edges of its
+        num_neighbors nearest vehicles within the perception range (k-nearest)
+
+        Returns:
+        ------
+        edge_index: int64 array of shape [2, E], the rows are the (row, column)
+        positions of the connections in xs
+    """
+    xs = np.asarray(xs, dtype=np.float64).reshape(-1)
+    order = np.argsort(xs, kind='stable')
+    xs_sorted = xs[order]
+
+    # window [low, high) of the sorted positions with |x_i - x_j| < perception_range
+    low = np.searchsorted(xs_sorted, xs_sorted - perception_range, side='right')
+    high = np.searchsorted(xs_sorted, xs_sorted + perception_range, side='left')
+    counts = high - low
+
+    # expand the windows into (row, column) pairs of the sorted positions
+    rows = np.repeat(np.arange(len(xs)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = np.repeat(low, counts) + offsets
+
+    if num_neighbors is not None:
+        # keep the vehicle itself and its num_neighbors nearest vehicles per row
+        distances = np.abs(xs_sorted[cols] - xs_sorted[rows])
+        ranked = np.lexsort((rows != cols, distances, rows))
+        rank = np.empty(len(ranked), dtype=np.int64)
+        rank[ranked] = np.arange(len(ranked)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = rank <= num_neighbors
+        rows, cols = rows[keep], cols[keep]
+
+    return np.stack([order[rows], order[cols]])
+
+
+class GraphObservationBuilder(object):
+    """
+        Builder of the NxF node feature matrix, NxN adjacency matrix and N mask of the
+        graph observation. Every vehicle id has a fixed node slot, given by its
+        position in vehicle_ids; the slots are looked up in a precomputed dictionary
+        and the features and connections are scattered with fancy indexing. The
+        connections are found with neighbor_edges, so their cost grows with the
+        number of edges instead of the square of the number of vehicles.
+
+        The returned arrays are allocated for every observation, because the replay
+        buffers and PPOMemory may keep references to them.
+    """
+
+    def __init__(self, vehicle_ids, num_features, perception_range=20, num_neighbors=None):
+        """
+            <Constructor>
+
+            Parameters：
+            ------
+            vehicle_ids: list of all the vehicle ids, the position of an id is its node slot
+            num_features: the feature length of each vehicle (F)
+            perception_range: the distance below which two vehicles are connected
+            num_neighbors: the maximum number of nearest vehicles each vehicle is
+            connected with (None for all the vehicles within the perception range)
+        """
+        self.vehicle_ids = vehicle_ids
+        self.num_vehicles = len(vehicle_ids)
+        self.num_features = num_features
+        self.perception_range = perception_range
+        self.num_neighbors = num_neighbors
+
+        # id -> slot dictionary (the first occurrence wins, as with list.index)
+        self.slots = {}
+        for slot, veh_id in enumerate(vehicle_ids):
+            self.slots.setdefault(veh_id, slot)
+
+    def slot_indexes(self, ids):
+        """
+            <Slot lookup function>
+            Return the node slots of the given vehicle ids.
+        """
+        return np.array([self.slots[veh_id] for veh_id in ids], dtype=np.int64)
+
+    def _local_edges(self, ids, rl_ids, xs):
+        """
+            Connections of the graph as a COO edge list of the rows of the observed
+            vehicles (positions in ids), without duplicated edges.
+        """
+        rows = {veh_id: row for row, veh_id in enumerate(ids)}
+        index_RL = np.array([rows[veh_id] for veh_id in rl_ids], dtype=np.int64)
+
+        # Connection between CAVs and HVs
+        edges = neighbor_edges(xs, self.perception_range, self.num_neighbors)
+        # Connection between CAVs
+        edges_RL = np.stack([np.repeat(index_RL, len(index_RL)), np.tile(index_RL, len(index_RL))])
+
+        edges = np.concatenate([edges, edges_RL], axis=1)
+        edges = np.unique(edges[0] * len(ids) + edges[1])
+        return np.stack([edges // len(ids), edges % len(ids)]), index_RL
+
+    def edge_index(self, ids, rl_ids, xs):
+        """
+            <Edge list function>
+            Return the connections of the graph as a COO edge list of node slots
+            (int64 array of shape [2, E], without duplicated edges).
+
+            Parameters：
+            ------
+            ids: ids of the observed vehicles
+            rl_ids: ids of the controlled vehicles (a subset of ids)
+            xs: positions of the observed vehicles
+        """
+        edges, _ = self._local_edges(ids, rl_ids, xs)
+        return self.slot_indexes(ids)[edges]
+
+    def build(self, ids, rl_ids, features, xs):
+        """
+            <Observation building function>
+
+            Parameters：
+            ------
+            ids: ids of the observed vehicles
+            rl_ids: ids of the controlled vehicles (a subset of ids)
+            features: node features of the observed vehicles, shape [len(ids), F]
+            xs: positions of the observed vehicles, used for the adjacency matrix
+
+            Returns:
+            ------
+            states (NxF), adjacency (NxN), mask_RL (N). Observed vehicles within the
+            perception range are connected, and the controlled vehicles are all
+            connected with each other.
+        """
+        states = np.zeros([self.num_vehicles, self.num_features])
+        adjacency = np.zeros([self.num_vehicles, self.num_vehicles])
+        mask_RL = np.zeros(self.num_vehicles)
+
+        index_observations = self.slot_indexes(ids)
+        index_RL = self.slot_indexes(rl_ids)
+
+        # Index matrix
+        mask_RL[index_RL] = 1
+
+        # Node feature matrix
+        states[index_observations, :] = features
+
+        # Connections between CAVs and HVs, and between CAVs
+        edges = self.edge_index(ids, rl_ids, xs)
+        adjacency[edges[0], edges[1]] = 1
+
+        return states, adjacency, mask_RL
+
+    def build_sparse(self, ids, rl_ids, features, xs):
+        """
+            <Sparse observation building function>
+            Build the variable-size observation of the observed vehicles only, the
+            parameters are the same as for build.
+
+            Returns:
+            ------
+            states (nxF), edge_index (2xE, COO edge list between the n observed
+            vehicles), mask_RL (n) and node_map (N, the row of each node slot in states,
+            -1 if the vehicle is not observed).
+        """
+        states = np.asarray(features, dtype=np.float64).reshape(len(ids), self.num_features)
+        mask_RL = np.zeros(len(ids))
+        node_map = np.full(self.num_vehicles, -1, dtype=np.int64)
+
+        edge_index, index_RL = self._local_edges(ids, rl_ids, xs)
+
+        # Index matrix
+        mask_RL[index_RL] = 1
+
+        # Node slots
+        node_map[self.slot_indexes(ids)] = np.arange(len(ids))
+
+        return states, edge_index, mask_RL, node_map
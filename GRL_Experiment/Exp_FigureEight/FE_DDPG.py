@@ -64,7 +64,7 @@ class Experiment:
         # Noisy
         explore_noise = OUActionNoise(mu=np.zeros([N, A]))
         # Replay_buffer
-        replay_buffer = replay_buffer.ReplayBuffer(size=10 ** 6)
+        replay_buffer = replay_buffer.ReplayBuffer(size=10 ** 6, frame_indexed=True)
         # Discount factor
         gamma = 0.9
 
@@ -59,7 +59,7 @@ class Experiment:
         # Initialize optimizer
         optimizer = torch.optim.Adam(GRL_Net.parameters(), lr=1e-2)
         # Replay_buffer
-        replay_buffer = replay_buffer.ReplayBuffer(size=10 ** 6)
+        replay_buffer = replay_buffer.ReplayBuffer(size=10 ** 6, frame_indexed=True)
         # Discount factor
         gamma = 0.9
         # Exploration
@@ -69,7 +69,7 @@ class Experiment:
         # Noisy
         explore_noise = 0.1
         # Replay_buffer
-        replay_buffer = replay_buffer.ReplayBuffer(size=10 ** 6)
+        replay_buffer = replay_buffer.ReplayBuffer(size=10 ** 6, frame_indexed=True)
         # Discount factor
         gamma = 0.9
 
@@ -22,21 +22,22 @@ class Experiment:
         self.custom_callables = custom_callables or {}
 
         # Get the env name and a creator for the environment.
-        create_env, _ = make_create_env(flow_params)
+        self.create_env, _ = make_create_env(flow_params)
 
         # Create the environment.
-        self.env = create_env()
+        self.env = self.create_env()
 
         logging.info(" Starting experiment {} at {}".format(
             self.env.network.name, str(datetime.datetime.utcnow())))
 
         logging.info("Initializing environment.")
 
-    def run(self, num_HVs, num_AVs, training, testing, Graph):
+    def run(self, num_HVs, num_AVs, training, testing, Graph, num_envs=1):
 
         import torch
         from GRL_Library.agent.Discrete import A2C_agent
         from GRL_Utils.Train_and_Test_AC import Training_GRLModels, Testing_GRLModels
+        from GRL_Utils.Vector_Env import VectorEnv
 
         # Initialize GRL model
         N = num_HVs + num_AVs
@@ -69,7 +70,11 @@ class Experiment:
         max_episode_len = 2500
         save_dir = '../GRL_TrainedModels/A2C/DQN5'
         debug_training = False
-        if training:
+        if training and num_envs > 1:
+            # The environments run in num_envs subprocesses, their actions are selected in batches
+            with VectorEnv(self.create_env, num_envs, max_episode_len) as env:
+                Training_GRLModels(GRL_Net, GRL_A2C, env, n_episodes, max_episode_len, save_dir, debug_training)
+        elif training:
             Training_GRLModels(GRL_Net, GRL_A2C, self.env, n_episodes, max_episode_len, save_dir, debug_training)
 
         # Testing
@@ -23,22 +23,22 @@ class Experiment:
         self.custom_callables = custom_callables or {}
 
         # Get the env name and a creator for the environment.
-        create_env, _ = make_create_env(flow_params)
+        self.create_env, _ = make_create_env(flow_params)
 
         # Create the environment.
-        self.env = create_env()
+        self.env = self.create_env()
 
         logging.info(" Starting experiment {} at {}".format(
             self.env.network.name, str(datetime.datetime.utcnow())))
 
         logging.info("Initializing environment.")
 
-    def run(self, num_HVs, num_AVs, training, testing, Graph):
+    def run(self, num_HVs, num_AVs, training, testing, Graph, num_actors=0, num_envs=1):
 
         import torch
         from GRL_Library.common import prioritized_replay_buffer, explorer_discrete
         from GRL_Library.agent.Discrete import DistributionalDoubleDQN_agent
-        from GRL_Utils.Train_and_Test_Q import Training_GRLModels, Testing_GRLModels
+        from GRL_Utils.Train_and_Test_Q import Training_GRLModels_Dispatch, Testing_GRLModels
 
         # Initialize GRL model
         N = num_HVs + num_AVs
@@ -63,12 +63,18 @@ class Experiment:
 
         # Initialize optimizer
         optimizer = torch.optim.Adam(GRL_Net.parameters(), eps=0.0001)
+        # Save directory, the replay_buffer is memory-mapped under it
+        save_dir = '../GRL_TrainedModels/RainbowDQN'
+        # Whether a restarted run continues from the stored transitions (same num_HVs, num_AVs and Graph)
+        resume = False
         # Replay_buffer
         replay_buffer = prioritized_replay_buffer.PrioritizedReplayBuffer(capacity=2 ** 12,
                                                                           alpha=0.6,
                                                                           beta=0.4,
                                                                           beta_step=0.001,
-                                                                          epsilon=1e-5)
+                                                                          epsilon=1e-5,
+                                                                          directory=save_dir + '/replay_buffer',
+                                                                          resume=resume)
         # Discount factor
         gamma = 0.9
         # Initialize exploration policy
@@ -101,11 +107,12 @@ class Experiment:
         # Training
         n_episodes = 150
         max_episode_len = 2500
-        save_dir = '../GRL_TrainedModels/RainbowDQN'
         debug_training = False
         if training:
-            Training_GRLModels(GRL_Net, GRL_DQN, self.env, n_episodes, max_episode_len, save_dir, warmup,
-                               debug_training)
+            # Actor/learner training (num_actors > 0), num_envs environments with batched
+            # actions (num_envs > 1) or the single environment
+            Training_GRLModels_Dispatch(GRL_Net, GRL_DQN, self.create_env, self.env, n_episodes, max_episode_len,
+                                        save_dir, warmup, debug_training, num_actors=num_actors, num_envs=num_envs)
 
         # Testing
         test_episodes = 10
@@ -9,6 +9,10 @@ import torch.nn.functional as F
 import copy
 import collections
 from GRL_Library.common.prioritized_replay_buffer import PrioritizedReplayBuffer
+from GRL_Library.common.replay_buffer import collate_transitions
+from GRL_Library.common.n_step_writer import NStepWriter
+from GRL_Library.common.inference import InferenceModel
+from GRL_Library.common.prefetcher import BatchPrefetcher
 
 # CUDA configuration
 USE_CUDA = torch.cuda.is_available()
@@ -37,6 +41,7 @@ class NAF(object):
         action_min: lower bound on action space
         action_max: upper bound on the action space
         model_name: model name (to be saved and read)
+        prefetch: whether to prepare the next minibatch on a background thread (see BatchPrefetcher)
     """
 
     def __init__(self,
@@ -54,7 +59,8 @@ class NAF(object):
                  n_steps,
                  action_min,
                  action_max,
-                 model_name):
+                 model_name,
+                 prefetch=False):
 
         self.model = model
         self.optimizer = optimizer
@@ -68,6 +74,8 @@ class NAF(object):
         self.target_update_method = target_update_method
         self.soft_update_tau = soft_update_tau
         self.n_steps = n_steps
+        # The n-step returns are calculated when the transitions are stored
+        self.n_step_writer = NStepWriter(n_steps, gamma) if n_steps > 1 else None
         self.action_min = action_min
         self.action_max = action_max
         self.model_name = model_name
@@ -81,6 +89,16 @@ class NAF(object):
 
         self.target_model = copy.deepcopy(model)
 
+        # Inference path for action selection (the model returns a dictionary,
+        # so it is not traced)
+        self.inference_model = InferenceModel()
+
+        # Background minibatch preparation, the transitions and the priorities then
+        # go through the prefetcher, which guards the replay_buffer
+        self.prefetcher = BatchPrefetcher(replay_buffer, batch_size, self.batch_memory, self.device) \
+            if prefetch else None
+        self.memory = replay_buffer if self.prefetcher is None else self.prefetcher
+
         self.time_counter = 0
 
         self.loss_record = collections.deque(maxlen=100)
@@ -100,15 +118,21 @@ class NAF(object):
            done: whether to terminate or not
         """
         # Call the function that holds the data in the replay_buffer
-        self.replay_buffer.add(state, action, reward, next_state, done)
+        if self.n_step_writer is None:
+            self.memory.add(state, action, reward, next_state, done)
+        else:
+            for transition in self.n_step_writer.add(state, action, reward, next_state, done):
+                self.memory.add(*transition)
 
     def sample_memory(self):
         """
            <Experience sampling function>
            Used to sample empirical data from the agent learning process
         """
-        # Call the sampling function in replay_buffer
-        data_sample = self.replay_buffer.sample(self.batch_size, self.n_steps)
+        # Take the prefetched minibatch, or call the sampling function in replay_buffer
+        if self.prefetcher is not None:
+            return self.prefetcher.get()
+        data_sample = self.replay_buffer.sample(self.batch_size)
         return data_sample
 
     def choose_action(self, observation):
@@ -121,7 +145,7 @@ class NAF(object):
            observation: observation of the environment in which the intelligence is located
         """
         # Generate actions
-        action, _, _ = self.model(observation)
+        action, _, _ = self.inference_model(self.model, observation)
         action = self.explorer.generate_action(action)
         return action
 
@@ -135,122 +159,91 @@ class NAF(object):
            observation: observation of the environment in which the intelligence is located
         """
         # Generate actions
-        action, _, _ = self.model(observation)
+        action, _, _ = self.inference_model(self.model, observation)
         action = action['action']
         return action
 
-    def compute_loss(self, data_batch):
+    def batch_memory(self, data_batch):
         """
-           <loss calculation function>
-           Used to calculate the loss of the predicted and target values, as a basis for the subsequent backpropagation derivation
+           <Batch stacking function>
+           The columnar replay_buffer returns already stacked batch arrays, the list-based
+           replay_buffers return a list of transitions, which is stacked here so that
+           the loss is always calculated on the whole batch at once. The discount of the
+           one-step transitions is gamma, the n-step transitions hold their own
 
            Parameters:
            --------
            data_batch: The data sampled from the experience pool for training
         """
-        # Initialize the loss matrix
-        loss = []
-        # TD_error
-        TD_error = []
-
-        for elem in data_batch:
-            state, action, reward, next_state, done = elem
-            action = torch.as_tensor(action, dtype=torch.long).to(self.device)
+        if isinstance(data_batch, list):
+            data_batch = collate_transitions(data_batch)
+        if len(data_batch) == 5:
+            data_batch = tuple(data_batch) + (self.gamma,)
+        return data_batch
 
-            # Predicted value
-            _, q_predict, _ = self.model(state, action)
+    def compute_value_next(self, next_state):
+        """
+           <Target value calculation function>
+           Calculate the state value of the target network in state S+1
 
-            # Save q_predict
-            q_predict_save = q_predict.detach().cpu().numpy().reshape(len(q_predict), 1)
-            data_useful = np.any(q_predict_save, axis=1)
-            self.q_record.append(q_predict_save / (data_useful.sum() + 1))
+           Parameters:
+           --------
+           next_state: the batch of next states
+        """
+        _, _, value = self.target_model(next_state)
+        return value
 
-            # Target value
-            _, _, value = self.target_model(next_state)
-            q_target = reward + self.gamma * value * (1 - done)
+    def compute_batch_loss(self, state, action, reward, next_state, done, discount):
+        """
+           <Batch loss calculation function>
+           The sampled graphs are passed through the current and the target network in a
+           single forward pass each, and the loss of every sample is calculated at once
 
-            # TD_error
-            TD_error_sample = torch.abs(q_target - q_predict)
-            TD_error_sample = torch.mean(TD_error_sample)
-            # Count the TD_error of the current sample in the total TD_error
-            TD_error.append(TD_error_sample)
+           Parameters:
+           --------
+           state: the batch of states (BxNxF, BxNxN, BxN)
+           action: the batch of actions (BxN)
+           reward: the (discounted n-step) rewards (B)
+           next_state: the batch of next states
+           done: whether to terminate (B)
+           discount: the discount factor of the target value (B, or a scalar)
+        """
+        action = torch.as_tensor(action, dtype=torch.float32, device=self.device)
+        reward = torch.as_tensor(reward, dtype=torch.float32, device=self.device).reshape(-1, 1, 1)
+        done = torch.as_tensor(done, dtype=torch.float32, device=self.device).reshape(-1, 1, 1)
+        discount = torch.as_tensor(discount, dtype=torch.float32, device=self.device).reshape(-1, 1, 1)
 
-            loss_sample = F.smooth_l1_loss(q_predict, q_target)
+        # Predicted value
+        _, q_predict, _ = self.model(state, action)
 
-            loss.append(loss_sample)
+        # Save q_predict
+        q_predict_save = q_predict.detach().cpu().numpy()
+        data_useful = np.any(q_predict_save, axis=2)
+        self.q_record.extend(q_predict_save / (data_useful.sum(axis=1) + 1)[:, None, None])
 
-        # Further processing of TD_error
-        TD_error = torch.stack(TD_error)
+        # Target value
+        with torch.no_grad():
+            value = self.compute_value_next(next_state)
+        q_target = reward + discount * value * (1 - done)
 
-        # Combine the loses of different samples in a sample into a tensor
-        loss = torch.stack(loss)
+        # Loss calculation, the loss of each sample is averaged over the vehicles
+        loss = F.smooth_l1_loss(q_predict, q_target, reduction='none')
+        loss = loss.mean(dim=(1, 2))
 
         return loss
 
-    def compute_loss_multisteps(self, data_batch, n_steps):
+    def compute_loss(self, data_batch):
         """
-           <Multi-step learning loss calculation function>
+           <loss calculation function>
            Used to calculate the loss of the predicted and target values, as a basis for the subsequent backpropagation derivation
 
            Parameters:
            --------
-           data_batch: the data sampled from the experience pool for training
-           n_steps: multi-step learning interval
-        """
-        loss = []
-
-        TD_error = []
-
-        for elem in data_batch:
-            # Take the smaller of n_steps and elem lengths to
-            # prevent n-step sequential sampling out of index
-            n_steps = min(self.n_steps, len(elem))
-
-            # ------q_predict value------ #
-            # First sample
-            state, action, reward, next_state, done = elem[0]
-            action = torch.as_tensor(action, dtype=torch.long).to(self.device)
-            # Predicted value
-            _, q_predict, _ = self.model(state, action)
-            # Save q_predict
-            q_predict_save = q_predict.detach().cpu().numpy().reshape(len(q_predict), 1)
-            data_useful = np.any(q_predict_save, axis=1)
-            self.q_record.append(q_predict_save / (data_useful.sum() + 1))
-
-            # ------Reward calculation------ #
-            reward = [i[2] for i in elem]
-            # Discount factor
-            n_step_scaling = [self.gamma ** i for i in range(n_steps)]
-            # Calculate the reward matrix by multiplying the reward value with the
-            # corresponding factor of the discount factor
-            R = np.multiply(reward, n_step_scaling)
-            # Sum
-            R = np.sum(R)
-
-            # ------q_target------ #
-            state, action, reward, next_state, done = elem[n_steps - 1]
-            # Calculate the value of n-step max_Q
-            _, _, value = self.target_model(next_state)
-            # Target value
-            q_target = R + (self.gamma ** n_steps) * value * (1 - done)
-
-            # ------TD_error for n-step------ #
-            TD_error_sample = torch.abs(q_target - q_predict)
-            TD_error_sample = torch.mean(TD_error_sample)
-            # Count the TD_error of the current sample in the total TD_error
-            TD_error.append(TD_error_sample)
-
-            # ------loss------ #
-            loss_sample = F.smooth_l1_loss(q_predict, q_target)
-            # Add the loss of the current sample to the total loss
-            loss.append(loss_sample)
-
-        # Further processing of the TD_error can be done by deciding
-        # whether to return this item as required
-        TD_error = torch.stack(TD_error)
-
-        # Combine the loses of different samples in a sample into a tensor
-        loss = torch.stack(loss)
+           data_batch: The data sampled from the experience pool for training
+        """
+        state, action, reward, next_state, done, discount = self.batch_memory(data_batch)
+
+        loss = self.compute_batch_loss(state, action, reward, next_state, done, discount)
 
         return loss
 
@@ -318,15 +311,13 @@ class NAF(object):
         # Experience pool sampling, samples include weights and indexes, data_sample is specific sampling data
         samples, data_sample = self.sample_memory()
 
-        if self.n_steps == 1:  # single-step learning
-            elementwise_loss = self.compute_loss(data_sample)
-        else:  # multi-step learning
-            elementwise_loss = self.compute_loss_multisteps(data_sample, self.n_steps)
+        # The multi-step transitions already hold their n-step return
+        elementwise_loss = self.compute_loss(data_sample)
 
         # In the case of PrioritizedReplayBuffer, the priority is updated
         # before the total loss is calculated
         if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
-            self.replay_buffer.update_priority(samples['indexes'], elementwise_loss)
+            self.memory.update_priority(samples['indexes'], elementwise_loss)
 
         loss = self.loss_process(elementwise_loss, samples['weights'])
 
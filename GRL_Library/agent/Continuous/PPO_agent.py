@@ -7,6 +7,8 @@ import numpy as np
 import torch.autograd as autograd
 import torch.nn.functional as F
 import collections
+from GRL_Library.common.replay_buffer import to_numpy, is_sparse_observation, stack_observations
+from GRL_Library.common.inference import InferenceModel
 
 # CUDA configuration
 USE_CUDA = torch.cuda.is_available()
@@ -16,41 +18,90 @@ USE_CUDA = torch.cuda.is_available()
 
 class PPOMemory(object):
     """
-        Define PPOMemory class as replay buffer
+        Define PPOMemory class as replay buffer. The rollout is stored column-wise: every
+        observation component, the actions, probabilities, values, rewards and dones
+        have their own preallocated numpy array, so a minibatch is gathered with one
+        fancy-indexed read per column. Sparse graph observations have a variable
+        size, they are kept as tuples in an object column.
 
         Parameter description:
         --------
-        state: current state
+        batch_size: sample size
+        capacity: the expected length of a rollout (the columns grow if it is exceeded)
     """
 
-    def __init__(self, batch_size):
-        self.states = []
-        self.probs = []  # Action probability
-        self.vals = []  # Value
-        self.actions = []
-        self.rewards = []
-        self.dones = []
+    def __init__(self, batch_size, capacity=1024):
+        self.columns = None
+        self.obs_is_tuple = False
+        self.obs_is_sparse = False
+        self.obs_length = 0
+        self.length = 0  # Current length of the rollout
 
         self.batch_size = batch_size
+        self.capacity = capacity
 
-    def generate_batch(self):
+    def _allocate(self, data):
+        """
+           <column allocation function>
+           Allocate the columns according to the first stored step, floating point
+           data is stored as float32
+        """
+        self.columns = {}
+        for key, elem in data.items():
+            if isinstance(elem, tuple):  # sparse observation
+                self.columns[key] = np.empty(self.capacity, dtype=object)
+                continue
+            dtype = np.float32 if np.issubdtype(elem.dtype, np.floating) else elem.dtype
+            self.columns[key] = np.zeros((self.capacity,) + elem.shape, dtype=dtype)
+
+    def _grow(self):
+        """
+           <column expansion function>
+           Double the capacity of the columns when the rollout is longer than expected
+        """
+        for key, column in self.columns.items():
+            self.columns[key] = np.concatenate((column, np.zeros_like(column)))
+        self.capacity *= 2
+
+    def sample_batches(self):
         """
            <batch sampling function>
-           Used to implement empirical sampling of PPOMemory
+           Shuffle the stored steps and split their indexes into minibatches
         """
-        n_states = len(self.states)
+        n_states = self.length
         batch_start = np.arange(0, n_states, self.batch_size)
         indices = np.arange(n_states, dtype=np.int64)
         np.random.shuffle(indices)
         batches = [indices[i:i + self.batch_size] for i in batch_start]
 
-        return self.states, \
-               self.actions, \
-               self.probs, \
-               self.vals, \
-               np.asarray(self.rewards), \
-               np.asarray(self.dones), \
-               batches
+        return batches
+
+    def get_states(self, indexes):
+        """
+           <state gathering function>
+           Gather the states of the given steps, the observation tuple
+           (X_in, A_in_Dense, RL_indice) is rebuilt with stacked arrays
+        """
+        if self.obs_is_sparse:
+            return stack_observations(list(self.columns['state_0'][indexes]))
+        states = tuple(self.columns['state_' + str(i)][indexes] for i in range(self.obs_length))
+        return states if self.obs_is_tuple else states[0]
+
+    def generate_batch(self):
+        """
+           <batch sampling function>
+           Used to implement empirical sampling of PPOMemory, the stored columns are
+           returned together with the shuffled minibatch indexes
+        """
+        length = self.length
+
+        return self.get_states(slice(0, length)), \
+               self.columns['action'][:length], \
+               self.columns['probs'][:length], \
+               self.columns['vals'][:length], \
+               self.columns['reward'][:length], \
+               self.columns['done'][:length], \
+               self.sample_batches()
 
     def store_memory(self, state, action, probs, vals, reward, done):
         """
@@ -66,24 +117,37 @@ class PPOMemory(object):
            reward: the reward for performing the action
            done: whether the current round is completed or not
         """
-        self.states.append(state)
-        self.actions.append(action)
-        self.probs.append(probs)
-        self.vals.append(vals)
-        self.rewards.append(reward)
-        self.dones.append(done)
+        self.obs_is_tuple = isinstance(state, (tuple, list))
+        self.obs_is_sparse = is_sparse_observation(state)
+        states = state if self.obs_is_tuple else [state]
+        self.obs_length = len(states)
+
+        if self.obs_is_sparse:
+            data = {'state_0': tuple(to_numpy(elem) for elem in states)}
+        else:
+            data = {'state_' + str(i): to_numpy(elem) for i, elem in enumerate(states)}
+        data['action'] = to_numpy(action)
+        data['probs'] = to_numpy(probs)
+        data['vals'] = to_numpy(vals)
+        data['reward'] = np.asarray(reward, dtype=np.float32)
+        data['done'] = np.asarray(done, dtype=np.float32)
+
+        if self.columns is None:
+            self._allocate(data)
+        elif self.length == self.capacity:
+            self._grow()
+
+        for key, elem in data.items():
+            self.columns[key][self.length] = elem
+        self.length += 1
 
     def clear_memory(self):
         """
            <data clear function>
-           Used to clear the interaction data already stored and free memory
+           Used to clear the interaction data already stored, the columns are kept
+           and overwritten by the next rollout
         """
-        self.states = []
-        self.probs = []
-        self.actions = []
-        self.rewards = []
-        self.dones = []
-        self.vals = []
+        self.length = 0
 
 
 class PPO(object):
@@ -134,7 +198,11 @@ class PPO(object):
             self.device = "cpu"
 
         # Replay buffer
-        self.memory = PPOMemory(self.batch_size)
+        self.memory = PPOMemory(self.batch_size, self.update_interval)
+
+        # Inference path for action selection (the actor returns a distribution,
+        # so the models are not traced)
+        self.inference_model = InferenceModel()
 
         # Record loss
         self.loss_record = collections.deque(maxlen=100)
@@ -164,8 +232,8 @@ class PPO(object):
           --------
           observation: the environment observation of the smart body
         """
-        action, probs, _ = self.actor_model(observation)
-        value = self.critic_model(observation)
+        action, probs, _ = self.inference_model(self.actor_model, observation)
+        value = self.inference_model(self.critic_model, observation)
 
         action = torch.squeeze(action)
         probs = torch.squeeze(probs)
@@ -173,81 +241,92 @@ class PPO(object):
 
         return action, probs, value
 
+    def compute_advantage(self, reward_arr, vals_arr, dones_arr):
+        """
+           <Advantage calculation function>
+           Calculate the GAE advantage of every step of the rollout with one reverse scan:
+           A_t = delta_t + gamma * GAE_lambda * (1 - done_t) * A_t+1,
+           delta_t = r_t + gamma * V_t+1 * (1 - done_t) - V_t.
+           The last step of the rollout has no successor and its advantage is 0.
+           The rollout of a VectorEnv holds the steps of its B environments, which are
+           scanned in parallel
+
+           Parameters:
+           --------
+           reward_arr: rewards of the rollout [T] ([T, B])
+           vals_arr: values of the rollout [T, N] ([T, B, N])
+           dones_arr: dones of the rollout [T] ([T, B])
+        """
+        values = vals_arr.reshape(reward_arr.shape + (-1,))
+        rewards = reward_arr[..., None]
+        dones = dones_arr[..., None]
+
+        # TD residuals of all the steps
+        deltas = rewards[:-1] + self.gamma * values[1:] * (1 - dones[:-1]) - values[:-1]
+
+        # Reverse scan, which stops at the end of each episode
+        advantage = np.zeros_like(values)
+        for t in reversed(range(len(deltas))):
+            advantage[t] = deltas[t] + self.gamma * self.GAE_lambda * \
+                (1 - dones[t]) * advantage[t + 1]
+
+        return advantage
+
     def learn(self):
         """
            <policy update function>
            Used to implement the agent's learning process
         """
+        state_arr, action_arr, old_prob_arr, vals_arr, \
+        reward_arr, dones_arr, batches = \
+            self.memory.generate_batch()
+
+        # ------Advantage and returns of the rollout------ #
+        # The values of the rollout do not change during training,
+        # so the advantage is calculated once for all the epochs
+        advantage = self.compute_advantage(reward_arr, vals_arr, dones_arr)
+        advantage = torch.as_tensor(advantage, dtype=torch.float32, device=self.device)
+        values = torch.as_tensor(vals_arr, dtype=torch.float32, device=self.device)
+        returns = advantage + values.reshape(advantage.shape)
+
+        actions = torch.as_tensor(action_arr, device=self.device)
+        old_probs = torch.as_tensor(old_prob_arr, dtype=torch.float32, device=self.device)
+
         # ------Training according to the specific value of n_epochs------ #
-        for _ in range(self.n_epochs):
-            state_arr, action_arr, old_prob_arr, vals_arr, \
-            reward_arr, dones_arr, batches = \
-                self.memory.generate_batch()
-
-            values = vals_arr
-
-            # ------Training for each epochs------ #
-            # advantage
-            advantage = torch.zeros(len(reward_arr), len(action_arr[1])).to(self.device)
-            for t in range(len(reward_arr) - 1):
-                discount = 1
-                a_t = 0
-                for k in range(t, len(reward_arr) - 1):
-                    a_t += discount * (reward_arr[k] + self.gamma * values[k + 1] *
-                                       (1 - int(dones_arr[k])) - values[k])
-                    discount *= self.gamma * self.GAE_lambda
-                advantage[t, :] = a_t
-            # advantage = torch.stack(advantage)
-
-            # values
-            values = torch.stack(values)
+        for epoch in range(self.n_epochs):
+            # The minibatches are reshuffled for every epoch
+            if epoch > 0:
+                batches = self.memory.sample_batches()
 
             # Training for the collected samples
             # Note: do loss.backward() in a loop, to avoid gradient compounding
             for batch in batches:
-                # Initialize the loss matrix
-                actor_loss_matrix = []
-                critic_loss_matrix = []
+                # The states of the batch are passed through the networks at once
+                states = self.memory.get_states(batch)
 
-                # Train for each index in the batch
                 # Calculate actor_loss and update the actor network
-                for i in batch:
-                    old_probs = old_prob_arr[i].detach()
-                    actions = action_arr[i].detach()
-
-                    _, _, dist = self.actor_model(state_arr[i])
-
-                    new_probs = dist.log_prob(actions)
-                    prob_ratio = new_probs.exp() / old_probs.exp()
-                    weighted_probs = advantage[i].detach() * prob_ratio  # PPO1
-                    # ------PPO2------#
-                    weighted_clipped_probs = torch.clamp(prob_ratio, 1 - self.policy_clip,
-                                                     1 + self.policy_clip) * advantage[i].detach()
-                    # ----------------#
-                    actor_loss = -torch.min(weighted_probs, weighted_clipped_probs).mean()
-
-                    actor_loss_matrix.append(actor_loss)
-
-                actor_loss_matrix = torch.stack(actor_loss_matrix)
-                actor_loss_mean = torch.mean(actor_loss_matrix)
+                _, _, dist = self.actor_model(states)
+
+                # The actions are reshaped to the shape of the distribution (BxNxA)
+                new_probs = dist.log_prob(actions[batch].reshape(dist.batch_shape))
+                new_probs = new_probs.reshape(old_probs[batch].shape)
+                prob_ratio = new_probs.exp() / old_probs[batch].exp()
+                weighted_probs = advantage[batch] * prob_ratio  # PPO1
+                # ------PPO2------#
+                weighted_clipped_probs = torch.clamp(prob_ratio, 1 - self.policy_clip,
+                                                 1 + self.policy_clip) * advantage[batch]
+                # ----------------#
+                actor_loss_mean = -torch.min(weighted_probs, weighted_clipped_probs).mean()
 
                 self.actor_model.optimizer.zero_grad()
                 actor_loss_mean.backward()
                 self.actor_model.optimizer.step()
 
                 # Calculate critic_loss and update the critic network
-                for i in batch:
-                    critic_value = self.critic_model(state_arr[i])
-                    critic_value = torch.squeeze(critic_value)
-
-                    returns = advantage[i] + values[i]
-                    returns = returns.detach()
-                    critic_loss = F.smooth_l1_loss(returns, critic_value)
-
-                    critic_loss_matrix.append(critic_loss)
+                critic_value = self.critic_model(states)
+                critic_value = torch.squeeze(critic_value, -1)
 
-                critic_loss_matrix = torch.stack(critic_loss_matrix)
-                critic_loss_mean = 0.5 * torch.mean(critic_loss_matrix)
+                critic_loss_mean = 0.5 * F.smooth_l1_loss(returns[batch], critic_value)
 
                 self.critic_model.optimizer.zero_grad()
                 critic_loss_mean.backward()
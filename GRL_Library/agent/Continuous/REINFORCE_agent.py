@@ -91,13 +91,11 @@ class REINFORCE(object):
         self.optimizer.zero_grad()
 
         # ------Reward calculation------#
+        # Discounted returns G_t = r_t + gamma * G_t+1, accumulated in reverse order
         G = np.zeros_like(self.reward_memory, dtype=np.float64)
-        for t in range(len(self.reward_memory)):
-            G_sum = 0
-            discount = 1
-            for k in range(t, len(self.reward_memory)):
-                G_sum += self.reward_memory[k] * discount
-                discount *= self.gamma
+        G_sum = 0
+        for t in reversed(range(len(self.reward_memory))):
+            G_sum = self.reward_memory[t] + self.gamma * G_sum
             G[t] = G_sum
         mean = np.mean(G)
         std = np.std(G) if np.std(G) > 0 else 1
@@ -106,10 +104,10 @@ class REINFORCE(object):
         G = torch.tensor(G, dtype=torch.float).to(self.device)
 
         # ------Loss calculation------#
-        loss = []
-        for g, logprob in zip(G, self.action_memory):
-            loss.append(torch.mean(-logprob * g))
-        loss = torch.stack(loss).sum()
+        # The log-probabilities of the episode are stacked into a [T, ...] tensor,
+        # the loss of each step is averaged over the vehicles and summed over the steps
+        log_probs = torch.stack(self.action_memory).reshape(len(self.action_memory), -1)
+        loss = torch.sum(torch.mean(-log_probs, dim=1) * G)
         # loss = torch.abs(loss)
         self.loss_record.append(float(loss.detach().cpu().numpy()))
 
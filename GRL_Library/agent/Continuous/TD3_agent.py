@@ -9,6 +9,10 @@ import torch.nn.functional as F
 import collections
 import copy
 from GRL_Library.common.prioritized_replay_buffer import PrioritizedReplayBuffer
+from GRL_Library.common.replay_buffer import collate_transitions
+from GRL_Library.common.n_step_writer import NStepWriter
+from GRL_Library.common.inference import InferenceModel
+from GRL_Library.common.prefetcher import BatchPrefetcher
 
 # CUDA configuration
 USE_CUDA = torch.cuda.is_available()
@@ -39,6 +43,8 @@ class TD3(object):
         n_steps: Time Difference update step length
         (integer, 1 for single-step update, the rest for Multi-step learning)
         gamma: discount factor
+        trace_model: whether to select actions with a traced TorchScript copy of the actor model
+        prefetch: whether to prepare the next minibatch on a background thread (see BatchPrefetcher)
     """
 
     def __init__(self,
@@ -58,7 +64,9 @@ class TD3(object):
                  soft_update_tau,
                  n_steps,
                  gamma,
-                 model_name):
+                 model_name,
+                 trace_model=False,
+                 prefetch=False):
 
         self.actor_model = actor_model
         self.actor_optimizer = actor_optimizer
@@ -76,6 +84,8 @@ class TD3(object):
         self.target_update_interval = target_update_interval
         self.soft_update_tau = soft_update_tau
         self.n_steps = n_steps
+        # The n-step returns are calculated when the transitions are stored
+        self.n_step_writer = NStepWriter(n_steps, gamma) if n_steps > 1 else None
         self.gamma = gamma
         self.model_name = model_name
 
@@ -93,6 +103,15 @@ class TD3(object):
 
         self.time_counter = 0
 
+        # Inference path for action selection
+        self.inference_model = InferenceModel(trace=trace_model)
+
+        # Background minibatch preparation, the transitions and the priorities then
+        # go through the prefetcher, which guards the replay_buffer
+        self.prefetcher = BatchPrefetcher(replay_buffer, batch_size, self.batch_memory, self.device) \
+            if prefetch else None
+        self.memory = replay_buffer if self.prefetcher is None else self.prefetcher
+
         self.loss_record = collections.deque(maxlen=100)
 
     def store_transition(self, state, action, reward, next_state, done):
@@ -109,15 +128,21 @@ class TD3(object):
            done: whether to terminate or not
         """
         # Call the function that holds the data in the replay_buffer
-        self.replay_buffer.add(state, action, reward, next_state, done)
+        if self.n_step_writer is None:
+            self.memory.add(state, action, reward, next_state, done)
+        else:
+            for transition in self.n_step_writer.add(state, action, reward, next_state, done):
+                self.memory.add(*transition)
 
     def sample_memory(self):
         """
            <Experience sampling function>
            Used to sample empirical data from the agent learning process
         """
-        # Call the sampling function in replay_buffer
-        data_sample = self.replay_buffer.sample(self.batch_size, self.n_steps)
+        # Take the prefetched minibatch, or call the sampling function in replay_buffer
+        if self.prefetcher is not None:
+            return self.prefetcher.get()
+        data_sample = self.replay_buffer.sample(self.batch_size)
         return data_sample
 
     def choose_action(self, observation):
@@ -136,7 +161,7 @@ class TD3(object):
                                             self.actor_model.num_outputs))
             action = torch.as_tensor(action, dtype=torch.float32).to(self.device)
         else:
-            action = self.actor_model(observation)
+            action = self.inference_model(self.actor_model, observation)
             noise = torch.as_tensor(np.random.normal(scale=self.explore_noise)).to(self.device)
             action = action + noise
 
@@ -153,7 +178,7 @@ class TD3(object):
            observation: observation of the environment in which the intelligence is located
         """
         # Generate action
-        action = self.actor_model(observation)
+        action = self.inference_model(self.actor_model, observation)
 
         return action
 
@@ -174,32 +199,50 @@ class TD3(object):
 
         return loss
 
-    def learn_onestep(self, info_batch, data_batch):
+    def batch_memory(self, data_batch):
         """
-           <loss calculation function>
-           Used to calculate the loss of the predicted and target values,
-           as a basis for the subsequent backpropagation derivation.
+           <Batch stacking function>
+           The columnar replay_buffer returns already stacked batch arrays, the list-based
+           replay_buffers return a list of transitions, which is stacked here so that
+           each network runs only once on the whole batch. The discount of the
+           one-step transitions is gamma, the n-step transitions hold their own
 
-           Parameter description:
+           Parameters:
            --------
-           info_batch: the index and weight information of the sampled samples
            data_batch: the data sampled from the experience pool for training
         """
-        # Initialize the loss matrix
-        actor_loss = []
-        critic_loss_1 = []
-        critic_loss_2 = []
+        if isinstance(data_batch, list):
+            data_batch = collate_transitions(data_batch)
+        if len(data_batch) == 5:
+            data_batch = tuple(data_batch) + (self.gamma,)
+        return data_batch
 
-        # Extract data from each sample in the order in which it is stored
-        # ------loss of critic network------ #
-        for elem in data_batch:
-            state, action, reward, next_state, done = elem
-            action = torch.as_tensor(action, dtype=torch.float32).to(self.device)
+    def learn_batch(self, info_batch, state, action, reward, next_state, done, discount):
+        """
+           <Batch update function>
+           Update the critic networks and (delayed) the actor network on the stacked batch
+
+           Parameters:
+           --------
+           info_batch: the index and weight information of the sampled samples
+           state: the batch of states (BxNxF, BxNxN, BxN)
+           action: the batch of actions (BxNxA)
+           reward: the (discounted n-step) rewards (B)
+           next_state: the batch of next states
+           done: whether to terminate (B)
+           discount: the discount factor of the target value (B, or a scalar)
+        """
+        action = torch.as_tensor(action, dtype=torch.float32, device=self.device)
+        reward = torch.as_tensor(reward, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        done = torch.as_tensor(done, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        discount = torch.as_tensor(discount, dtype=torch.float32, device=self.device).view(-1, 1, 1)
 
-            # target value
+        # ------loss of critic network------ #
+        # target value, target policy smoothing noise is drawn for every element
+        with torch.no_grad():
             action_target = self.actor_model_target(next_state)
             action_target = action_target + \
-                            torch.clamp(torch.as_tensor(np.random.normal(scale=0.2)), -0.5, 0.5)
+                torch.clamp(torch.randn_like(action_target) * 0.2, -0.5, 0.5)
             action_target = torch.clamp(action_target,
                                         self.actor_model.action_min,
                                         self.actor_model.action_max)
@@ -207,29 +250,24 @@ class TD3(object):
             # target critic_value
             q1_next = self.critic_model_target_1(next_state, action_target)
             q2_next = self.critic_model_target_2(next_state, action_target)
-            q1 = self.critic_model_1(state, action)
-            q1 = q1.detach()
-            q2 = self.critic_model_2(state, action)
-            q2 = q2.detach()
             critic_value_next = torch.min(q1_next, q2_next)
 
-            critic_target = reward + self.gamma * critic_value_next * (1 - done)
+            critic_target = reward + discount * critic_value_next * (1 - done)
 
-            # loss calculation
-            q1_loss = F.smooth_l1_loss(critic_target, q1)
-            q2_loss = F.smooth_l1_loss(critic_target, q2)
-            critic_loss_1.append(q1_loss)
-            critic_loss_2.append(q2_loss)
+        q1 = self.critic_model_1(state, action)
+        q2 = self.critic_model_2(state, action)
+
+        # loss calculation, the loss of each sample is averaged over the vehicles
+        critic_loss_e_1 = F.smooth_l1_loss(q1, critic_target, reduction='none').mean(dim=(1, 2))
+        critic_loss_e_2 = F.smooth_l1_loss(q2, critic_target, reduction='none').mean(dim=(1, 2))
 
         # critic network update
-        critic_loss_e_1 = torch.stack(critic_loss_1)
-        critic_loss_e_2 = torch.stack(critic_loss_2)
         critic_loss_total_1 = self.loss_process(critic_loss_e_1, info_batch['weights'])
         critic_loss_total_2 = self.loss_process(critic_loss_e_2, info_batch['weights'])
 
         self.critic_optimizer_1.zero_grad()
         self.critic_optimizer_2.zero_grad()
-        (critic_loss_total_1 + critic_loss_total_2).backward(retain_graph=True)
+        (critic_loss_total_1 + critic_loss_total_2).backward()
         self.critic_optimizer_1.step()
         self.critic_optimizer_2.step()
 
@@ -237,136 +275,40 @@ class TD3(object):
         if self.time_counter % self.update_interval_actor != 0:
             return
         # ------loss of actor network------ #
-        for elem in data_batch:
-            state, action, reward, next_state, done = elem
-
-            mu = self.actor_model(state)
-            actor_loss_sample = -1 * self.critic_model_1(state, mu)
-            actor_loss_s = actor_loss_sample.mean()
-            actor_loss.append(actor_loss_s)
+        mu = self.actor_model(state)
+        actor_loss_e = (-1 * self.critic_model_1(state, mu)).mean(dim=(1, 2))
 
         # actor network update
-        actor_loss_e = torch.stack(actor_loss)
         actor_loss_total = self.loss_process(actor_loss_e, info_batch['weights'])
         self.actor_optimizer.zero_grad()
-        actor_loss_total.backward(retain_graph=True)
+        actor_loss_total.backward()
         self.actor_optimizer.step()
 
         # ------Updating PRE weights------ #
         if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
-            self.replay_buffer.update_priority(info_batch['indexes'], (critic_loss_e_1
-                                                                       + critic_loss_e_2
-                                                                       + actor_loss_e))
+            self.memory.update_priority(info_batch['indexes'], (critic_loss_e_1
+                                                                 + critic_loss_e_2
+                                                                 + actor_loss_e))
 
         # ------Record loss------ #
         self.loss_record.append(float((critic_loss_total_1 +
                                        critic_loss_total_2 +
                                        actor_loss_total).detach().cpu().numpy()))
 
-    def learn_multisteps(self, info_batch, data_batch):
+    def learn_onestep(self, info_batch, data_batch):
         """
-           <Multi-step learning loss calculation function>
+           <loss calculation function>
            Used to calculate the loss of the predicted and target values,
            as a basis for the subsequent backpropagation derivation.
 
-           Parameters:
+           Parameter description:
            --------
-           info_batch: index and weight information of the sampled samples
+           info_batch: the index and weight information of the sampled samples
            data_batch: the data sampled from the experience pool for training
         """
-        # Initialize the loss matrix
-        actor_loss = []
-        critic_loss_1 = []
-        critic_loss_2 = []
-
-        # Extract data from each sample in the order in which it is stored
-        # ------ calculates the loss of the critic network ------ #
-        for elem in data_batch:
-            # Take the smaller of n_steps and elem lengths to prevent
-            # n-step sequential sampling out of index
-            n_steps = min(self.n_steps, len(elem))
-
-            # Take the sample data required for the calculation of the current and target values
-            state, action, reward, next_state, done = elem[0]
-            action = torch.as_tensor(action, dtype=torch.float32).to(self.device)
-            state_, action_, reward_, next_state_, done_ = elem[n_steps - 1]
-
-            # ------ Calculate the reward ------ #
-            # Reward value
-            reward = [i[2] for i in elem]
-            # Discount factor
-            n_step_scaling = [self.gamma ** i for i in range(n_steps)]
-            # Calculate the reward matrix by multiplying the reward value with
-            # the corresponding factor of the discount factor
-            R = np.multiply(reward, n_step_scaling)
-            # Sum
-            R = np.sum(R)
-
-            # Target value
-            action_target = self.actor_model_target(next_state_)
-            action_target = action_target + \
-                            torch.clamp(torch.as_tensor(np.random.normal(scale=0.2)), -0.5, 0.5)
-            action_target = torch.clamp(action_target,
-                                        self.actor_model.action_min,
-                                        self.actor_model.action_max)
-
-            # Target critic_value
-            q1_next = self.critic_model_target_1(next_state_, action_target)
-            q2_next = self.critic_model_target_2(next_state_, action_target)
-            q1 = self.critic_model_1(state, action)
-            q1 = q1.detach()
-            q2 = self.critic_model_2(state, action)
-            q2 = q2.detach()
-            critic_value_next = torch.min(q1_next, q2_next)
-
-            critic_target = R + self.gamma * critic_value_next * (1 - done)
-
-            # loss calculation
-            q1_loss = F.smooth_l1_loss(critic_target, q1)
-            q2_loss = F.smooth_l1_loss(critic_target, q2)
-            critic_loss_1.append(q1_loss)
-            critic_loss_2.append(q2_loss)
-
-        # critic network update
-        critic_loss_e_1 = torch.stack(critic_loss_1)
-        critic_loss_e_2 = torch.stack(critic_loss_2)
-        critic_loss_total_1 = self.loss_process(critic_loss_e_1, info_batch['weights'])
-        critic_loss_total_2 = self.loss_process(critic_loss_e_2, info_batch['weights'])
-
-        self.critic_optimizer_1.zero_grad()
-        self.critic_optimizer_2.zero_grad()
-        (critic_loss_total_1 + critic_loss_total_2).backward(retain_graph=True)
-        self.critic_optimizer_1.step()
-        self.critic_optimizer_2.step()
-
-        # ------loss of actor network------ #
-        for elem in data_batch:
-            # Take the sample data needed to calculate the current and target values
-            state, action, reward, next_state, done = elem[0]
-            action = torch.as_tensor(action, dtype=torch.float32).to(self.device)
-
-            mu = self.actor_model(state)
-            actor_loss_sample = -1 * self.critic_model_1(state, mu)
-            actor_loss_s = actor_loss_sample.mean()
-            actor_loss.append(actor_loss_s)
-
-        # actor network update
-        actor_loss_e = torch.stack(actor_loss)
-        actor_loss_total = self.loss_process(actor_loss_e, info_batch['weights'])
-        self.actor_optimizer.zero_grad()
-        actor_loss_total.backward(retain_graph=True)
-        self.actor_optimizer.step()
+        state, action, reward, next_state, done, discount = self.batch_memory(data_batch)
 
-        # ------Updating PRE weights------ #
-        if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
-            self.replay_buffer.update_priority(info_batch['indexes'], (critic_loss_e_1
-                                                                       + critic_loss_e_2
-                                                                       + actor_loss_e))
-
-        # ------Record loss------ #
-        self.loss_record.append(float((critic_loss_total_1 +
-                                       critic_loss_total_2 +
-                                       actor_loss_total).detach().cpu().numpy()))
+        self.learn_batch(info_batch, state, action, reward, next_state, done, discount)
 
     def synchronize_target(self):
         """
@@ -408,11 +350,8 @@ class TD3(object):
         # data_sample is the specific sampled data
         samples, data_sample = self.sample_memory()
 
-        # loss matrix
-        if self.n_steps == 1:  # single-step learning
-            self.learn_onestep(samples, data_sample)
-        else:  # multi-step learning
-            self.learn_multisteps(samples, data_sample)
+        # loss matrix, the multi-step transitions already hold their n-step return
+        self.learn_onestep(samples, data_sample)
 
         # ------target network update------ #
         if self.time_counter % self.target_update_interval == 0:
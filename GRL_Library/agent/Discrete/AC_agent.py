@@ -78,7 +78,7 @@ class AC(object):
 
            Parameters:
            --------
-           state: current state
+           state: current state (or the stacked observations of a VectorEnv)
            reward: the reward after the action is performed
            next_state: the state after the action has been performed
            done: whether the current turn is complete or not
@@ -93,13 +93,17 @@ class AC(object):
         # ------TD_error------#
         # Reward calculation
         reward = torch.as_tensor(reward, dtype=torch.float32).to(self.device)
+        done = torch.as_tensor(done, dtype=torch.float32).to(self.device)
+        # The rewards and dones of stacked observations (B) are broadcast over the agents
+        reward = reward.reshape(reward.shape + (1,) * (critic_value.dim() - reward.dim()))
+        done = done.reshape(reward.shape)
         # TD_target calculation
         y_t = reward + self.gamma * next_critic_value * (1 - done)
 
         # ------loss calculation------#
         # loss of actor network
         self.log_probs = torch.as_tensor(self.log_probs, dtype=torch.float32).to(self.device)
-        self.log_probs = torch.reshape(self.log_probs, (len(y_t), 1))
+        self.log_probs = torch.reshape(self.log_probs, critic_value.shape)
         actor_loss = -1 * torch.mul(self.log_probs, critic_value)
         actor_loss = torch.mean(actor_loss)
         # loss of critic network
@@ -9,6 +9,10 @@ import torch.nn.functional as F
 import copy
 import collections
 from GRL_Library.common.prioritized_replay_buffer import PrioritizedReplayBuffer
+from GRL_Library.common.replay_buffer import collate_transitions, to_numpy
+from GRL_Library.common.n_step_writer import NStepWriter
+from GRL_Library.common.inference import InferenceModel
+from GRL_Library.common.prefetcher import BatchPrefetcher
 
 # CUDA configuration
 USE_CUDA = torch.cuda.is_available()
@@ -34,8 +38,11 @@ class DQN(object):
         target_update_method: target network update method (hard or soft)
         soft_update_tau: target network soft update parameter
         n_steps: Time Difference update step length
-        (integer, 1 for single-step update, the rest for Multi-step learning)
+        (integer, 1 for single-step update, the rest for Multi-step learning, whose
+        n-step transitions are written into the replay_buffer by a NStepWriter)
         model_name: model name (used to save and read)
+        trace_model: whether to select actions with a traced TorchScript copy of the model
+        prefetch: whether to prepare the next minibatch on a background thread (see BatchPrefetcher)
     """
 
     def __init__(self,
@@ -51,7 +58,9 @@ class DQN(object):
                  target_update_method,
                  soft_update_tau,
                  n_steps,
-                 model_name):
+                 model_name,
+                 trace_model=False,
+                 prefetch=False):
 
         self.model = model
         self.optimizer = optimizer
@@ -67,6 +76,9 @@ class DQN(object):
         self.n_steps = n_steps
         self.model_name = model_name
 
+        # The n-step returns are calculated when the transitions are stored
+        self.n_step_writer = NStepWriter(n_steps, gamma) if n_steps > 1 else None
+
         # GPU configuration
         if USE_CUDA:
             GPU_num = torch.cuda.current_device()
@@ -77,6 +89,15 @@ class DQN(object):
         # Target model
         self.target_model = copy.deepcopy(model)
 
+        # Inference path for action selection
+        self.inference_model = InferenceModel(trace=trace_model)
+
+        # Background minibatch preparation, the transitions and the priorities then
+        # go through the prefetcher, which guards the replay_buffer
+        self.prefetcher = BatchPrefetcher(replay_buffer, batch_size, self.batch_memory, self.device) \
+            if prefetch else None
+        self.memory = replay_buffer if self.prefetcher is None else self.prefetcher
+
         # Set the current emulation step counter
         self.time_counter = 0
 
@@ -98,15 +119,21 @@ class DQN(object):
            done: whether to terminate
         """
         # Call the function that holds the data in replay_buffer
-        self.replay_buffer.add(state, action, reward, next_state, done)
+        if self.n_step_writer is None:
+            self.memory.add(state, action, reward, next_state, done)
+        else:
+            for transition in self.n_step_writer.add(state, action, reward, next_state, done):
+                self.memory.add(*transition)
 
     def sample_memory(self):
         """
            <Empirical sampling function>
            Used to sample empirical data from the agent learning process
         """
-        # Call the sampling function in replay_buffer
-        data_sample = self.replay_buffer.sample(self.batch_size, self.n_steps)
+        # Take the prefetched minibatch, or call the sampling function in replay_buffer
+        if self.prefetcher is not None:
+            return self.prefetcher.get()
+        data_sample = self.replay_buffer.sample(self.batch_size)
         return data_sample
 
     def choose_action(self, observation):
@@ -117,10 +144,14 @@ class DQN(object):
            Parameter description:
            --------
            observation: observation of the environment in which the smart body is located
+           (or the stacked observations of a VectorEnv, BxNxF, BxNxN, BxN)
         """
         # Actions generation
-        action = self.model(observation)
-        action = torch.argmax(action, dim=1)  # greedy action
+        action = self.inference_model(self.model, observation)
+        action = torch.argmax(action, dim=-1)  # greedy action
+        if action.dim() > 1:
+            # Stacked observations, every environment explores on its own
+            return np.stack([to_numpy(self.explorer.generate_action(elem)) for elem in action])
         action = self.explorer.generate_action(action)
         return action
 
@@ -134,127 +165,93 @@ class DQN(object):
            observation: observation of the environment in which the smart body is located
         """
         # Action generation
-        action = self.model(observation)
-        action = torch.argmax(action, dim=1)
+        action = self.inference_model(self.model, observation)
+        action = torch.argmax(action, dim=-1)
         return action
 
-    def compute_loss(self, data_batch):
+    def batch_memory(self, data_batch):
         """
-           <Loss calculation function>
-           It is used to calculate the loss of predicted and target values, and make the basis for the subsequent back propagation derivation
+           <Batch stacking function>
+           The columnar replay_buffer returns already stacked batch arrays, the list-based
+           replay_buffers return a list of transitions, which is stacked here so that
+           the loss is always calculated on the whole batch at once. The discount of
+           the one-step transitions is gamma, the n-step transitions hold their own
 
            Parameters:
            --------
            data_batch: The data sampled from the experience pool for training
         """
-        # Loss matrix
-        loss = []
-        # TD_error matrix
-        TD_error = []
-
-        # Extract data from each sample in order of data storage
-        for elem in data_batch:
-            state, action, reward, next_state, done = elem
-            action = torch.as_tensor(action, dtype=torch.long, device=self.device)
-
-            # Predicted value
-            q_predict = self.model(state)
-            q_predict = q_predict.gather(1, action.unsqueeze(1)).squeeze(1)
-
-            q_predict_save = q_predict.detach().cpu().numpy().reshape(len(q_predict), 1)
-            data_useful = np.any(q_predict_save, axis=1)
-            self.q_record.append(q_predict_save / (data_useful.sum() + 1))
-
-            # Target value
-            q_next = self.target_model(next_state)
-            q_next = q_next.max(dim=1)[0]
-            q_target = reward + self.gamma * q_next * (1 - done)
-
-            # TD_error
-            TD_error_sample = torch.abs(q_target - q_predict)
-            TD_error_sample = torch.mean(TD_error_sample)
-            # Count the TD_error of the current sample in the total TD_error
-            TD_error.append(TD_error_sample)
-
-            # Loss calculation
-            loss_sample = F.smooth_l1_loss(q_predict, q_target)
-            # Add the loss of the current sample to the total loss
-            loss.append(loss_sample)
-
-        # Further processing of TD_error
-        TD_error = torch.stack(TD_error)
-
-        # Combine the loses of different samples in a sample into a tensor
-        loss = torch.stack(loss)
+        if isinstance(data_batch, list):
+            data_batch = collate_transitions(data_batch)
+        if len(data_batch) == 5:
+            data_batch = tuple(data_batch) + (self.gamma,)
+        return data_batch
+
+    def compute_q_next(self, next_state):
+        """
+           <Target value calculation function>
+           Calculate the maximum q value of the target network in state S+1
+
+           Parameters:
+           --------
+           next_state: the batch of next states
+        """
+        q_next = self.target_model(next_state)
+        q_next = q_next.max(dim=-1)[0]
+        return q_next
+
+    def compute_batch_loss(self, state, action, reward, next_state, done, discount):
+        """
+           <Batch loss calculation function>
+           The sampled graphs are passed through the current and the target network in a
+           single forward pass each, and the loss of every sample is calculated at once
+
+           Parameters:
+           --------
+           state: the batch of states (BxNxF, BxNxN, BxN)
+           action: the batch of actions (BxN)
+           reward: the (discounted n-step) rewards (B)
+           next_state: the batch of next states
+           done: whether to terminate (B)
+           discount: the discount factor of the target value (B, or a scalar)
+        """
+        action = torch.as_tensor(action, dtype=torch.long, device=self.device)
+        reward = torch.as_tensor(reward, dtype=torch.float32, device=self.device).unsqueeze(1)
+        done = torch.as_tensor(done, dtype=torch.float32, device=self.device).unsqueeze(1)
+        discount = torch.as_tensor(discount, dtype=torch.float32, device=self.device).view(-1, 1)
+
+        # Predicted value
+        q_predict = self.model(state)
+        q_predict = q_predict.gather(2, action.unsqueeze(2)).squeeze(2)
+
+        # Save q_predict
+        q_predict_save = q_predict.detach().cpu().numpy()[:, :, None]
+        data_useful = np.any(q_predict_save, axis=2)
+        self.q_record.extend(q_predict_save / (data_useful.sum(axis=1) + 1)[:, None, None])
+
+        # Target value
+        with torch.no_grad():
+            q_next = self.compute_q_next(next_state)
+        q_target = reward + discount * q_next * (1 - done)
+
+        # Loss calculation, the loss of each sample is averaged over the vehicles
+        loss = F.smooth_l1_loss(q_predict, q_target, reduction='none')
+        loss = loss.mean(dim=1)
 
         return loss
 
-    def compute_loss_multisteps(self, data_batch, n_steps):
+    def compute_loss(self, data_batch):
         """
-           <Multi-step learning loss calculation function>
-           Used to calculate the loss of the predicted and target values,
-           as a basis for the subsequent backpropagation derivation
+           <Loss calculation function>
+           It is used to calculate the loss of predicted and target values, and make the basis for the subsequent back propagation derivation
 
            Parameters:
            --------
-           data_batch: the data sampled from the experience pool for training
-           n_steps: multi-step learning interval
+           data_batch: The data sampled from the experience pool for training
         """
-        loss = []
-        TD_error = []
-
-        # Data is extracted from each sample in the order in which it is stored
-        # For multi-step learning, each data_batch contains a number of consecutive samples
-        for elem in data_batch:
-            # Take the smaller of n_steps and elem lengths to prevent
-            # n-step sequential sampling out of index
-            n_steps = min(self.n_steps, len(elem))
-
-            # ------q_predict------ #
-            # The first sample
-            state, action, reward, next_state, done = elem[0]
-            action = torch.as_tensor(action, dtype=torch.long, device=self.device)
-            # predicted value
-            q_predict = self.model(state)
-            q_predict = q_predict.gather(1, action.unsqueeze(1)).squeeze(1)
-            # Save q_predict
-            q_predict_save = q_predict.detach().cpu().numpy().reshape(len(q_predict), 1)
-            data_useful = np.any(q_predict_save, axis=1)
-            self.q_record.append(q_predict_save / (data_useful.sum() + 1))
-
-            # ------Reward calculation------ #
-            # Reward value
-            reward = [i[2] for i in elem]
-            # Discount factor
-            n_step_scaling = [self.gamma ** i for i in range(n_steps)]
-            # Calculate the reward matrix by multiplying the reward value with the
-            # corresponding factor of the discount factor
-            R = np.multiply(reward, n_step_scaling)
-            # Sum
-            R = np.sum(R)
-
-            # ------q_target------ #
-            state, action, reward, next_state, done = elem[n_steps - 1]
-            # Calculate the value of n-step max_Q
-            q_next = self.target_model(next_state)
-            q_next = q_next.max(dim=1)[0]
-            # Target value
-            q_target = R + (self.gamma ** n_steps) * q_next * (1 - done)
-
-            # ------Calculate n-step TD_error------ #
-            TD_error_sample = torch.abs(q_target - q_predict)
-            TD_error_sample = torch.mean(TD_error_sample)
-            # Count the TD_error of the current sample in the total TD_error
-            TD_error.append(TD_error_sample)
-
-            # ------Calculate loss------ #
-            loss_sample = F.smooth_l1_loss(q_predict, q_target)
-
-            loss.append(loss_sample)
-
-        TD_error = torch.stack(TD_error)
-
-        loss = torch.stack(loss)
+        state, action, reward, next_state, done, discount = self.batch_memory(data_batch)
+
+        loss = self.compute_batch_loss(state, action, reward, next_state, done, discount)
 
         return loss
 
@@ -322,14 +319,12 @@ class DQN(object):
         # data_sample is the specific sampling data
         samples, data_sample = self.sample_memory()
 
-        if self.n_steps == 1:  # single-agent learning
-            elementwise_loss = self.compute_loss(data_sample)
-        else:  # multi-step learning
-            elementwise_loss = self.compute_loss_multisteps(data_sample, self.n_steps)
+        # The multi-step transitions already hold their n-step return
+        elementwise_loss = self.compute_loss(data_sample)
 
         # In the case of PrioritizedReplayBuffer, the priority is updated before the total loss is calculated
         if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
-            self.replay_buffer.update_priority(samples['indexes'], elementwise_loss)
+            self.memory.update_priority(samples['indexes'], elementwise_loss)
 
         # Total loss
         loss = self.loss_process(elementwise_loss, samples['weights'])
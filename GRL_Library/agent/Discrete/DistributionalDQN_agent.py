@@ -3,9 +3,7 @@
 """
 
 import torch
-import numpy as np
 import torch.autograd as autograd
-import torch.nn.functional as F
 import copy
 import collections
 import GRL_Library.agent.Discrete.DQN_agent as DQN
@@ -30,11 +28,12 @@ class DistributionalDQN(DQN.DQN):
 
     def __init__(self, model, optimizer, explorer, replay_buffer, gamma, batch_size, warmup_step,
                  update_interval, target_update_interval, target_update_method,
-                 soft_update_tau, n_steps, V_min, V_max, n_atoms, model_name):
+                 soft_update_tau, n_steps, V_min, V_max, n_atoms, model_name, trace_model=False,
+                 prefetch=False):
         super().__init__(model, optimizer, explorer, replay_buffer,
                          gamma, batch_size, warmup_step, update_interval,
                          target_update_interval, target_update_method,
-                         soft_update_tau, n_steps, model_name)
+                         soft_update_tau, n_steps, model_name, trace_model, prefetch)
         self.V_min = V_min
         self.V_max = V_max
         self.n_atoms = n_atoms
@@ -42,140 +41,97 @@ class DistributionalDQN(DQN.DQN):
         # Calculating the conditional distribution support
         self.support = torch.linspace(self.V_min, self.V_max, self.n_atoms).to(self.device)
 
-    def compute_loss(self, data_batch):
+    def compute_dist(self, state, next_state):
         """
-           <loss calculation function>
-           Used to calculate the loss of the predicted and target values, as a basis for the subsequent backpropagation derivation
+           <Distribution calculation function>
+           Calculate the predicted distribution of the current network in state S and the
+           distribution of the target network in state S+1 for the greedy action
 
            Parameters:
            --------
-           data_batch: The data sampled from the experience pool for training
+           state: the batch of states
+           next_state: the batch of next states
         """
-        # Initialize the loss matrix
-        loss = []
+        # Predicted distribution
+        dist = self.model.dist(state)
 
-        TD_error = []
-
-        # z_delta
-        delta_z = float(self.V_max - self.V_min) / (self.n_atoms - 1)
-
-        # Number of agents
-        num_agents = self.model.num_agents
-
-        # Index of agents
-        index_dist = [i for i in range(num_agents)]
-
-        for elem in data_batch:
-            state, action, reward, next_state, done = elem
-
-            next_action = self.target_model(next_state).argmax(1)
+        with torch.no_grad():
             next_dist = self.target_model.dist(next_state)
+            # The greedy action is obtained from the same distribution (q = sum(p * z))
+            next_action = torch.sum(next_dist * self.support, dim=-1).argmax(-1)
             # Get the specific value of the distribution based on the action
-            next_dist = next_dist[index_dist, next_action, :]
-
-            # Calculation of distribution-related parameters
-            t_z = reward + self.gamma * self.support * (1 - done)
-            t_z = t_z.clamp(min=self.V_min, max=self.V_max)
-            b = (t_z - self.V_min) / delta_z
-            l = b.floor().long()
-            u = b.ceil().long()
-
-            offset = (torch.linspace(0, (num_agents - 1) * self.n_atoms, num_agents).
-                      long().unsqueeze(1).expand(num_agents, self.n_atoms).to(self.device))
-
-            proj_dist = torch.zeros(next_dist.size(), device=self.device)
-            proj_dist.view(-1).index_add_ \
-                (0, (l + offset).view(-1), (next_dist * (u.float() - b)).view(-1))
-            proj_dist.view(-1).index_add_ \
-                (0, (u + offset).view(-1), (next_dist * (b - l.float())).view(-1))
-
-            # Predicted value
-            dist = self.model.dist(state)
-
-            # Calculating KL dispersion as loss
-            log_p = torch.log(dist[index_dist, action, :])
-            loss_sample = -(proj_dist * log_p).sum(1).mean()
+            next_dist = next_dist.gather(
+                2, next_action[:, :, None, None].expand(-1, -1, 1, self.n_atoms)).squeeze(2)
 
-            loss.append(loss_sample)
+        return dist, next_dist
 
-        loss = torch.stack(loss)
-
-        return loss
-
-    def compute_loss_multisteps(self, data_batch, n_steps):
+    def projection_distribution(self, next_dist, reward, done, discount):
         """
-           <Multi-step learning loss calculation function>
-           Used to calculate the loss of the predicted and target values, as a basis for the subsequent backpropagation derivation
+           <Distribution projection function>
+           Project the target distribution r + discount * z onto the support
+           [V_min, V_max] for all the samples and vehicles of the batch at once
 
            Parameters:
            --------
-           data_batch: the data sampled from the experience pool for training
-           n_steps: multi-step learning interval
+           next_dist: the distribution of the next state (B x N x n_atoms)
+           reward: the (discounted n-step) rewards (B)
+           done: whether to terminate (B)
+           discount: the discount factor of the target value (B, or a scalar)
         """
-        loss = []
-
-        TD_error = []
+        batch_size, num_agents = next_dist.shape[:2]
 
         # z_delta
         delta_z = float(self.V_max - self.V_min) / (self.n_atoms - 1)
 
-        # Number of agents
-        num_agents = self.model.num_agents
+        # Calculation of distribution-related parameters
+        reward = torch.as_tensor(reward, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        done = torch.as_tensor(done, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        discount = torch.as_tensor(discount, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        t_z = reward + discount * self.support * (1 - done)
+        t_z = t_z.clamp(min=self.V_min, max=self.V_max).expand(-1, num_agents, -1)
+        b = (t_z - self.V_min) / delta_z
+        l = b.floor().long()
+        u = b.ceil().long()
+
+        # Every (sample, vehicle) distribution occupies n_atoms consecutive elements
+        offset = (torch.arange(batch_size * num_agents, device=self.device) * self.n_atoms).\
+            view(batch_size, num_agents, 1)
+
+        proj_dist = torch.zeros(next_dist.size(), device=self.device)
+        proj_dist.view(-1).index_add_ \
+            (0, (l + offset).view(-1), (next_dist * (u.float() - b)).view(-1))
+        proj_dist.view(-1).index_add_ \
+            (0, (u + offset).view(-1), (next_dist * (b - l.float())).view(-1))
+
+        return proj_dist
+
+    def compute_batch_loss(self, state, action, reward, next_state, done, discount):
+        """
+           <Batch loss calculation function>
+           Each network computes its distribution in a single forward pass, the target
+           distribution is projected for the whole batch and the loss of every sample
+           is calculated at once
 
-        # Index of agents
-        index_dist = [i for i in range(num_agents)]
+           Parameters:
+           --------
+           state: the batch of states (BxNxF, BxNxN, BxN)
+           action: the batch of actions (BxN)
+           reward: the (discounted n-step) rewards (B)
+           next_state: the batch of next states
+           done: whether to terminate (B)
+           discount: the discount factor of the target value (B, or a scalar)
+        """
+        action = torch.as_tensor(action, dtype=torch.long, device=self.device)
 
-        for elem in data_batch:
-            # Take the smaller of n_steps and elem lengths to prevent n-step sequential sampling out of index
-            n_steps = min(self.n_steps, len(elem))
+        dist, next_dist = self.compute_dist(state, next_state)
 
-            # ------q_target and distribution------ #
-            # The n-th sample
-            state, action, reward, next_state, done = elem[n_steps - 1]
-            # Calculation of movements and distribution
-            next_action = self.target_model(next_state).argmax(1)
-            next_dist = self.target_model.dist(next_state)
-            # Get the specific value of the distribution based on the action
-            next_dist = next_dist[index_dist, next_action, :]
-
-            # ------Reward calculation------ #
-            # Reward value
-            reward = [i[2] for i in elem]
-            # Discount factor
-            n_step_scaling = [self.gamma ** i for i in range(n_steps)]
-            # Calculate the reward matrix by multiplying the reward value with
-            # the corresponding factor of the discount factor
-            R = np.multiply(reward, n_step_scaling)
-            # Sum
-            R = np.sum(R)
-
-            # ------Calculation of distribution-related parameters------ #
-            t_z = R + (self.gamma ** self.n_steps) * self.support * (1 - done)
-            t_z = t_z.clamp(min=self.V_min, max=self.V_max)
-            b = (t_z - self.V_min) / delta_z
-            l = b.floor().long()
-            u = b.ceil().long()
-
-            offset = (torch.linspace(0, (num_agents - 1) * self.n_atoms, num_agents).
-                      long().unsqueeze(1).expand(num_agents, self.n_atoms).to(self.device))
-
-            proj_dist = torch.zeros(next_dist.size(), device=self.device)
-            proj_dist.view(-1).index_add_ \
-                (0, (l + offset).view(-1), (next_dist * (u.float() - b)).view(-1))
-            proj_dist.view(-1).index_add_ \
-                (0, (u + offset).view(-1), (next_dist * (b - l.float())).view(-1))
-
-            # ------q_predict distribution------ #
-            state, action, reward, next_state, done = elem[0]
-            dist = self.model.dist(state)
-
-            # ------loss------ #
-            # Calculating KL dispersion as loss
-            log_p = torch.log(dist[index_dist, action, :])
-            loss_sample = -(proj_dist * log_p).sum(1).mean()
-
-            loss.append(loss_sample)
-
-        loss = torch.stack(loss)
+        # ------Calculation of the projected target distribution------ #
+        proj_dist = self.projection_distribution(next_dist, reward, done, discount)
+
+        # ------loss------ #
+        # Calculating KL dispersion as loss
+        dist = dist.gather(2, action[:, :, None, None].expand(-1, -1, 1, self.n_atoms)).squeeze(2)
+        log_p = torch.log(dist)
+        loss = -(proj_dist * log_p).sum(-1).mean(-1)
 
         return loss
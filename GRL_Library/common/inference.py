@@ -0,0 +1,96 @@
+"""
+    This function is used to define the low-latency inference path of the GRL models
+    used for action selection
+"""
+
+import warnings
+import numpy as np
+import torch
+from GRL_Library.common.replay_buffer import is_sparse_observation
+
+
+class InferenceModel(object):
+    """
+        Action selection wrapper of a GRL model. Every simulation step, the observation
+        is copied into preallocated float32 input tensors (instead of allocating new
+        tensors in datatype_transmission) and the model runs without autograd.
+
+        Optionally, the model is run through a TorchScript copy traced with the first
+        observation. The traced copy shares the parameters of the model, so the
+        in-place updates of the optimizer are seen directly; it is traced again when
+        the model, its modules, its parameters, its mode (train/eval) or the observation
+        shape change. Only models returning tensors can be traced (e.g. the Q networks and
+        the DDPG actors), and sparse graph observations, whose shapes change every
+        step, are never traced.
+    """
+
+    def __init__(self, trace=False):
+        """
+            <Constructor>
+
+            Parameters：
+            ------
+            trace: whether to run the model through a traced TorchScript copy
+        """
+        self.trace = trace
+        self.inputs = None  # Preallocated input tensors
+        self.traced_model = None  # Traced copy of the model
+        self.traced_key = None  # Model state the traced copy was created for
+
+    def _copy_inputs(self, observation, device):
+        """
+            <Input preparation function>
+            Copy the observation components into the preallocated input tensors,
+            the tensors are allocated again if the shapes or the device change.
+            Integer components (the edges and node map of sparse observations) are
+            kept as int64 indexes.
+        """
+        arrays = observation if isinstance(observation, (tuple, list)) else (observation,)
+        arrays = [torch.from_numpy(elem) if isinstance(elem, np.ndarray) else torch.as_tensor(elem)
+                  for elem in arrays]
+
+        if self.inputs is None or len(self.inputs) != len(arrays) or \
+                any(buf.shape != elem.shape or buf.device != torch.device(device) or
+                    buf.is_floating_point() != elem.is_floating_point()
+                    for buf, elem in zip(self.inputs, arrays)):
+            self.inputs = tuple(torch.empty(elem.shape, device=device,
+                                            dtype=torch.float32 if elem.is_floating_point() else torch.int64)
+                                for elem in arrays)
+
+        for buf, elem in zip(self.inputs, arrays):
+            buf.copy_(elem)
+
+        return self.inputs if isinstance(observation, (tuple, list)) else self.inputs[0]
+
+    def _traced(self, model, inputs):
+        """
+            <Traced model function>
+            Return the traced copy of the model, tracing it again if necessary.
+        """
+        # The modules are part of the key, e.g. dense_chain.to_dense_graph replaces the
+        # graph layers of the model but keeps their parameters
+        key = (model, model.training, tuple(id(module) for module in model.modules()),
+               tuple(id(param) for param in model.parameters()),
+               tuple(elem.shape for elem in self.inputs))
+        if self.traced_key is None or self.traced_key[0] is not model or self.traced_key[1:] != key[1:]:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self.traced_model = torch.jit.trace(model, (inputs,), check_trace=False)
+            self.traced_key = key
+        return self.traced_model
+
+    def __call__(self, model, observation):
+        """
+            <Inference function>
+            Run the model on the observation without autograd.
+
+            Parameters：
+            ------
+            model: the GRL model (must provide the device attribute)
+            observation: observation of the environment, (X_in, A_in_Dense, RL_indice)
+        """
+        with torch.no_grad():
+            inputs = self._copy_inputs(observation, model.device)
+            if self.trace and not is_sparse_observation(observation):
+                return self._traced(model, inputs)(inputs)
+            return model(inputs)
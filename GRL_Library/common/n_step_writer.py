@@ -0,0 +1,93 @@
+"""
+    This function is used to define the n-step transition writer placed in front of
+    the replay_buffers in the DRL
+"""
+
+import collections
+import numpy as np
+
+
+class NStepWriter(object):
+    """
+        Accumulator of the n-step returns at insertion time. The one-step transitions
+        of the interaction are kept until their n-step return is complete, and each
+        of them is then emitted once as the transition
+
+            (s_t, a_t, R_t^(n), s_t+k, done, gamma^k),  R_t^(n) = sum_i gamma^i * r_t+i
+
+        with k = n_steps, so that the replay_buffers store ready-made n-step
+        transitions and the agents compute the same one-step loss for any n_steps
+        (the target value is R + gamma^k * Q(s_t+k) * (1 - done)).
+
+        The returns are truncated at the end of the episodes: when done is True, the
+        pending transitions are emitted with the remaining steps (k < n_steps) and
+        the terminal next_state. When an episode is interrupted without done (e.g.
+        max_episode_len is reached), the next state stored is not the last next_state
+        and the pending transitions are emitted with the bootstrapped truncated return.
+    """
+
+    def __init__(self, n_steps, gamma):
+        """
+            <Constructor>
+
+            Parameters：
+            ------
+            n_steps: the number of multi-steps learning steps
+            gamma: discount factor
+        """
+        self.n_steps = n_steps
+        self.gamma = gamma
+        self.pending = collections.deque()  # (state, action, reward) awaiting their n-step return
+        self.last_next_state = None  # next_state of the newest transition (as given)
+        self.last_done = False  # done of the newest transition
+
+    def _emit(self):
+        """
+            Emit the oldest pending transition with the return of the pending rewards.
+        """
+        k = len(self.pending)
+        rewards = np.array([elem[2] for elem in self.pending], dtype=np.float64)
+        R = float(np.dot(rewards, self.gamma ** np.arange(k)))
+        state, action, _ = self.pending.popleft()
+        return state, action, R, self.last_next_state, self.last_done, self.gamma ** k
+
+    def flush(self):
+        """
+            <Transition flushing function>
+            Emit all the pending transitions with their truncated returns.
+        """
+        transitions = []
+        while self.pending:
+            transitions.append(self._emit())
+        return transitions
+
+    def add(self, state, action, reward, next_state, done):
+        """
+            <Data storage function>
+            Add a one-step transition and return the list of the completed n-step
+            transitions (state, action, reward, next_state, done, discount)
+
+            Parameters:
+            ------
+            state: current state of the moment
+            action: the action at the current moment
+            reward: the reward received for performing the current action
+            next_state: the next state after the current action
+            done: whether to terminate
+        """
+        transitions = []
+
+        # The previous episode was interrupted without done
+        if self.pending and state is not self.last_next_state:
+            transitions.extend(self.flush())
+
+        self.pending.append((state, action, reward))
+        self.last_next_state = next_state
+        self.last_done = done
+
+        if done:
+            transitions.extend(self.flush())
+        elif len(self.pending) == self.n_steps:
+            transitions.append(self._emit())
+
+        return transitions
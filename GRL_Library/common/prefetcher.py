@@ -0,0 +1,153 @@
+"""
+    This function is used to define the background minibatch prefetcher of the
+    off-policy agents in the DRL
+"""
+
+import queue
+import threading
+import numpy as np
+import torch
+from GRL_Library.common.prioritized_replay_buffer import PrioritizedReplayBuffer
+
+
+def to_tensors(data, device):
+    """
+        <Tensor conversion function>
+        Convert the numpy arrays of a (nested) batch into tensors on the device,
+        floating point arrays become float32 and integer arrays int64 tensors.
+
+        Parameters：
+        ------
+        data: the batch (tuples of numpy arrays)
+        device: the device of the tensors
+    """
+    if isinstance(data, (tuple, list)):
+        return tuple(to_tensors(elem, device) for elem in data)
+    if isinstance(data, np.ndarray):
+        tensor = torch.from_numpy(np.ascontiguousarray(data))
+        dtype = torch.float32 if tensor.is_floating_point() else torch.long
+        return tensor.to(device=device, dtype=dtype)
+    return data
+
+
+class BatchPrefetcher(object):
+    """
+        Double-buffered minibatch prefetcher of a replay_buffer. While the learner
+        consumes a minibatch and the simulation advances, the next minibatch is
+        sampled, stacked and converted to tensors on a background thread.
+
+        The replay_buffer is only accessed under a lock (the transitions are stored
+        through the prefetcher), and the consistency of the prioritized replay_buffer
+        is kept:
+        1.The next minibatch is only sampled once the priorities of the previous one
+        have been updated, so it is drawn from the updated priorities.
+        2.The priorities of the sampled slots that have been overwritten by new
+        transitions in the meantime are not updated (the new transitions keep the
+        maximum priority they were stored with).
+    """
+
+    def __init__(self, replay_buffer, batch_size, prepare, device):
+        """
+            <Constructor>
+
+            Parameters：
+            ------
+            replay_buffer: the replay_buffer to be sampled
+            batch_size: the amount of data to be sampled from the replay_buffer
+            prepare: function stacking the sampled data (e.g. the batch_memory of the agent)
+            device: the device of the tensors of the minibatch
+        """
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.prepare = prepare
+        self.device = device
+        self.prioritized = isinstance(replay_buffer, PrioritizedReplayBuffer)
+
+        self.lock = threading.Lock()  # Guards the replay_buffer
+        self.requests = queue.Queue()  # Minibatch requests to the background thread
+        self.batches = queue.Queue(maxsize=1)  # The prefetched minibatch
+        self.requested = False  # Whether the next minibatch is being prepared
+        self.thread = None
+
+        self.num_added = 0  # Number of transitions stored through the prefetcher
+        self.sample_position = None  # (num_added, next_index) when the last minibatch was sampled
+
+    def add(self, *transition, stream=0):
+        """
+            <Data storage function>
+            Store a transition in the replay_buffer (same parameters as its add function)
+        """
+        with self.lock:
+            self.replay_buffer.add(*transition, stream=stream)
+            self.num_added += 1
+
+    def _prefetch(self):
+        """
+            Background thread: sample, stack and convert a minibatch for every request.
+        """
+        while True:
+            self.requests.get()
+            try:
+                with self.lock:
+                    position = (self.num_added, getattr(self.replay_buffer, 'next_index', 0))
+                    samples, data_sample = self.replay_buffer.sample(self.batch_size)
+                batch = to_tensors(self.prepare(data_sample), self.device)
+                self.batches.put((samples, batch, position))
+            except Exception as error:  # raised again in the learner thread
+                self.batches.put(error)
+
+    def request(self):
+        """
+            <Request function>
+            Start preparing the next minibatch in the background.
+        """
+        if self.requested:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._prefetch, daemon=True)
+            self.thread.start()
+        self.requested = True
+        self.requests.put(True)
+
+    def get(self):
+        """
+            <Data sampling function>
+            Return the prefetched minibatch (samples, batch), as the sample function of
+            the replay_buffer followed by prepare. The next minibatch is requested at
+            once for the uniform replay_buffer, after update_priority for the
+            prioritized replay_buffer.
+        """
+        self.request()
+        result = self.batches.get()
+        self.requested = False
+        if isinstance(result, Exception):
+            raise result
+        samples, batch, self.sample_position = result
+
+        if not self.prioritized:
+            self.request()
+        return samples, batch
+
+    def update_priority(self, indexes, priorities):
+        """
+            <priority update function>
+            Update the priorities of the sampled transitions that have not been
+            overwritten since the sampling, then request the next minibatch.
+
+            Parameters:
+            ------
+            indexes: the indexes generated by sample
+            priorities: priority specific values (tensor)
+        """
+        with self.lock:
+            num_new, next_index = self.num_added - self.sample_position[0], self.sample_position[1]
+            if num_new > 0:
+                overwritten = (next_index + np.arange(min(num_new, self.replay_buffer.capacity))) % \
+                              self.replay_buffer.capacity
+                keep = ~np.isin(indexes, overwritten)
+                indexes = np.asarray(indexes)[keep]
+                priorities = priorities[torch.as_tensor(keep, device=priorities.device)]
+            if len(indexes):
+                self.replay_buffer.update_priority(indexes, priorities)
+
+        self.request()
@@ -1,12 +1,12 @@
 """
     This function is used to define the prioritized_replay_buffer in the DRL.
 """
-import random
 import numpy as np
+from GRL_Library.common.replay_buffer import compact_observation, clear_directory, ColumnarStorage, open_array
 
 
 class PrioritizedReplayBuffer(object):
-    def __init__(self, capacity, alpha, beta, beta_step, epsilon):
+    def __init__(self, capacity, alpha, beta, beta_step, epsilon, directory=None, resume=False):
         """
             <Constructor>
             Defines the priority_replay_buffer class
@@ -20,10 +20,13 @@ class PrioritizedReplayBuffer(object):
             beta_step: incremental value of beta per sample
             (beta should not exceed 1, and the update rate should be controlled)
             epsilon: a very small value to prevent zero priority.
+            directory: if given, the transitions are stored in memory-mapped columns of
+            this directory (see ColumnarStorage) together with the segment trees and the
+            counters. Sampling then returns already stacked batch arrays.
+            resume: whether to continue from the transitions, segment trees and counters
+            stored in the directory by a previous replay_buffer (they must have the same
+            layout), otherwise the directory is cleared.
         """
-        # capacity is set to the nth power of 2 to facilitate code writing and debugging
-        assert capacity & (capacity - 1) == 0
-
         self.capacity = capacity
         self.alpha = alpha
         self.beta = beta
@@ -32,15 +35,37 @@ class PrioritizedReplayBuffer(object):
 
         self.max_priority = 1.
 
-        # Summation of a binary tree and finding the minimum value within a range
-        self.priority_sum = [0 for _ in range(2 * self.capacity)]
-        self.priority_min = [float('inf') for _ in range(2 * self.capacity)]
+        # The binary line segment tree is stored in numpy arrays. The number of leaves
+        # is the smallest power of 2 not less than the capacity, so that any capacity
+        # can be used, the unused leaves keep a zero priority and are never sampled.
+        self.tree_capacity = 1
+        while self.tree_capacity < self.capacity:
+            self.tree_capacity *= 2
 
         self.next_index = 0
         self.size = 0
-        self.buffer = []
 
-    def add(self, state, action, reward, next_state, done):
+        self.columnar = directory is not None
+        if directory is None:
+            # Summation of a binary tree and finding the minimum value within a range
+            self.priority_sum = np.zeros(2 * self.tree_capacity, dtype=np.float64)
+            self.priority_min = np.full(2 * self.tree_capacity, np.inf, dtype=np.float64)
+            self.buffer = []
+            self.counters = None
+        else:
+            if not resume:
+                clear_directory(directory)
+            self.buffer = ColumnarStorage(capacity, directory)
+            self.priority_sum = open_array(directory, 'priority_sum', (2 * self.tree_capacity,), np.float64)
+            self.priority_min = open_array(directory, 'priority_min', (2 * self.tree_capacity,), np.float64,
+                                           fill_value=np.inf)
+            # Memory-mapped next_index, size, max_priority and beta
+            self.counters = open_array(directory, 'counters', (4,), np.float64,
+                                       fill_value=(self.next_index, self.size, self.max_priority, self.beta))
+            self.next_index, self.size = int(self.counters[0]), int(self.counters[1])
+            self.max_priority, self.beta = float(self.counters[2]), float(self.counters[3])
+
+    def add(self, state, action, reward, next_state, done, discount=None, stream=0):
         """
             <Data storage function>
             Store data in the replay buffer
@@ -52,18 +77,28 @@ class PrioritizedReplayBuffer(object):
             reward: the reward received for performing the current action
             next_state: the next state after the current action
             done: whether to terminate
+            discount: the discount factor of the target value of n-step transitions
+            (see NStepWriter), returned by sample after the dones
+            stream: the index of the environment (or actor) the transition comes from
+            (the transitions are stored as given, see ReplayBuffer.add)
         """
-        # # Combine the above data and store it in [data]
-        data = (state, action, reward, next_state, done)
-
         # Index calculation
         idx = self.next_index
 
         # Store data
-        if idx >= len(self.buffer):
-            self.buffer.append(data)
+        if self.columnar:
+            self.buffer.write(idx, state, action, reward, next_state, done, discount)
         else:
-            self.buffer[idx] = data
+            # # Combine the above data and store it in [data], the observations are
+            # stored in their compact form (bit-packed adjacency, float32 features,
+            # uint8 mask) and decoded per sampled batch
+            data = (compact_observation(state), action, reward, compact_observation(next_state), done)
+            if discount is not None:
+                data += (discount,)
+            if idx >= len(self.buffer):
+                self.buffer.append(data)
+            else:
+                self.buffer[idx] = data
 
         # Index update
         self.next_index = (idx + 1) % self.capacity
@@ -76,6 +111,14 @@ class PrioritizedReplayBuffer(object):
         # priority update
         self._set_priority_min(idx, priority_alpha)
         self._set_priority_sum(idx, priority_alpha)
+        self._save_counters()
+
+    def _save_counters(self):
+        """
+            Write the counters into their memory-mapped file (memory-mapped buffer only).
+        """
+        if self.counters is not None:
+            self.counters[:] = (self.next_index, self.size, self.max_priority, self.beta)
 
     def _set_priority_min(self, idx, priority_alpha):
         """
@@ -84,18 +127,21 @@ class PrioritizedReplayBuffer(object):
 
             Parameters:
             ------
-            idx: index of the current transition
-            priority_alpha: priority to take the value
+            idx: index (or array of indexes) of the transitions
+            priority_alpha: priority (or array of priorities) to take the value
         """
         # Leaf node
-        idx += self.capacity
+        idx = np.asarray(idx) + self.tree_capacity
         self.priority_min[idx] = priority_alpha
 
-        # Traversing along the parent node to update the tree up to the root of the tree
-        while idx >= 2:
-            idx //= 2
-            self.priority_min[idx] = min(self.priority_min[2 * idx],
-                                         self.priority_min[2 * idx + 1])
+        # Traversing along the parent nodes level by level to update the tree up to
+        # the root of the tree, all the nodes of the same level are updated at once
+        # (repeated parents are simply written several times with the same value)
+        idx = idx // 2
+        while np.any(idx >= 1):
+            self.priority_min[idx] = np.minimum(self.priority_min[2 * idx],
+                                                self.priority_min[2 * idx + 1])
+            idx = idx // 2
 
     def _set_priority_sum(self, idx, priority):
         """
@@ -104,18 +150,21 @@ class PrioritizedReplayBuffer(object):
 
             Parameters:
             ------
-            idx: index of the current transition
-            priority: the priority value to take
+            idx: index (or array of indexes) of the transitions
+            priority: the priority value (or array of priority values) to take
         """
         # Leaf node
-        idx += self.capacity
+        idx = np.asarray(idx) + self.tree_capacity
         self.priority_sum[idx] = priority
 
-        # Traversing along the parent node to update the tree up to the root of the tree
-        while idx >= 2:
-            idx //= 2
+        # Traversing along the parent nodes level by level to update the tree up to
+        # the root of the tree, all the nodes of the same level are updated at once
+        # (repeated parents are simply written several times with the same value)
+        idx = idx // 2
+        while np.any(idx >= 1):
             self.priority_sum[idx] = self.priority_sum[2 * idx] + \
                                      self.priority_sum[2 * idx + 1]
+            idx = idx // 2
 
     def _sum(self):
         """
@@ -137,16 +186,19 @@ class PrioritizedReplayBuffer(object):
         """
             <maximum priority search function>
             Search for maximum priority in a bifurcated line segment tree.
+            prefix_sum can be an array, in which case all the prefix sums descend the
+            tree together, one level per iteration.
         """
+        prefix_sum = np.array(prefix_sum, dtype=np.float64)
         # Search from the root node
-        idx = 1
-        while idx < self.capacity:
-            if self.priority_sum[idx * 2] > prefix_sum:  # Left node
-                idx = 2 * idx
-            else:
-                prefix_sum -= self.priority_sum[idx * 2]  # Right node
-                idx = 2 * idx + 1
-        return idx - self.capacity
+        idx = np.ones(prefix_sum.shape, dtype=np.int64)
+        while idx.flat[0] < self.tree_capacity:
+            left_sum = self.priority_sum[2 * idx]
+            go_right = left_sum <= prefix_sum  # Right node
+            prefix_sum -= left_sum * go_right
+            idx = 2 * idx + go_right
+        # Guard against floating point errors landing on an empty leaf
+        return np.minimum(idx - self.tree_capacity, self.size - 1)
 
     def sample(self, batch_size, n_steps=1):
         """
@@ -168,11 +220,11 @@ class PrioritizedReplayBuffer(object):
             'indexes': np.zeros(shape=batch_size, dtype=np.int32)
         }
 
-        # Index
-        for i in range(batch_size):
-            p = random.random() * self._sum()
-            idx = self.find_prefix_sum_idx(p)
-            samples['indexes'][i] = idx
+        # Index, stratified sampling: the total priority is divided into batch_size
+        # segments of equal length and one prefix sum is drawn from each segment
+        segment = self._sum() / batch_size
+        p = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        samples['indexes'][:] = self.find_prefix_sum_idx(p)
 
         # min_i Pi
         probability_min = self._min() / self._sum()
@@ -181,14 +233,25 @@ class PrioritizedReplayBuffer(object):
         max_weight = (probability_min * self.size) ** (-beta)
 
         # sample weights
-        for i in range(batch_size):
-            idx = samples['indexes'][i]
-            probability = self.priority_sum[idx + self.capacity] / self._sum()  # 计算Pi
-            weight = (probability * self.size) ** (-beta)  # 计算权重
-            samples['weights'][i] = weight / max_weight  # 为样本赋予权重
+        probability = self.priority_sum[samples['indexes'] + self.tree_capacity] / self._sum()  # 计算Pi
+        weight = (probability * self.size) ** (-beta)  # 计算权重
+        samples['weights'][:] = weight / max_weight  # 为样本赋予权重
 
         # beta update
         self.beta = min((beta + self.beta_step), 1)
+        self._save_counters()
+
+        # Columnar storage, the batch is gathered directly from the columns
+        if self.columnar:
+            if n_steps == 1:
+                sample_data = self.buffer.gather(samples['indexes'])
+            else:
+                # The windows stop at the last stored slot as the list slices do,
+                # the missing rewards are zero
+                windows = samples['indexes'][:, None] + np.arange(n_steps)
+                sample_data = self.buffer.gather(np.minimum(windows, self.size - 1))
+                sample_data[2][windows >= self.size] = 0
+            return samples, sample_data
 
         # sample acquiring
         sample_data = []
@@ -220,9 +283,9 @@ class PrioritizedReplayBuffer(object):
         priorities = priorities.detach().cpu().numpy()
         priorities = priorities + self.epsilon
 
-        # priority update
-        for idx, priority in zip(indexes, priorities):
-            self.max_priority = max(self.max_priority, priority)
-            priority_alpha = priority ** self.alpha
-            self._set_priority_min(idx, priority_alpha)
-            self._set_priority_sum(idx, priority_alpha)
+        # priority update, all the sampled transitions are written at once
+        self.max_priority = max(self.max_priority, np.max(priorities))
+        priority_alpha = priorities ** self.alpha
+        self._set_priority_min(indexes, priority_alpha)
+        self._set_priority_sum(indexes, priority_alpha)
+        self._save_counters()
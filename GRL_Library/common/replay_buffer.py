@@ -2,11 +2,667 @@
     This function is used to define the replay_buffer in the DRL
 """
 
+import collections
+import json
+import os
 import numpy as np
 
 
-class ReplayBuffer(object):
+def to_numpy(data):
+    """
+        <Data conversion function>
+        Convert the data generated during the interaction (numpy arrays, python scalars,
+        lists or torch tensors) into numpy arrays without importing torch.
+
+        Parameters：
+        ------
+        data: the data to be converted
+    """
+    if hasattr(data, 'detach'):  # torch.Tensor
+        data = data.detach().cpu().numpy()
+    return np.asarray(data)
+
+
+def sample_indexes(high, batch_size, rng):
+    """
+        <Index sampling function>
+        Draw batch_size distinct indexes from [0, high). The Generator uses a hash-set
+        (Floyd) algorithm when batch_size << high, so the cost is O(batch_size) instead
+        of permuting the whole range as np.random.choice(replace=False) does.
+
+        Parameters：
+        ------
+        high: upper bound (exclusive) of the indexes
+        batch_size: the number of indexes to be drawn
+        rng: numpy random Generator
+    """
+    return rng.choice(high, batch_size, replace=False)
+
+
+def collate_transitions(sample_data, n_steps=1):
+    """
+        <Data stacking function>
+        Stack a list of (state, action, reward, next_state, done) tuples sampled from a
+        list-based replay_buffer into the columnar batch format returned by the columnar
+        replay_buffer, so that the agents only need one batched loss implementation.
+        Transitions written by the NStepWriter also hold their discount factor.
+
+        Parameters：
+        ------
+        sample_data: list of transitions (single-step learning) or list of transition
+        sequences (multi-step learning)
+        n_steps: the number of multi-steps learning steps
+
+        Returns:
+        ------
+        states, actions, rewards, next_states, dones, where each observation component
+        is stacked along a new leading batch axis. For multi-step learning the rewards
+        have the shape [batch_size, n_steps], the states and actions are taken from the
+        first transition and the next_states and dones from the last transition.
+        The discounts of the n-step transitions are appended for single-step sampling.
+    """
+    if n_steps == 1:
+        first = last = sample_data
+        rewards = np.array([elem[2] for elem in sample_data], dtype=np.float32)
+    else:
+        first = [elem[0] for elem in sample_data]
+        last = [elem[-1] for elem in sample_data]
+        rewards = np.zeros((len(sample_data), n_steps), dtype=np.float32)
+        for i, elem in enumerate(sample_data):
+            rewards[i, :len(elem)] = [data[2] for data in elem]
+
+    states = stack_observations([elem[0] for elem in first])
+    actions = np.stack([to_numpy(elem[1]) for elem in first])
+    next_states = stack_observations([elem[3] for elem in last])
+    dones = np.array([elem[4] for elem in last], dtype=np.float32)
+
+    if n_steps == 1 and len(sample_data[0]) == 6:
+        discounts = np.array([elem[5] for elem in sample_data], dtype=np.float32)
+        return states, actions, rewards, next_states, dones, discounts
+    return states, actions, rewards, next_states, dones
+
+
+def is_sparse_observation(observation):
+    """
+        Sparse graph observations (X_in, A_in_Sparse, RL_indice, node_map) only
+        contain the vehicles present in the network, the node_map gives the row of
+        the vehicle of each agent slot (-1 if absent).
+    """
+    return isinstance(observation, (tuple, list)) and len(observation) == 4
+
+
+def _merge_sparse_observations(observations, node_maps):
+    """
+        Merge sparse observations into one graph: the node features and masks are
+        concatenated, and the edges and node maps are offset by the number of nodes
+        preceding each graph.
+    """
+    features = [to_numpy(obs[0]) for obs in observations]
+    sizes = np.array([len(elem) for elem in features], dtype=np.int64)
+    offsets = np.cumsum(sizes) - sizes
+
+    edge_index = np.concatenate([to_numpy(obs[1]).astype(np.int64) + offset
+                                 for obs, offset in zip(observations, offsets)], axis=1)
+    mask = np.concatenate([to_numpy(obs[2]) for obs in observations])
+    node_map = np.concatenate([np.where(elem >= 0, elem + offset, -1)
+                               for elem, offset in zip(node_maps, offsets)])
+
+    return np.concatenate(features), edge_index, mask, node_map
+
+
+class PackedObservation(collections.namedtuple('PackedObservation', ['features', 'adjacency_bits', 'mask'])):
+    """
+        Compact form of a dense graph observation (X_in, A_in_Dense, RL_indice) kept
+        in the replay_buffers: float32 node features, the rows of the binary adjacency
+        matrix bit-packed with np.packbits (N x ceil(N/8) uint8) and a uint8 mask.
+        Batches of packed observations are decoded at once by stack_observations.
+    """
+    __slots__ = ()
+
+
+def _is_binary(data):
+    """
+        Whether all the values of the array are 0 or 1.
+    """
+    return bool(np.all((data == 0) | (data == 1)))
+
+
+def _compact_array(data):
+    """
+        Binary data (masks) is stored as uint8, other floating point data as float32.
+    """
+    if np.issubdtype(data.dtype, np.floating) or data.dtype == bool:
+        return data.astype(np.uint8) if _is_binary(data) else data.astype(np.float32)
+    return data
+
+
+def compact_observation(observation):
+    """
+        <Observation compaction function>
+        Convert an observation into the compact form stored in the replay_buffers.
+
+        1.Dense graph observations with a binary adjacency matrix become a
+        PackedObservation (the float64 NxN adjacency matrix takes 64 times less memory).
+        2.Sparse graph observations keep float32 features, int32 edges and node map.
+        3.The floating point data of other observations is converted to float32.
+
+        Parameters：
+        ------
+        observation: observation of the environment
+    """
+    if is_sparse_observation(observation):
+        features, edge_index, mask, node_map = (to_numpy(elem) for elem in observation)
+        return features.astype(np.float32), edge_index.astype(np.int32), \
+            _compact_array(mask), node_map.astype(np.int32)
+
+    if isinstance(observation, (tuple, list)):
+        observation = tuple(to_numpy(elem) for elem in observation)
+        if len(observation) == 3:
+            features, adjacency, mask = observation
+            if adjacency.ndim >= 2 and adjacency.shape[-1] == adjacency.shape[-2] and _is_binary(adjacency):
+                return PackedObservation(features.astype(np.float32),
+                                         np.packbits(adjacency.astype(bool), axis=-1),
+                                         _compact_array(mask))
+        return tuple(elem.astype(np.float32) if np.issubdtype(elem.dtype, np.floating) else elem
+                     for elem in observation)
+
+    observation = to_numpy(observation)
+    return observation.astype(np.float32) if np.issubdtype(observation.dtype, np.floating) else observation
+
+
+def unpack_observation(observation):
+    """
+        <Observation decoding function>
+        Decode a PackedObservation (or a batch of stacked PackedObservations) into the
+        float32 arrays (X_in, A_in_Dense, RL_indice).
+
+        Parameters：
+        ------
+        observation: the packed observation
+    """
+    num_nodes = observation.features.shape[-2]
+    adjacency = np.unpackbits(observation.adjacency_bits, axis=-1, count=num_nodes)
+    return observation.features, adjacency.astype(np.float32), observation.mask.astype(np.float32)
+
+
+def stack_observations(observations):
+    """
+        <Observation stacking function>
+        Stack observations component-wise, observations given as tuples
+        (X_in, A_in_Dense, RL_indice) are stacked into a tuple of batched arrays.
+        Sparse observations are merged into one graph with a BxN node map, packed
+        observations are decoded after stacking.
+
+        Parameters：
+        ------
+        observations: list of observations
+    """
+    packed = [isinstance(obs, PackedObservation) for obs in observations]
+    if all(packed):
+        return unpack_observation(PackedObservation(*(np.stack(elem) for elem in zip(*observations))))
+    if any(packed):
+        observations = [unpack_observation(obs) if is_packed else obs
+                        for obs, is_packed in zip(observations, packed)]
+    if is_sparse_observation(observations[0]):
+        return _merge_sparse_observations(observations,
+                                          [to_numpy(obs[3])[np.newaxis] for obs in observations])
+    if isinstance(observations[0], (tuple, list)):
+        return tuple(np.stack([to_numpy(obs[i]) for obs in observations])
+                     for i in range(len(observations[0])))
+    return np.stack([to_numpy(obs) for obs in observations])
+
+
+def _concatenate(arrays):
+    """
+        Concatenate numpy arrays, or torch tensors (e.g. the batches converted by the
+        BatchPrefetcher, possibly on the GPU) with torch.cat.
+    """
+    if hasattr(arrays[0], 'detach'):  # torch.Tensor
+        import torch
+        return torch.cat(arrays)
+    return np.concatenate(arrays)
+
+
+def concatenate_observations(*observations):
+    """
+        <Observation concatenation function>
+        Concatenate batches of observations along the batch axis, e.g. to pass the
+        states and the next states through a network in a single forward pass.
+
+        Parameters：
+        ------
+        observations: batches of observations, given as tuples of stacked arrays
+        (X_in, A_in_Dense, RL_indice) or as stacked arrays, numpy arrays or tensors
+    """
+    if is_sparse_observation(observations[0]):
+        return _merge_sparse_observations(observations, [to_numpy(obs[3]) for obs in observations])
+    if isinstance(observations[0], (tuple, list)):
+        return tuple(_concatenate(elem) for elem in zip(*observations))
+    return _concatenate(observations)
+
+
+def open_array(directory, name, shape, dtype, fill_value=None):
+    """
+        <Memory-mapped array function>
+        Return the array stored in the file name.npy of the directory as a writable
+        np.memmap. The file is opened again if it exists (a restarted process sees the
+        data written before), otherwise it is created and filled with fill_value.
+
+        Parameters：
+        ------
+        directory: the directory of the file
+        name: the name of the array
+        shape: the shape of the array
+        dtype: the data type of the array
+        fill_value: the initial value of a newly created array (zeros if None)
+    """
+    path = os.path.join(directory, name + '.npy')
+    if os.path.exists(path):
+        array = np.lib.format.open_memmap(path, mode='r+')
+        if array.shape != tuple(shape) or array.dtype != np.dtype(dtype):
+            raise ValueError("The array stored in " + path + " does not match the replay_buffer")
+        return array
+
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+    if fill_value is not None:
+        array[...] = fill_value
+    return array
+
+
+def clear_directory(directory):
+    """
+        <Directory clearing function>
+        Remove the memory-mapped replay_buffer stored in the directory (the layout and
+        the .npy arrays), so that a new replay_buffer starts empty.
+
+        Parameters：
+        ------
+        directory: the directory of the memory-mapped replay_buffer
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name == ColumnarStorage.layout_file or name.endswith('.npy'):
+            os.remove(os.path.join(directory, name))
+
+
+class ColumnarStorage(object):
+    """
+        Columnar storage core of the replay_buffer. Every element of a transition
+        (node features NxF, adjacency NxN, mask N, action, reward, done) is stored in
+        its own preallocated numpy column, so a batch is gathered with one fancy-indexed
+        read per column instead of unpacking python tuples.
+
+        The columns are allocated lazily when the first transition is written, the
+        shapes of the observations and actions are inferred from it. The observations
+        are stored in their compact form (see compact_observation): the adjacency
+        matrices are bit-packed and decoded per gathered batch. Sparse graph
+        observations have a variable size, they are stored as tuples in object columns.
+
+        If a directory is given, the columns are np.memmap files of the directory
+        (described by layout.json, with the shape and data type of every column):
+        sampling reads them through the page cache instead of keeping the buffer in
+        RAM, the written transitions survive a crash of the process, and a new storage
+        created on the same directory reattaches to them. The first transition written
+        after reattaching must match the stored columns.
+    """
+
+    # Observation columns of a transition
+    observation_prefixes = ('state', 'next_state')
+
+    # Description of the memory-mapped columns
+    layout_file = 'layout.json'
+
+    def __init__(self, size, directory=None):
+        """
+            <Constructor>
+
+            Parameters：
+            ------
+            size: the number of transitions that can be stored
+            directory: the directory of the memory-mapped columns (None to keep the
+            columns in memory)
+        """
+        self.size = size
+        self.directory = directory
+        self.columns = None
+        self.obs_is_tuple = False
+        self.obs_is_sparse = False
+        self.obs_is_packed = False
+        self.obs_length = 0
+        self.has_discount = False  # whether the transitions hold their discount factor
+        self.layout = None  # Stored layout the next written transition is checked against
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            if os.path.exists(os.path.join(directory, self.layout_file)):
+                self._reattach()
+
+    def _reattach(self):
+        """
+            <Column reattaching function>
+            Open the memory-mapped columns written by a previous storage.
+        """
+        with open(os.path.join(self.directory, self.layout_file)) as f:
+            layout = json.load(f)
+        if layout['size'] != self.size:
+            raise ValueError("The replay_buffer stored in " + self.directory + " has the size " +
+                             str(layout['size']) + " instead of " + str(self.size))
+
+        self.obs_is_tuple = layout['obs_is_tuple']
+        self.obs_is_packed = layout['obs_is_packed']
+        self.obs_length = layout['obs_length']
+        if not isinstance(layout['columns'], dict):
+            raise ValueError("The replay_buffer stored in " + self.directory + " has no column shapes")
+        self.columns = {}
+        for name, (shape, dtype) in layout['columns'].items():
+            column = np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'), mode='r+')
+            if column.shape != tuple(shape) or column.dtype != np.dtype(dtype):
+                raise ValueError("The column " + name + " stored in " + self.directory +
+                                 " does not match its layout")
+            self.columns[name] = column
+        self.has_discount = 'discount' in self.columns
+        self.layout = layout['columns']
+
+    def _check_layout(self, state, action, discount=None):
+        """
+            <Layout checking function>
+            Check that a transition matches the reattached columns, e.g. a run with a
+            different number of vehicles cannot write into the stored replay_buffer.
+        """
+        if is_sparse_observation(state) or self._column_specs(state, action, discount) != self.layout:
+            raise ValueError("The transitions do not match the replay_buffer stored in " + self.directory +
+                             ", its layout is " + json.dumps(self.layout))
+        self.layout = None
+
+    def _column_specs(self, state, action, discount=None):
+        """
+            Return the shape and data type of the columns of a transition, as stored
+            in layout.json ({name: [shape, dtype]}, without the sparse object columns).
+        """
+        specs = {}
+        if not is_sparse_observation(state):
+            obs = compact_observation(state)
+            obs = list(obs) if isinstance(state, (tuple, list)) else [obs]
+            for prefix in self.observation_prefixes:
+                for i, elem in enumerate(obs):
+                    specs[prefix + '_' + str(i)] = [[self.size] + list(elem.shape),
+                                                    np.dtype(self._column_dtype(elem)).str]
+        action = to_numpy(action)
+        specs['action'] = [[self.size] + list(action.shape), np.dtype(self._column_dtype(action)).str]
+        for name in ('reward', 'done') + (('discount',) if discount is not None else ()):
+            specs[name] = [[self.size], np.dtype(np.float32).str]
+        return specs
+
+    def _new_column(self, name, shape, dtype):
+        """
+            Create a zero-filled column, in memory or as a memory-mapped file.
+        """
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'),
+                                         mode='w+', dtype=dtype, shape=shape)
+
+    @staticmethod
+    def _column_dtype(data):
+        """
+            Floating point data is stored as float32 (the data type the GRL models
+            compute with), the rest keeps its own data type.
+        """
+        if np.issubdtype(data.dtype, np.floating):
+            return np.float32
+        return data.dtype
+
+    def _split_observation(self, observation):
+        """
+            Split an observation into the list of arrays stored in the columns.
+        """
+        observation = compact_observation(observation)
+        if self.obs_is_packed and not isinstance(observation, PackedObservation):
+            raise ValueError("The adjacency matrices stored in the replay_buffer must be binary")
+        if self.obs_is_sparse:
+            return [observation]
+        if self.obs_is_tuple:
+            return list(observation)
+        return [observation]
+
+    def _allocate(self, state, action, discount=None):
+        """
+            <Column allocation function>
+            Allocate the columns according to the first stored transition.
+        """
+        self.obs_is_tuple = isinstance(state, (tuple, list))
+        self.obs_is_sparse = is_sparse_observation(state)
+        self.obs_is_packed = isinstance(compact_observation(state), PackedObservation)
+        self.obs_length = len(self._split_observation(state))
+        if self.obs_is_sparse and self.directory is not None:
+            raise ValueError("Sparse graph observations cannot be stored in memory-mapped columns")
+
+        self.columns = {}
+        if self.obs_is_sparse:
+            for prefix in self.observation_prefixes:
+                for i in range(self.obs_length):
+                    self.columns[prefix + '_' + str(i)] = np.empty(self.size, dtype=object)
+        specs = self._column_specs(state, action, discount)
+        for name, (shape, dtype) in specs.items():
+            self.columns[name] = self._new_column(name, tuple(shape), dtype)
+        self.has_discount = discount is not None
+
+        # The layout is written last, an interrupted allocation is started again
+        if self.directory is not None:
+            layout = {'size': self.size, 'obs_is_tuple': self.obs_is_tuple,
+                      'obs_is_packed': self.obs_is_packed, 'obs_length': self.obs_length,
+                      'columns': specs}
+            with open(os.path.join(self.directory, self.layout_file), 'w') as f:
+                json.dump(layout, f)
+
+    def write(self, idx, state, action, reward, next_state, done, discount=None, stream=0):
+        """
+            <Data storage function>
+            Write a transition into the slot idx of the columns (the stream is only
+            used by the frame-indexed layout, see FrameStorage).
+        """
+        if self.columns is None:
+            self._allocate(state, action, discount)
+        elif self.layout is not None:
+            self._check_layout(state, action, discount)
+
+        for i, elem in enumerate(self._split_observation(state)):
+            self.columns['state_' + str(i)][idx] = elem
+        for i, elem in enumerate(self._split_observation(next_state)):
+            self.columns['next_state_' + str(i)][idx] = elem
+        self.columns['action'][idx] = to_numpy(action)
+        self.columns['reward'][idx] = reward
+        self.columns['done'][idx] = done
+        if self.has_discount:
+            self.columns['discount'][idx] = discount
+
+    def _decode_observation(self, obs):
+        """
+            Decode the gathered observation columns, rebuilding the tuple structure if
+            necessary.
+        """
+        if self.obs_is_sparse:
+            return stack_observations(list(obs[0]))
+        if self.obs_is_packed:
+            return unpack_observation(PackedObservation(*obs))
+        return obs if self.obs_is_tuple else obs[0]
+
+    def _gather_observation(self, prefix, indexes):
+        """
+            Gather a batch of observations.
+        """
+        obs = tuple(self.columns[prefix + '_' + str(i)][indexes]
+                    for i in range(self.obs_length))
+        return self._decode_observation(obs)
+
+    def gather(self, indexes):
+        """
+            <Data gathering function>
+            Gather the transitions stored in the slots given by indexes.
+
+            Parameters：
+            ------
+            indexes: slot indexes, either of shape [batch_size] (single-step learning) or
+            [batch_size, n_steps] (multi-step learning, each row is a temporally ordered
+            window of consecutive slots)
+
+            Returns:
+            ------
+            states, actions, rewards, next_states, dones (as collate_transitions), and the
+            discounts if the transitions hold them (single-step learning)
+        """
+        indexes = np.asarray(indexes)
+        if indexes.ndim == 1:
+            first = last = indexes
+            rewards = self.columns['reward'][indexes]
+        else:
+            first = indexes[:, 0]
+            last = indexes[:, -1]
+            rewards = self.columns['reward'][indexes]
+
+        states = self._gather_observation('state', first)
+        actions = self.columns['action'][first]
+        next_states = self._gather_observation('next_state', last)
+        dones = self.columns['done'][last]
+
+        if self.has_discount and indexes.ndim == 1:
+            return states, actions, rewards, next_states, dones, self.columns['discount'][indexes]
+        return states, actions, rewards, next_states, dones
+
+
+class FrameStorage(ColumnarStorage):
+    """
+        Frame-indexed variant of the columnar storage, every observation is stored once.
+        During training the state of a transition is the next_state of the previous
+        transition of the same stream (the same object), a stream being the
+        environment or the actor the transitions come from. Only the states are stored
+        in the columns, and the next_slot column gives the slot whose state is the
+        next_state of each transition. With a single stream, this is the following
+        slot; with several streams writing in turns, the slot of the next transition
+        of the same stream. The n-step transitions (s_t, ..., s_t+k) written by the
+        NStepWriter are linked to the slot of the later transition whose state is
+        s_t+k.
+
+        The next_states that are not the state of a stored slot (end of an episode,
+        and the newest transition of each stream whose successor is not stored yet)
+        are kept aside in a dictionary indexed by slot, they are few compared to the
+        size.
+    """
+
+    # Observation columns of a transition
+    observation_prefixes = ('state',)
+
     def __init__(self, size):
+        """
+            <Constructor>
+
+            Parameters：
+            ------
+            size: the number of transitions that can be stored
+        """
+        super(FrameStorage, self).__init__(size)
+        self.next_states = {}  # slot -> compact next_state not stored as the state of a slot
+        # stream -> {id(next_state): (next_state (as given), slots)}, the next_states
+        # of the newest transitions of the stream in insertion order, waiting for a
+        # transition of the stream to continue from them
+        self.waiting = {}
+        self.waiting_slots = {}  # slot -> (stream, id(next_state)) of the waiting slots
+
+    def _allocate(self, state, action, discount=None):
+        """
+            <Column allocation function>
+            Allocate the columns according to the first stored transition.
+        """
+        super(FrameStorage, self)._allocate(state, action, discount)
+        # Slot whose state is the next_state of each transition (-1 if kept in next_states)
+        self.columns['next_slot'] = np.full(self.size, -1, dtype=np.int64)
+
+    def write(self, idx, state, action, reward, next_state, done, discount=None, stream=0):
+        """
+            <Data storage function>
+            Write a transition of the stream into the slot idx of the columns.
+        """
+        if self.columns is None:
+            self._allocate(state, action, discount)
+
+        # The transition previously stored in this slot is overwritten, the slots
+        # linked to it are older and have been overwritten before
+        self.next_states.pop(idx, None)
+        if idx in self.waiting_slots:
+            old_stream, key = self.waiting_slots.pop(idx)
+            self.waiting[old_stream][key][1].remove(idx)
+
+        # The state continues the transitions of the stream whose next_state it is,
+        # their next_state is now the state of this slot. The next_states waiting
+        # before it will not be continued any more (e.g. terminal states).
+        waiting = self.waiting.setdefault(stream, collections.OrderedDict())
+        entry = waiting.get(id(state))
+        if entry is not None and entry[0] is state:
+            while True:
+                key, (_, slots) = waiting.popitem(last=False)
+                for slot in slots:
+                    del self.waiting_slots[slot]
+                    if key == id(state):
+                        self.columns['next_slot'][slot] = idx
+                        del self.next_states[slot]
+                if key == id(state):
+                    break
+
+        for i, elem in enumerate(self._split_observation(state)):
+            self.columns['state_' + str(i)][idx] = elem
+        self.columns['action'][idx] = to_numpy(action)
+        self.columns['reward'][idx] = reward
+        self.columns['done'][idx] = done
+        if self.has_discount:
+            self.columns['discount'][idx] = discount
+
+        # Kept until a later transition of the stream continues from it
+        self.columns['next_slot'][idx] = -1
+        self.next_states[idx] = self._split_observation(next_state)
+        waiting.setdefault(id(next_state), (next_state, []))[1].append(idx)
+        self.waiting_slots[idx] = (stream, id(next_state))
+
+    def _gather_next_states(self, indexes):
+        """
+            Gather the next_states of the given slots: the states of the linked slots,
+            replaced by the stored next_states where the chain is interrupted.
+        """
+        next_slots = self.columns['next_slot'][indexes]
+        obs = [self.columns['state_' + str(i)][np.maximum(next_slots, 0)] for i in range(self.obs_length)]
+
+        for row in np.flatnonzero(next_slots < 0):
+            for i, elem in enumerate(self.next_states[indexes[row]]):
+                obs[i][row] = elem
+
+        return self._decode_observation(tuple(obs))
+
+    def gather(self, indexes):
+        """
+            <Data gathering function>
+            Gather the transitions stored in the slots given by indexes (same format as
+            ColumnarStorage.gather).
+        """
+        indexes = np.asarray(indexes)
+        if indexes.ndim == 1:
+            first = last = indexes
+        else:
+            first = indexes[:, 0]
+            last = indexes[:, -1]
+        rewards = self.columns['reward'][indexes]
+
+        states = self._gather_observation('state', first)
+        actions = self.columns['action'][first]
+        next_states = self._gather_next_states(last)
+        dones = self.columns['done'][last]
+
+        if self.has_discount and indexes.ndim == 1:
+            return states, actions, rewards, next_states, dones, self.columns['discount'][indexes]
+        return states, actions, rewards, next_states, dones
+
+
+class ReplayBuffer(object):
+    def __init__(self, size, columnar=False, frame_indexed=False, directory=None, resume=False):
         """
             <Constructor>
             Define replay buffer
@@ -15,13 +671,43 @@ class ReplayBuffer(object):
             ------
             size: The maximum capacity of the replay_buffer, when the capacity is exceeded,
             the new data will replace the old data.
+            columnar: whether to store the data in preallocated numpy columns
+            (see ColumnarStorage). In columnar mode, sample returns already stacked batch
+            arrays instead of a list of transition tuples.
+            frame_indexed: whether to store every observation once (see FrameStorage),
+            the state of each added transition should be the next_state of the previous
+            one of the same stream, unless a new episode begins. Implies the columnar mode.
+            directory: if given, the columns are memory-mapped files of this directory
+            (e.g. under the save directory of the run). Implies the columnar mode, the
+            frame-indexed layout is not supported.
+            resume: whether to continue from the transitions stored in the directory by
+            a previous replay_buffer (they must have the same layout), otherwise the
+            directory is cleared.
         """
+        if frame_indexed and directory is not None:
+            raise ValueError("The frame-indexed replay_buffer cannot be memory-mapped")
+        if directory is not None and not resume:
+            clear_directory(directory)
         self.size = size  # Define the maximum size of the replay_buffer
-        self.buffer = []  # Define the replay_buffer storage list (storage core)
+        self.columnar = columnar or frame_indexed or directory is not None  # Define the storage mode
+        # Define the replay_buffer storage list (storage core)
+        if frame_indexed:
+            self.buffer = FrameStorage(size)
+        elif self.columnar:
+            self.buffer = ColumnarStorage(size, directory)
+        else:
+            self.buffer = []
         self.index = 0  # Define the replay_buffer index
         self.length = 0  # Defines the current length of the replay_buffer (run step)
+        self.rng = np.random.default_rng()  # Define the random generator used for sampling
 
-    def add(self, state, action, reward, next_state, done):
+        # Memory-mapped index and length, updated after every stored transition
+        self.counters = None
+        if directory is not None:
+            self.counters = open_array(directory, 'counters', (2,), np.int64)
+            self.index, self.length = int(self.counters[0]), int(self.counters[1])
+
+    def add(self, state, action, reward, next_state, done, discount=None, stream=0):
         """
             <Data storage function>
             Store data in the replay buffer
@@ -33,15 +719,25 @@ class ReplayBuffer(object):
             reward: the reward received for performing the current action
             next_state: the next state after the current action
             done: whether to terminate
+            discount: the discount factor of the target value of n-step transitions
+            (see NStepWriter), returned by sample after the dones
+            stream: the index of the environment (or actor) the transition comes from,
+            the frame-indexed layout links the transitions of the same stream
         """
-        # Combine the above data and store it in [data]
-        data = (state, action, reward, next_state, done)
-
-        # Store data
-        if self.index >= len(self.buffer):
-            self.buffer.append(data)
+        if self.columnar:
+            self.buffer.write(self.index, state, action, reward, next_state, done, discount, stream)
         else:
-            self.buffer[self.index] = data
+            # Combine the above data and store it in [data], the observations are
+            # stored in their compact form and decoded per sampled batch
+            data = (compact_observation(state), action, reward, compact_observation(next_state), done)
+            if discount is not None:
+                data += (discount,)
+
+            # Store data
+            if self.index >= len(self.buffer):
+                self.buffer.append(data)
+            else:
+                self.buffer[self.index] = data
 
         # Index update
         self.index = (self.index + 1) % self.size
@@ -49,6 +745,9 @@ class ReplayBuffer(object):
         # Length update
         self.length = min(self.length + 1, self.size)
 
+        if self.counters is not None:
+            self.counters[:] = (self.index, self.length)
+
     def sample(self, batch_size, n_steps=1):
         """
             <Data sampling function>
@@ -63,7 +762,20 @@ class ReplayBuffer(object):
         # samples initialization, uniform with PER form to record weights and indexes
         # common replay_buffer, indexes randomly generated, weights all-1 matrix
         samples = {'weights': np.ones(shape=batch_size, dtype=np.float32),
-                   'indexes': np.random.choice(self.length - n_steps + 1, batch_size, replace=False)}
+                   'indexes': sample_indexes(self.length - n_steps + 1, batch_size, self.rng)}
+
+        # Columnar storage, the batch is gathered directly from the columns
+        if self.columnar:
+            # Once the buffer is full, the oldest data is at self.index, the
+            # windows start from there so that they never cross the write pointer
+            start = self.index if self.length == self.size else 0
+            samples['indexes'] = (samples['indexes'] + start) % self.size
+            if n_steps == 1:
+                sample_data = self.buffer.gather(samples['indexes'])
+            else:
+                windows = (samples['indexes'][:, None] + np.arange(n_steps)) % self.size
+                sample_data = self.buffer.gather(windows)
+            return samples, sample_data
 
         # Data sampling
         sample_data = []
@@ -77,4 +789,3 @@ class ReplayBuffer(object):
                 sample_data.append(data_i)
 
         return samples, sample_data
-
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+import torch
+
+from GRL_Library.common.inference import InferenceModel
+from GRL_Net.DenseGraph import dense_chain
+from GRL_Net.Model_Discrete.Q_Net import Graph_Model
+
+
+class TestTracedInference(unittest.TestCase):
+    """Tests the traced copy of the InferenceModel."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.model = Graph_Model(5, 3, 2)
+        self.inference = InferenceModel(trace=True)
+        self.observation = (rng.random((5, 3)),
+                            (rng.random((5, 5)) > 0.5).astype(np.float64),
+                            np.ones(5))
+
+    def test_dense_graph(self):
+        """The model is traced again after its graph layers are swapped."""
+        output = self.inference(self.model, self.observation)
+        traced_model = self.inference.traced_model
+        self.assertEqual(traced_model.GraphConv.original_name, 'GCNConv')
+
+        dense_chain.to_dense_graph(self.model)
+        dense_output = self.inference(self.model, self.observation)
+        self.assertIsNot(self.inference.traced_model, traced_model)
+        self.assertEqual(self.inference.traced_model.GraphConv.original_name,
+                         'DenseGCNConv')
+        self.assertTrue(torch.allclose(output, dense_output, atol=1e-5))
+
+    def test_unchanged_model(self):
+        """The traced copy is reused while the model is unchanged."""
+        self.inference(self.model, self.observation)
+        traced_model = self.inference.traced_model
+        self.inference(self.model, self.observation)
+        self.assertIs(self.inference.traced_model, traced_model)
+
+
+if __name__ == '__main__':
+    unittest.main()
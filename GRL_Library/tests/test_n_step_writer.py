@@ -0,0 +1,132 @@
+import unittest
+
+import numpy as np
+
+from GRL_Library.common.n_step_writer import NStepWriter
+from GRL_Library.common.replay_buffer import ReplayBuffer
+
+
+def make_observation(rng):
+    """Return a dense graph observation (X_in, A_in_Dense, RL_indice)."""
+    return (rng.random((4, 2)),
+            (rng.random((4, 4)) > 0.5).astype(np.float64),
+            np.ones(4))
+
+
+class TestNStepWriter(unittest.TestCase):
+    """Tests the n-step transitions emitted by the NStepWriter."""
+
+    def setUp(self):
+        self.gamma = 0.5
+        self.writer = NStepWriter(3, self.gamma)
+        self.states = ["s{}".format(i) for i in range(10)]
+
+    def step(self, t, reward, done=False):
+        return self.writer.add(self.states[t], t, reward,
+                               self.states[t + 1], done)
+
+    def test_complete_returns(self):
+        """The transitions are emitted once their n-step return is complete."""
+        self.assertEqual(self.step(0, 1.), [])
+        self.assertEqual(self.step(1, 2.), [])
+        transitions = self.step(2, 4.)
+        self.assertEqual(len(transitions), 1)
+
+        state, action, R, next_state, done, discount = transitions[0]
+        self.assertEqual(state, "s0")
+        self.assertEqual(action, 0)
+        self.assertAlmostEqual(R, 1. + 0.5 * 2. + 0.25 * 4.)
+        self.assertEqual(next_state, "s3")
+        self.assertFalse(done)
+        self.assertAlmostEqual(discount, self.gamma ** 3)
+
+        transitions = self.step(3, 8.)
+        self.assertEqual(len(transitions), 1)
+        self.assertEqual(transitions[0][0], "s1")
+        self.assertAlmostEqual(transitions[0][2], 2. + 0.5 * 4. + 0.25 * 8.)
+        self.assertEqual(transitions[0][3], "s4")
+
+    def test_done_flush(self):
+        """The pending transitions are truncated at the end of an episode."""
+        self.step(0, 1.)
+        transitions = self.step(1, 2., done=True)
+        self.assertEqual(len(transitions), 2)
+
+        # s0: two remaining steps
+        self.assertEqual(transitions[0][0], "s0")
+        self.assertAlmostEqual(transitions[0][2], 1. + 0.5 * 2.)
+        self.assertEqual(transitions[0][3], "s2")
+        self.assertTrue(transitions[0][4])
+        self.assertAlmostEqual(transitions[0][5], self.gamma ** 2)
+
+        # s1: one remaining step
+        self.assertEqual(transitions[1][0], "s1")
+        self.assertAlmostEqual(transitions[1][2], 2.)
+        self.assertEqual(transitions[1][3], "s2")
+        self.assertTrue(transitions[1][4])
+        self.assertAlmostEqual(transitions[1][5], self.gamma)
+
+        # nothing is pending any more
+        self.assertEqual(self.writer.flush(), [])
+
+    def test_truncated_flush(self):
+        """An episode interrupted without done bootstraps its pending returns."""
+        self.step(0, 1.)
+        self.step(1, 2.)
+
+        # a new episode starts from a state that is not the last next_state
+        transitions = self.writer.add("r0", 0, 4., "r1", False)
+        self.assertEqual(len(transitions), 2)
+        self.assertEqual([elem[0] for elem in transitions], ["s0", "s1"])
+        self.assertEqual([elem[3] for elem in transitions], ["s2", "s2"])
+        self.assertEqual([elem[4] for elem in transitions], [False, False])
+        self.assertAlmostEqual(transitions[0][2], 1. + 0.5 * 2.)
+        self.assertAlmostEqual(transitions[0][5], self.gamma ** 2)
+        self.assertAlmostEqual(transitions[1][2], 2.)
+        self.assertAlmostEqual(transitions[1][5], self.gamma)
+
+        # the transition of the new episode is still pending
+        self.assertEqual(len(self.writer.pending), 1)
+        self.assertEqual(self.writer.pending[0][0], "r0")
+
+
+class TestFrameIndexedNStep(unittest.TestCase):
+    """Tests the n-step transitions stored in the frame-indexed replay_buffer."""
+
+    def test_next_states(self):
+        """The next_states are gathered from the linked slots of each stream."""
+        rng = np.random.default_rng(0)
+        num_streams = 3
+        n_steps = 3
+        buffer = ReplayBuffer(size=500, frame_indexed=True)
+        writers = [NStepWriter(n_steps, 0.9) for _ in range(num_streams)]
+        observations = [make_observation(rng) for _ in range(num_streams)]
+        expected = {}
+        num_done = 0
+
+        for step in range(300):
+            stream = step % num_streams
+            next_observation = make_observation(rng)
+            done = step % 41 == 40
+            num_done += done
+            for transition in writers[stream].add(
+                    observations[stream], np.zeros(4, dtype=np.int64), 1.,
+                    next_observation, done):
+                expected[buffer.index] = transition[3]
+                buffer.add(*transition, stream=stream)
+            observations[stream] = make_observation(rng) if done else next_observation
+
+        indexes = np.arange(buffer.length)
+        next_states = buffer.buffer.gather(indexes)[3]
+        for idx in indexes:
+            np.testing.assert_allclose(next_states[0][idx], expected[idx][0])
+            np.testing.assert_allclose(next_states[1][idx], expected[idx][1])
+
+        # only the terminal next_states and the newest transitions of each stream
+        # are kept aside
+        self.assertLessEqual(len(buffer.buffer.next_states),
+                             (num_done + num_streams) * n_steps)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import types
+import unittest
+
+import numpy as np
+
+from GRL_Library.agent.Continuous import PPO_agent as Continuous_PPO_agent
+from GRL_Library.agent.Discrete import PPO_agent as Discrete_PPO_agent
+
+
+class TestComputeAdvantage(unittest.TestCase):
+    """Tests the GAE advantage of the PPO agents."""
+
+    def setUp(self):
+        self.agent = types.SimpleNamespace(gamma=0.9, GAE_lambda=0.9)
+        self.rewards = np.array([1., 1., 1., 100., 100.])
+        self.dones = np.array([0., 0., 1., 0., 0.])
+
+    def compute_advantage(self, module, rewards, values, dones):
+        return module.PPO.compute_advantage(self.agent, rewards, values, dones)
+
+    def test_episode_end(self):
+        """The advantage does not run into the next episode."""
+        values = np.zeros((5, 1))
+        for module in (Discrete_PPO_agent, Continuous_PPO_agent):
+            advantage = self.compute_advantage(
+                module, self.rewards, values, self.dones)
+            # the last step of the episode only gets its own reward
+            self.assertAlmostEqual(advantage[2, 0], 1.)
+            self.assertAlmostEqual(advantage[1, 0], 1. + 0.81)
+            self.assertAlmostEqual(advantage[3, 0], 100.)
+            self.assertAlmostEqual(advantage[4, 0], 0.)
+
+    def test_vector_rollout(self):
+        """The environments of a VectorEnv rollout are scanned separately."""
+        rewards = np.stack([self.rewards, self.rewards[::-1]], axis=1)
+        dones = np.stack([self.dones, np.zeros(5)], axis=1)
+        values = np.random.default_rng(0).random((5, 2, 3))
+        for module in (Discrete_PPO_agent, Continuous_PPO_agent):
+            advantage = self.compute_advantage(module, rewards, values, dones)
+            for b in range(2):
+                expected = self.compute_advantage(
+                    module, rewards[:, b], values[:, b], dones[:, b])
+                np.testing.assert_allclose(advantage[:, b], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from GRL_Library.common.prioritized_replay_buffer import PrioritizedReplayBuffer
+from GRL_Library.common.replay_buffer import ReplayBuffer
+
+
+def make_transition(num_nodes):
+    """Return a transition between dense graph observations of num_nodes nodes."""
+    def observation():
+        return (np.random.rand(num_nodes, 3),
+                (np.random.rand(num_nodes, num_nodes) > 0.5).astype(np.float64),
+                np.ones(num_nodes))
+    return observation(), np.zeros(num_nodes, dtype=np.int64), 1., observation(), False
+
+
+class TestMemoryMappedReplayBuffer(unittest.TestCase):
+    """Tests resuming the memory-mapped replay_buffers."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_resume(self, create):
+        buffer = create(resume=False)
+        for _ in range(5):
+            buffer.add(*make_transition(4))
+
+        # the stored transitions are reattached when resuming
+        buffer = create(resume=True)
+        self.assertEqual(buffer.buffer.columns['reward'].shape[0], 16)
+        self.assertTrue(np.all(buffer.buffer.columns['reward'][:5] == 1.))
+
+        # transitions of another number of vehicles are rejected
+        self.assertRaises(ValueError, buffer.add, *make_transition(5))
+
+        # a new run starts from an empty directory
+        buffer = create(resume=False)
+        self.assertIsNone(buffer.buffer.columns)
+        buffer.add(*make_transition(5))
+        self.assertEqual(buffer.buffer.columns['state_0'].shape, (16, 5, 3))
+
+    def test_replay_buffer(self):
+        self.check_resume(lambda resume: ReplayBuffer(
+            16, directory=self.directory, resume=resume))
+        self.assertEqual(ReplayBuffer(16, directory=self.directory, resume=True).length, 1)
+
+    def test_prioritized_replay_buffer(self):
+        self.check_resume(lambda resume: PrioritizedReplayBuffer(
+            16, 0.6, 0.4, 0.001, 1e-5, directory=self.directory, resume=resume))
+        self.assertEqual(PrioritizedReplayBuffer(
+            16, 0.6, 0.4, 0.001, 1e-5, directory=self.directory, resume=True).size, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Dense graph layers
+
+Replace the torch_geometric graph layers of a model by their dense
+counterparts, e.g. after building a Graph_Model:
+
+    from GRL_Net.DenseGraph import dense_chain
+    dense_chain.to_dense_graph(GRL_Net)
+"""
+
+from torch_geometric.nn import GCNConv, GATv2Conv
+
+from GRL_Net.DenseGraph.dense_graph_conv import DenseGCNConv, DenseGATv2Conv
+
+
+def to_dense_graph(module):
+    """Compute the graph layers of given module on the dense adjacency matrix
+
+    Currently this fn. only supports GCNConv and GATv2Conv. The dense layers
+    share the parameters of the replaced layers, so the model output and
+    its state_dict are unchanged.
+    """
+
+    def func_to_dense_graph(module):
+        if isinstance(module, GCNConv):
+            return DenseGCNConv(module)
+        elif isinstance(module, GATv2Conv):
+            return DenseGATv2Conv(module)
+        else:
+            return module
+
+    _map_modules(func_to_dense_graph, module)
+
+
+def _map_modules(func, module):
+    for name, child in module.named_children():
+        new_child = func(child)
+        if new_child is child:
+            # It's not a graph layer, so recurse
+            _map_modules(func, child)
+        else:
+            module._modules[name] = new_child
@@ -0,0 +1,172 @@
+"""Dense graph layers
+
+Graph layers computed on the dense (batched) adjacency matrix with matmuls and a
+masked softmax, instead of the scatter/gather message passing of torch_geometric.
+For the small graphs of the GRL tasks (tens of vehicles), building the COO edge
+index and scattering the messages costs more than the arithmetic itself.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch_geometric.utils import dense_to_sparse, to_dense_adj
+
+
+def graph_convolution(layer, x, adj):
+    """Apply a graph layer to the node features
+
+    The dense layers work directly on the dense adjacency matrix, the
+    torch_geometric layers get the sparse adjacency matrix COO (2xnum).
+    Sparse observations already provide the COO matrix (integer tensor),
+    which the dense layers turn into a dense adjacency matrix.
+
+    Args:
+        layer (nn.Module): GCNConv/GATv2Conv or their dense counterparts.
+        x (torch.Tensor): node features ([B*N]xF, the graphs of a batch are
+            flattened as in the GRL models).
+        adj (torch.Tensor): dense adjacency matrix (NxN or [B]xBxNxN), or sparse
+            adjacency matrix COO (2xnum) of a sparse observation.
+    """
+    sparse = not torch.is_floating_point(adj)
+    if isinstance(layer, (DenseGCNConv, DenseGATv2Conv)):
+        if sparse:
+            adj = to_dense_adj(adj, max_num_nodes=x.shape[0])[0]
+        return layer(x, adj)
+    if sparse:
+        return layer(x, adj)
+    # Several batch dimensions (e.g. a minibatch of the stacked observations of a VectorEnv)
+    adj = adj.reshape((-1,) + adj.shape[-2:]) if adj.dim() > 3 else adj
+    adj_sparse, _ = dense_to_sparse(adj)
+    return layer(x, adj_sparse)
+
+
+def _target_adjacency(adj, dtype):
+    """Binary adjacency indexed as [target, source], adj[j, i] != 0 is the edge j -> i."""
+    return (adj.transpose(-1, -2) != 0).to(dtype)
+
+
+class DenseGCNConv(nn.Module):
+    """Dense counterpart of torch_geometric.nn.GCNConv
+
+    The parameters are shared with the given layer (same names in the
+    state_dict), so both layers compute the same output.
+
+    Args:
+        conv (GCNConv): the torch_geometric layer to be computed densely.
+    """
+
+    def __init__(self, conv):
+        super(DenseGCNConv, self).__init__()
+        if getattr(conv, 'cached', False):
+            raise ValueError("Cached GCNConv is not supported")
+        self.in_channels = conv.in_channels
+        self.out_channels = conv.out_channels
+        self.add_self_loops = conv.add_self_loops
+        self.normalize = conv.normalize
+
+        self.lin = conv.lin
+        self.bias = conv.bias
+
+    def forward(self, x, adj):
+        num_nodes = adj.shape[-1]
+        x = self.lin(x)
+        x = x.reshape(adj.shape[:-2] + (num_nodes, x.shape[-1]))
+
+        # Every edge has weight 1, as in the models the edge_index is passed without weights
+        adj = _target_adjacency(adj, x.dtype)
+        if self.normalize:
+            if self.add_self_loops:
+                # Without edge weights, GCNConv gives every (remaining) self loop weight 1
+                adj = torch.maximum(adj, torch.eye(num_nodes, dtype=adj.dtype, device=adj.device))
+            # Symmetric normalization with the in-degree of the target nodes
+            deg = adj.sum(dim=-1)
+            deg_inv_sqrt = deg.pow(-0.5)
+            deg_inv_sqrt = deg_inv_sqrt.masked_fill(deg_inv_sqrt == float('inf'), 0)
+            adj = deg_inv_sqrt.unsqueeze(-1) * adj * deg_inv_sqrt.unsqueeze(-2)
+
+        out = torch.matmul(adj, x)
+        out = out.reshape(-1, self.out_channels)
+
+        if self.bias is not None:
+            out = out + self.bias
+
+        return out
+
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__, self.in_channels, self.out_channels)
+
+
+class DenseGATv2Conv(nn.Module):
+    """Dense counterpart of torch_geometric.nn.GATv2Conv
+
+    The attention scores of all the node pairs are computed at once and the
+    pairs without an edge are masked before the softmax. The parameters are
+    shared with the given layer (same names in the state_dict), so both layers
+    compute the same output.
+
+    Args:
+        conv (GATv2Conv): the torch_geometric layer to be computed densely.
+            Edge features (edge_dim) are not supported.
+    """
+
+    def __init__(self, conv):
+        super(DenseGATv2Conv, self).__init__()
+        if conv.edge_dim is not None:
+            raise ValueError("GATv2Conv with edge features is not supported")
+        self.in_channels = conv.in_channels
+        self.out_channels = conv.out_channels
+        self.heads = conv.heads
+        self.concat = conv.concat
+        self.negative_slope = conv.negative_slope
+        self.dropout = conv.dropout
+        self.add_self_loops = conv.add_self_loops
+        self.share_weights = conv.share_weights
+
+        self.lin_l = conv.lin_l
+        self.lin_r = conv.lin_r
+        self.att = conv.att
+        self.res = getattr(conv, 'res', None)
+        self.bias = conv.bias
+
+    def forward(self, x, adj):
+        H, C = self.heads, self.out_channels
+        num_nodes = adj.shape[-1]
+        node_shape = adj.shape[:-2] + (num_nodes, H, C)
+
+        # Source (x_l) and target (x_r) features
+        x_l = self.lin_l(x).reshape(node_shape)
+        x_r = x_l if self.share_weights else self.lin_r(x).reshape(node_shape)
+
+        # Attention scores of the edges j -> i, indexed as [..., i, j, H]
+        e = x_r.unsqueeze(-3) + x_l.unsqueeze(-4)
+        e = F.leaky_relu(e, self.negative_slope)
+        alpha = (e * self.att).sum(dim=-1)
+
+        # Masked softmax over the incoming edges of each node
+        mask = adj.transpose(-1, -2) != 0
+        if self.add_self_loops:
+            mask = mask | torch.eye(num_nodes, dtype=torch.bool, device=adj.device)
+        mask = mask.unsqueeze(-1)
+        alpha = alpha.masked_fill(~mask, float('-inf'))
+        alpha = torch.softmax(alpha, dim=-2)
+        # Nodes without incoming edges receive no messages
+        alpha = alpha.masked_fill(~mask, 0)
+        alpha = F.dropout(alpha, p=self.dropout, training=self.training)
+
+        out = torch.einsum('...ijh,...jhc->...ihc', alpha, x_l)
+        if self.concat:
+            out = out.reshape(-1, H * C)
+        else:
+            out = out.mean(dim=-2).reshape(-1, C)
+
+        if self.res is not None:
+            out = out + self.res(x)
+
+        if self.bias is not None:
+            out = out + self.bias
+
+        return out
+
+    def __repr__(self):
+        return '{}({}, {}, heads={})'.format(self.__class__.__name__, self.in_channels,
+                                             self.out_channels, self.heads)
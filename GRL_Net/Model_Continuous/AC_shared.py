@@ -3,7 +3,8 @@ import numpy as np
 import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv
-from torch_geometric.utils import dense_to_sparse
+from GRL_Net.DenseGraph.dense_graph_conv import graph_convolution
+from GRL_Net.SparseGraph.sparse_observation import is_sparse_observation, sparse_transmission, scatter_agents
 
 
 def datatype_transmission(states, device):
@@ -12,12 +13,17 @@ def datatype_transmission(states, device):
         float32 Tensor data type that pytorch can accept.
         2.Pay attention: Depending on the characteristics of the data structure of
         the observation, the function needs to be changed accordingly.
+        3.Sparse observations (X_in, A_in_Sparse, RL_indice, node_map) keep the
+        edges and the node map as int64 indexes, dense observations have no node map.
     """
+    if is_sparse_observation(states):
+        return sparse_transmission(states, device)
+
     features = torch.as_tensor(states[0], dtype=torch.float32, device=device)
     adjacency = torch.as_tensor(states[1], dtype=torch.float32, device=device)
     mask = torch.as_tensor(states[2], dtype=torch.float32, device=device)
 
-    return features, adjacency, mask
+    return features, adjacency, mask, None
 
 
 # ------Graph Model------#
@@ -71,7 +77,7 @@ class Graph_Model(nn.Module):
             reinforcement learning index of controlled vehicles.
         """
 
-        X_in, A_in_Dense, RL_indice = datatype_transmission(observation, self.device)
+        X_in, A_in_Dense, RL_indice, node_map = datatype_transmission(observation, self.device)
 
         # Encoder
         X = self.encoder_1(X_in)
@@ -80,8 +86,7 @@ class Graph_Model(nn.Module):
         X = F.relu(X)
 
         # GCN
-        A_in_Sparse, _ = dense_to_sparse(A_in_Dense)
-        X_graph = self.GraphConv(X, A_in_Sparse)
+        X_graph = graph_convolution(self.GraphConv, X, A_in_Dense)
         X_graph = F.relu(X_graph)
         X_graph = self.GraphConv_Dense(X_graph)
         X_graph = F.relu(X_graph)
@@ -108,7 +113,8 @@ class Graph_Model(nn.Module):
         # Action limitation
         action = torch.clamp(action, min=self.action_min, max=self.action_max)
 
-        return action, log_probs, value
+        return scatter_agents(action, node_map), scatter_agents(log_probs, node_map), \
+            scatter_agents(value, node_map)
 
 
 # ------NonGraph Model------#
@@ -151,7 +157,7 @@ class NonGraph_Model(nn.Module):
             index of controlled vehicles.
         """
 
-        X_in, _, RL_indice = datatype_transmission(observation, self.device)
+        X_in, _, RL_indice, node_map = datatype_transmission(observation, self.device)
 
         # Policy
         X_policy = self.policy_1(X_in)
@@ -172,4 +178,5 @@ class NonGraph_Model(nn.Module):
         # Action limitation
         action = torch.clamp(action, min=self.action_min, max=self.action_max)
 
-        return action, log_probs, value
+        return scatter_agents(action, node_map), scatter_agents(log_probs, node_map), \
+            scatter_agents(value, node_map)
@@ -3,7 +3,9 @@ import numpy as np
 import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv
-from torch_geometric.utils import dense_to_sparse
+from GRL_Net.DenseGraph.dense_graph_conv import graph_convolution
+from GRL_Net.SparseGraph.sparse_observation import is_sparse_observation, sparse_transmission, \
+    graph_batch_shape, scatter_agents, gather_agents
 
 
 def datatype_transmission(states, device):
@@ -12,12 +14,17 @@ def datatype_transmission(states, device):
         float32 Tensor data type that pytorch can accept.
         2.Pay attention: Depending on the characteristics of the data structure of
         the observation, the function needs to be changed accordingly.
+        3.Sparse observations (X_in, A_in_Sparse, RL_indice, node_map) keep the
+        edges and the node map as int64 indexes, dense observations have no node map.
     """
+    if is_sparse_observation(states):
+        return sparse_transmission(states, device)
+
     features = torch.as_tensor(states[0], dtype=torch.float32, device=device)
     adjacency = torch.as_tensor(states[1], dtype=torch.float32, device=device)
     mask = torch.as_tensor(states[2], dtype=torch.float32, device=device)
 
-    return features, adjacency, mask
+    return features, adjacency, mask, None
 
 
 # Defining Ornstein-Uhlenbeck noise for stochastic exploration processes
@@ -91,9 +98,14 @@ class Graph_Actor_Model(nn.Module):
             (NxN) (original input)
             4.A_in_Sparse is the sparse adjacency matrix COO (2xnum), RL_indice is the
             reinforcement learning index of controlled vehicles.
+            5.A batch of observations (BxNxF, BxNxN, BxN) is processed in a single pass:
+            the graphs are merged into one block-diagonal graph of B*N nodes and the
+            output is reshaped to BxNx(output dimension).
         """
 
-        X_in, A_in_Dense, RL_indice = datatype_transmission(observation, self.device)
+        X_in, A_in_Dense, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Encoder
         X = self.encoder_1(X_in)
@@ -102,8 +114,7 @@ class Graph_Actor_Model(nn.Module):
         X = F.relu(X)
 
         # GCN
-        A_in_Sparse, _ = dense_to_sparse(A_in_Dense)
-        X_graph = self.GraphConv(X, A_in_Sparse)
+        X_graph = graph_convolution(self.GraphConv, X, A_in_Dense)
         X_graph = F.relu(X_graph)
         X_graph = self.GraphConv_Dense(X_graph)
         X_graph = F.relu(X_graph)
@@ -125,7 +136,7 @@ class Graph_Actor_Model(nn.Module):
         mean = 0.5 * (self.action_max + self.action_min)
         action = amplitude * torch.tanh(pi) + mean
 
-        return action
+        return scatter_agents(action, node_map).reshape(batch_shape + (self.num_agents, self.num_outputs))
 
 
 # ------Graph Critic Model------ #
@@ -176,20 +187,24 @@ class Graph_Critic_Model(nn.Module):
             (NxN) (original input)
             4.A_in_Sparse is the sparse adjacency matrix COO (2xnum), RL_indice is the
             reinforcement learning index of controlled vehicles.
+            5.A batch of observations (BxNxF, BxNxN, BxN) is processed in a single pass:
+            the graphs are merged into one block-diagonal graph of B*N nodes and the
+            output is reshaped to BxNx(output dimension).
         """
 
-        X_in, A_in_Dense, RL_indice = datatype_transmission(observation, self.device)
+        X_in, A_in_Dense, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Encoder
-        X_in = torch.cat((X_in, action), 1)
+        X_in = torch.cat((X_in, gather_agents(action.reshape(-1, action.shape[-1]), node_map)), 1)
         X = self.encoder_1(X_in)
         X = F.relu(X)
         X = self.encoder_2(X)
         X = F.relu(X)
 
         # GCN
-        A_in_Sparse, _ = dense_to_sparse(A_in_Dense)
-        X_graph = self.GraphConv(X, A_in_Sparse)
+        X_graph = graph_convolution(self.GraphConv, X, A_in_Dense)
         X_graph = F.relu(X_graph)
         X_graph = self.GraphConv_Dense(X_graph)
         X_graph = F.relu(X_graph)
@@ -206,7 +221,7 @@ class Graph_Critic_Model(nn.Module):
         # Value calculation
         V = self.value(X_policy)
 
-        return V
+        return scatter_agents(V, node_map).reshape(batch_shape + (self.num_agents, 1))
 
 
 # ------NonGraph Actor Model------ #
@@ -246,9 +261,13 @@ class NonGraph_Actor_Model(nn.Module):
             2.Observation is the state observation matrix, including X_in, and RL_indice.
             3.X_in is the node feature matrix, RL_indice is the reinforcement learning
             index of controlled vehicles.
+            4.A batch of observations (BxNxF, BxN) is processed in a single pass and the
+            output is reshaped to BxNx(output dimension).
         """
 
-        X_in, _, RL_indice = datatype_transmission(observation, self.device)
+        X_in, _, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Policy
         X_policy = self.policy_1(X_in)
@@ -264,7 +283,7 @@ class NonGraph_Actor_Model(nn.Module):
         mean = 0.5 * (self.action_max + self.action_min)
         action = amplitude * torch.tanh(pi) + mean
 
-        return action
+        return scatter_agents(action, node_map).reshape(batch_shape + (self.num_agents, self.num_outputs))
 
 
 # ------NonGraph Critic Model------ #
@@ -304,12 +323,16 @@ class NonGraph_Critic_Model(nn.Module):
             2.Observation is the state observation matrix, including X_in, and RL_indice.
             3.X_in is the node feature matrix, RL_indice is the reinforcement learning
             index of controlled vehicles.
+            4.A batch of observations (BxNxF, BxN) is processed in a single pass and the
+            output is reshaped to BxNx(output dimension).
         """
 
-        X_in, _, RL_indice = datatype_transmission(observation, self.device)
+        X_in, _, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Policy
-        X_in = torch.cat((X_in, action), 1)
+        X_in = torch.cat((X_in, gather_agents(action.reshape(-1, action.shape[-1]), node_map)), 1)
         X_policy = self.policy_1(X_in)
         X_policy = F.relu(X_policy)
         X_policy = self.policy_2(X_policy)
@@ -318,4 +341,4 @@ class NonGraph_Critic_Model(nn.Module):
         # Value
         V = self.value(X_policy)
 
-        return V
+        return scatter_agents(V, node_map).reshape(batch_shape + (self.num_agents, 1))
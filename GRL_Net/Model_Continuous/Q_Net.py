@@ -3,7 +3,9 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.distributions import MultivariateNormal
 from torch_geometric.nn import GCNConv
-from torch_geometric.utils import dense_to_sparse
+from GRL_Net.DenseGraph.dense_graph_conv import graph_convolution
+from GRL_Net.SparseGraph.sparse_observation import is_sparse_observation, sparse_transmission, \
+    graph_batch_shape, scatter_agents, gather_agents
 
 
 def datatype_transmission(states, device):
@@ -12,12 +14,17 @@ def datatype_transmission(states, device):
         float32 Tensor data type that pytorch can accept.
         2.Pay attention: Depending on the characteristics of the data structure of
         the observation, the function needs to be changed accordingly.
+        3.Sparse observations (X_in, A_in_Sparse, RL_indice, node_map) keep the
+        edges and the node map as int64 indexes, dense observations have no node map.
     """
+    if is_sparse_observation(states):
+        return sparse_transmission(states, device)
+
     features = torch.as_tensor(states[0], dtype=torch.float32, device=device)
     adjacency = torch.as_tensor(states[1], dtype=torch.float32, device=device)
     mask = torch.as_tensor(states[2], dtype=torch.float32, device=device)
 
-    return features, adjacency, mask
+    return features, adjacency, mask, None
 
 
 # ------Graph Model------ #
@@ -71,9 +78,16 @@ class Graph_Model(nn.Module):
             (NxN) (original input)
             4.A_in_Sparse is the sparse adjacency matrix COO (2xnum), RL_indice is the
             reinforcement learning index of controlled vehicles.
+            5.A batch of observations (BxNxF, BxNxN, BxN) is processed in a single pass:
+            the graphs are merged into one block-diagonal graph of B*N nodes and the
+            outputs are reshaped to BxN(xA).
+            6.If the action is given, Q is calculated and no action is sampled
+            (the returned action dictionary is None).
         """
 
-        X_in, A_in_Dense, RL_indice = datatype_transmission(observation, self.device)
+        X_in, A_in_Dense, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Encoder
         X = self.encoder_1(X_in)
@@ -82,8 +96,7 @@ class Graph_Model(nn.Module):
         X = F.relu(X)
 
         # GCN
-        A_in_Sparse, _ = dense_to_sparse(A_in_Dense)
-        X_graph = self.GraphConv(X, A_in_Sparse)
+        X_graph = graph_convolution(self.GraphConv, X, A_in_Dense)
         X_graph = F.relu(X_graph)
         X_graph = self.GraphConv_Dense(X_graph)
         X_graph = F.relu(X_graph)
@@ -103,41 +116,47 @@ class Graph_Model(nn.Module):
         mu = torch.tanh(self.mu(X_policy))
         mu = mu.unsqueeze(-1)
 
-        # Calculate the lower triangular matrix L
+        # Calculate the lower triangular matrix L for all the vehicles of the batch
         L0 = torch.tanh(self.L0(X_policy))
-        L = torch.zeros(self.num_agents, self.num_outputs, self.num_outputs).to(self.device)
+        L = torch.zeros(X_policy.shape[0], self.num_outputs, self.num_outputs, device=self.device)
         # get lower triagular indices
         tril_indices = torch.tril_indices(row=self.num_outputs, col=self.num_outputs, offset=0)
         # fill matrix with entries
         L[:, tril_indices[0], tril_indices[1]] = L0
         L.diagonal(dim1=1, dim2=2).exp_()
-        # calculate state-dependent, positive-definite square matrix
-        P = L * L.transpose(2, 1)
+
+        # Output shape
+        value = scatter_agents(value, node_map).reshape(batch_shape + (self.num_agents, 1))
 
         # Advantage and Q value
-        Q = None
         if action is not None:
-            action = action.unsqueeze(-1).unsqueeze(-1)
-            a = action - mu
-            A = (-0.5 * torch.matmul(torch.matmul(a.transpose(2, 1), P), a)).squeeze(-1)
-            Q = A + value
+            # A = -0.5 * a^T * (L * L^T) * a = -0.5 * ||L^T * a||^2
+            action = torch.as_tensor(action, dtype=torch.float32, device=self.device)
+            a = gather_agents(action.reshape(-1, self.num_outputs, 1), node_map) - mu
+            L_a = torch.matmul(L.transpose(2, 1), a)
+            A = -0.5 * L_a.pow(2).sum(dim=(1, 2))
+            Q = scatter_agents(A, node_map).reshape(batch_shape + (self.num_agents, 1)) + value
+            return None, Q, value
 
         # Action generation
-        # add noise to action mu:
-        dist = MultivariateNormal(mu.squeeze(-1), torch.inverse(P))
+        # add noise to action mu, P = L * L^T is the state-dependent, positive-definite
+        # precision matrix of the exploration distribution
+        P = torch.matmul(L, L.transpose(2, 1))
+        dist = MultivariateNormal(mu.squeeze(-1), precision_matrix=P)
         # dist = Normal(action_value.squeeze(-1), 1)
         action = dist.sample()
         action = torch.clamp(action, min=self.action_min, max=self.action_max)
         # Mask
-        mask = torch.reshape(RL_indice, (self.num_agents, 1))
+        mask = torch.reshape(RL_indice, (-1, 1))
         # Output calculation
         action = torch.mul(action, mask)
 
         # Store action-related information in the dictionary
-        action = action.squeeze(-1)
+        action = scatter_agents(action, node_map)
+        action = action.reshape(batch_shape + (self.num_agents, self.num_outputs)).squeeze(-1)
         action_dict = {'action': action, 'action_min': self.action_min, 'action_max': self.action_max}
 
-        return action_dict, Q, value
+        return action_dict, None, value
 
 
 # ------NonGraph Model------ #
@@ -180,9 +199,15 @@ class NonGraph_Model(nn.Module):
             2.Observation is the state observation matrix, including X_in, and RL_indice.
             3.X_in is the node feature matrix, RL_indice is the reinforcement learning
             index of controlled vehicles.
+            4.A batch of observations (BxNxF, BxN) is processed in a single pass and the
+            outputs are reshaped to BxN(xA).
+            5.If the action is given, Q is calculated and no action is sampled
+            (the returned action dictionary is None).
         """
 
-        X_in, _, RL_indice = datatype_transmission(observation, self.device)
+        X_in, _, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Policy
         X_policy = self.policy_1(X_in)
@@ -196,38 +221,44 @@ class NonGraph_Model(nn.Module):
         mu = torch.tanh(self.mu(X_policy))
         mu = mu.unsqueeze(-1)
 
-        # Calculate the lower triangular matrix L
+        # Calculate the lower triangular matrix L for all the vehicles of the batch
         L0 = torch.tanh(self.L0(X_policy))
-        L = torch.zeros(self.num_agents, self.num_outputs, self.num_outputs).to(self.device)
+        L = torch.zeros(X_policy.shape[0], self.num_outputs, self.num_outputs, device=self.device)
         # get lower triagular indices
         tril_indices = torch.tril_indices(row=self.num_outputs, col=self.num_outputs, offset=0)
         # fill matrix with entries
         L[:, tril_indices[0], tril_indices[1]] = L0
         L.diagonal(dim1=1, dim2=2).exp_()
-        # calculate state-dependent, positive-definite square matrix
-        P = L * L.transpose(2, 1)
+
+        # Output shape
+        value = scatter_agents(value, node_map).reshape(batch_shape + (self.num_agents, 1))
 
         # Advantage and Q value
-        Q = None
         if action is not None:
-            action = action.unsqueeze(-1).unsqueeze(-1)
-            a = action - mu
-            A = (-0.5 * torch.matmul(torch.matmul(a.transpose(2, 1), P), a)).squeeze(-1)
-            Q = A + value
+            # A = -0.5 * a^T * (L * L^T) * a = -0.5 * ||L^T * a||^2
+            action = torch.as_tensor(action, dtype=torch.float32, device=self.device)
+            a = gather_agents(action.reshape(-1, self.num_outputs, 1), node_map) - mu
+            L_a = torch.matmul(L.transpose(2, 1), a)
+            A = -0.5 * L_a.pow(2).sum(dim=(1, 2))
+            Q = scatter_agents(A, node_map).reshape(batch_shape + (self.num_agents, 1)) + value
+            return None, Q, value
 
         # Action generation
-        # add noise to action mu:
-        dist = MultivariateNormal(mu.squeeze(-1), torch.inverse(P))
+        # add noise to action mu, P = L * L^T is the state-dependent, positive-definite
+        # precision matrix of the exploration distribution
+        P = torch.matmul(L, L.transpose(2, 1))
+        dist = MultivariateNormal(mu.squeeze(-1), precision_matrix=P)
         # dist = Normal(action_value.squeeze(-1), 1)
         action = dist.sample()
         action = torch.clamp(action, min=self.action_min, max=self.action_max)
         # Mask
-        mask = torch.reshape(RL_indice, (self.num_agents, 1))
+        mask = torch.reshape(RL_indice, (-1, 1))
         # Output calculation
         action = torch.mul(action, mask)
 
         # Store action-related information in the dictionary
-        action = action.squeeze(-1)
+        action = scatter_agents(action, node_map)
+        action = action.reshape(batch_shape + (self.num_agents, self.num_outputs)).squeeze(-1)
         action_dict = {'action': action, 'action_min': self.action_min, 'action_max': self.action_max}
 
-        return action_dict, Q, value
\ No newline at end of file
+        return action_dict, None, value
\ No newline at end of file
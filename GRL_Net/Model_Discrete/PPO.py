@@ -2,7 +2,9 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv
-from torch_geometric.utils import dense_to_sparse
+from GRL_Net.DenseGraph.dense_graph_conv import graph_convolution
+from GRL_Net.SparseGraph.sparse_observation import is_sparse_observation, sparse_transmission, \
+    graph_batch_shape, scatter_agents
 
 
 def datatype_transmission(states, device):
@@ -11,12 +13,17 @@ def datatype_transmission(states, device):
         float32 Tensor data type that pytorch can accept.
         2.Pay attention: Depending on the characteristics of the data structure of
         the observation, the function needs to be changed accordingly.
+        3.Sparse observations (X_in, A_in_Sparse, RL_indice, node_map) keep the
+        edges and the node map as int64 indexes, dense observations have no node map.
     """
+    if is_sparse_observation(states):
+        return sparse_transmission(states, device)
+
     features = torch.as_tensor(states[0], dtype=torch.float32, device=device)
     adjacency = torch.as_tensor(states[1], dtype=torch.float32, device=device)
     mask = torch.as_tensor(states[2], dtype=torch.float32, device=device)
 
-    return features, adjacency, mask
+    return features, adjacency, mask, None
 
 
 # ------Graph Actor Model------ #
@@ -67,9 +74,14 @@ class Graph_Actor_Model(nn.Module):
             (NxN) (original input)
             4.A_in_Sparse is the sparse adjacency matrix COO (2xnum), RL_indice is the
             reinforcement learning index of controlled vehicles.
+            5.A batch of observations (BxNxF, BxNxN, BxN) is processed in a single pass:
+            the graphs are merged into one block-diagonal graph of B*N nodes and the
+            output is reshaped to BxNxA.
         """
 
-        X_in, A_in_Dense, RL_indice = datatype_transmission(observation, self.device)
+        X_in, A_in_Dense, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Encoder
         X = self.encoder_1(X_in)
@@ -78,8 +90,7 @@ class Graph_Actor_Model(nn.Module):
         X = F.relu(X)
 
         # GCN
-        A_in_Sparse, _ = dense_to_sparse(A_in_Dense)
-        X_graph = self.GraphConv(X, A_in_Sparse)
+        X_graph = graph_convolution(self.GraphConv, X, A_in_Dense)
         X_graph = F.relu(X_graph)
         X_graph = self.GraphConv_Dense(X_graph)
         X_graph = F.relu(X_graph)
@@ -94,11 +105,12 @@ class Graph_Actor_Model(nn.Module):
         X_policy = F.relu(X_policy)
 
         # Mask
-        mask = torch.reshape(RL_indice, (self.num_agents, 1))
+        mask = torch.reshape(RL_indice, (-1, 1))
 
         # Policy calculation
         pi = self.pi(X_policy)
         pi = torch.mul(pi, mask)
+        pi = scatter_agents(pi, node_map).reshape(batch_shape + (self.num_agents, self.num_outputs))
 
         # Probability Distribution
         probabilities = F.softmax(pi, dim=-1)
@@ -155,9 +167,14 @@ class Graph_Critic_Model(nn.Module):
             (NxN) (original input)
             4.A_in_Sparse is the sparse adjacency matrix COO (2xnum), RL_indice is the
             reinforcement learning index of controlled vehicles.
+            5.A batch of observations (BxNxF, BxNxN, BxN) is processed in a single pass:
+            the graphs are merged into one block-diagonal graph of B*N nodes and the
+            output is reshaped to BxNx1.
         """
 
-        X_in, A_in_Dense, RL_indice = datatype_transmission(observation, self.device)
+        X_in, A_in_Dense, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Encoder
         X = self.encoder_1(X_in)
@@ -166,8 +183,7 @@ class Graph_Critic_Model(nn.Module):
         X = F.relu(X)
 
         # GCN
-        A_in_Sparse, _ = dense_to_sparse(A_in_Dense)
-        X_graph = self.GraphConv(X, A_in_Sparse)
+        X_graph = graph_convolution(self.GraphConv, X, A_in_Dense)
         X_graph = F.relu(X_graph)
         X_graph = self.GraphConv_Dense(X_graph)
         X_graph = F.relu(X_graph)
@@ -182,13 +198,13 @@ class Graph_Critic_Model(nn.Module):
         X_policy = F.relu(X_policy)
 
         # Mask
-        mask = torch.reshape(RL_indice, (self.num_agents, 1))
+        mask = torch.reshape(RL_indice, (-1, 1))
 
         # Value calculation
         value = self.value(X_policy)
         value = torch.mul(value, mask)
 
-        return value
+        return scatter_agents(value, node_map).reshape(batch_shape + (self.num_agents, 1))
 
 
 # ------NonGraph Actor Model------ #
@@ -228,9 +244,13 @@ class NonGraph_Actor_Model(nn.Module):
             2.Observation is the state observation matrix, including X_in, and RL_indice.
             3.X_in is the node feature matrix, RL_indice is the reinforcement learning
             index of controlled vehicles.
+            4.A batch of observations (BxNxF, BxN) is processed in a single pass and the
+            output is reshaped to BxNxA.
         """
 
-        X_in, _, RL_indice = datatype_transmission(observation, self.device)
+        X_in, _, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Policy
         X_policy = self.policy_1(X_in)
@@ -239,11 +259,12 @@ class NonGraph_Actor_Model(nn.Module):
         X_policy = F.relu(X_policy)
 
         # Mask
-        mask = torch.reshape(RL_indice, (self.num_agents, 1))
+        mask = torch.reshape(RL_indice, (-1, 1))
 
         # Policy generation
         pi = self.pi(X_policy)
         pi = torch.mul(pi, mask)
+        pi = scatter_agents(pi, node_map).reshape(batch_shape + (self.num_agents, self.num_outputs))
 
         # Probability distribution
         probabilities = F.softmax(pi, dim=-1)
@@ -289,9 +310,13 @@ class NonGraph_Critic_Model(nn.Module):
             2.Observation is the state observation matrix, including X_in, and RL_indice.
             3.X_in is the node feature matrix, RL_indice is the reinforcement learning
             index of controlled vehicles.
+            4.A batch of observations (BxNxF, BxN) is processed in a single pass and the
+            output is reshaped to BxNx1.
         """
 
-        X_in, _, RL_indice = datatype_transmission(observation, self.device)
+        X_in, _, RL_indice, node_map = datatype_transmission(observation, self.device)
+        batch_shape = graph_batch_shape(X_in, node_map)
+        X_in = X_in.reshape(-1, X_in.shape[-1])
 
         # Encoder
         X_policy = self.policy_1(X_in)
@@ -300,10 +325,10 @@ class NonGraph_Critic_Model(nn.Module):
         X_policy = F.relu(X_policy)
 
         # Mask
-        mask = torch.reshape(RL_indice, (self.num_agents, 1))
+        mask = torch.reshape(RL_indice, (-1, 1))
 
         # Value calculation
         value = self.value(X_policy)
         value = torch.mul(value, mask)
 
-        return value
+        return scatter_agents(value, node_map).reshape(batch_shape + (self.num_agents, 1))
@@ -0,0 +1,88 @@
+"""Sparse graph observations
+
+Helpers for the variable-size graph observations (X_in, A_in_Sparse,
+RL_indice, node_map), which only contain the vehicles present in the
+network:
+
+* X_in is the node feature matrix (nxF) of the n present vehicles,
+* A_in_Sparse is the sparse adjacency matrix COO (2xnum) between them,
+* RL_indice is the reinforcement learning index of the controlled vehicles (n),
+* node_map gives, for each of the N agent slots, the row of its vehicle in
+  X_in, or -1 if the vehicle is not in the network (N, or BxN for a batch).
+
+A batch merges the graphs into one graph (the edges are offset) and stacks the
+node maps, so the models compute on the present vehicles only and scatter their
+outputs back to the NxA (BxNxA) agent layout of the dense observations.
+"""
+
+import torch
+
+
+def is_sparse_observation(observation):
+    """Whether the observation is a sparse observation (it has a node map)"""
+    return isinstance(observation, (tuple, list)) and len(observation) == 4
+
+
+def sparse_transmission(states, device):
+    """Convert a sparse observation to tensors
+
+    The node features and the mask are converted to float32, the edges and the
+    node map are kept as int64 indexes.
+    """
+    features = torch.as_tensor(states[0], dtype=torch.float32, device=device)
+    edge_index = torch.as_tensor(states[1], dtype=torch.long, device=device)
+    mask = torch.as_tensor(states[2], dtype=torch.float32, device=device)
+    node_map = torch.as_tensor(states[3], dtype=torch.long, device=device)
+
+    return features, edge_index, mask, node_map
+
+
+def graph_batch_shape(X_in, node_map):
+    """Batch shape of an observation, () for a single observation
+
+    Args:
+        X_in (torch.Tensor): node features (NxF/BxNxF, or nxF if sparse).
+        node_map (torch.Tensor): node map of a sparse observation, None if dense.
+    """
+    if node_map is None:
+        return X_in.shape[:-2]
+    return node_map.shape[:-1]
+
+
+def scatter_agents(x, node_map, fill_value=0.):
+    """Scatter the rows of the present vehicles to the agent slots
+
+    Args:
+        x (torch.Tensor): one row per present vehicle ([n]x...).
+        node_map (torch.Tensor): node map, None if the observation is dense
+            (x is returned unchanged).
+        fill_value (float): value of the slots without vehicle.
+
+    Returns:
+        One row per agent slot ([B*N]x...), to be reshaped to the batch shape.
+    """
+    if node_map is None:
+        return x
+    x = torch.cat((x, x.new_full((1,) + x.shape[1:], fill_value)))
+    # the slots without vehicle (-1) read the appended fill row
+    return x[node_map.reshape(-1)]
+
+
+def gather_agents(x, node_map):
+    """Gather the rows of the agent slots of the present vehicles
+
+    Inverse of scatter_agents, e.g. to pair the actions (given for all the
+    agent slots) with the node features.
+
+    Args:
+        x (torch.Tensor): one row per agent slot ([B*N]x...).
+        node_map (torch.Tensor): node map, None if the observation is dense
+            (x is returned unchanged).
+    """
+    if node_map is None:
+        return x
+    node_map = node_map.reshape(-1)
+    slots = torch.nonzero(node_map >= 0).squeeze(1)
+    node_slots = torch.empty_like(slots)
+    node_slots[node_map[slots]] = slots
+    return x[node_slots]
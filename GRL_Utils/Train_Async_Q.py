@@ -0,0 +1,305 @@
+# The python file includes the asynchronous (actor/learner) training function for the GRL model
+import copy
+import queue
+import shutil
+import tempfile
+import traceback
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from GRL_Library.common.n_step_writer import NStepWriter
+
+
+def to_shared(observation):
+    """
+        <Observation sharing function>
+        Convert the numpy arrays of an observation into tensors, which are moved
+        through the shared memory by the torch.multiprocessing queues.
+
+        Parameters:
+        --------
+        observation: observation of the environment
+    """
+    if isinstance(observation, (tuple, list)):
+        return tuple(to_shared(elem) for elem in observation)
+    return torch.from_numpy(np.ascontiguousarray(observation))
+
+
+def from_shared(observation):
+    """
+        <Observation restoring function>
+        Convert the tensors of an observation received from an actor into numpy arrays.
+
+        Parameters:
+        --------
+        observation: observation received from the queue
+    """
+    if isinstance(observation, (tuple, list)):
+        return tuple(from_shared(elem) for elem in observation)
+    return observation.numpy()
+
+
+def make_actor_model(GRL_model):
+    """
+        <Actor model function>
+        Shallow copy of the GRL model for the action selection of the actors: it
+        keeps the action selection state (explorer, inference path), while the
+        learning state (replay_buffer, optimizer, target network, prefetcher) is
+        left to the learner. The actors replace the policy with their local copy.
+
+        Parameters:
+        --------
+        GRL_model: the GRL model to be trained
+    """
+    actor_model = copy.copy(GRL_model)
+    for name in ('model', 'target_model', 'optimizer', 'replay_buffer', 'memory', 'prefetcher', 'n_step_writer'):
+        if hasattr(actor_model, name):
+            setattr(actor_model, name, None)
+    return actor_model
+
+
+def Actor_Process(actor_id, GRL_model, create_env, policy, policy_version, policy_lock, transitions, stop,
+                  num_outputs, num_agents, max_episode_len, warmup, max_policy_lag):
+    """
+        This function is the actor process of the asynchronous training, it runs its
+        own environment with a local copy of the policy and sends the interaction
+        results to the learner
+
+        Parameters:
+        --------
+        actor_id: the index of the actor
+        GRL_model: the GRL model of the actor, only used for action selection (see make_actor_model)
+        create_env: the environment creation function (see make_create_env)
+        policy: the shared copy of the policy published by the learner
+        policy_version: shared counter of the published policy versions
+        policy_lock: lock of the shared policy
+        transitions: the queue of the interaction results
+        stop: event set by the learner when the training is finished
+        num_outputs: the number of selectable actions
+        num_agents: the number of agents
+        max_episode_len: the maximum number of steps in a single episode
+        warmup: model free exploration steps of this actor (randomly selected actions)
+        max_policy_lag: the number of policy versions the local copy may be behind
+    """
+    def put(message):
+        # The learner may be busy, the queue is bounded
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    env = None
+    directory = None
+    try:
+        torch.set_num_threads(1)
+        # The network files of this actor are generated in their own directory
+        # (removed when the actor exits)
+        directory = tempfile.mkdtemp(prefix='flow_actor_{}_'.format(actor_id))
+        tempfile.tempdir = directory
+        env = create_env()
+
+        # Local copy of the policy used for action selection
+        GRL_model.model = copy.deepcopy(policy)
+        local_version = policy_version.value
+        warmup_count = 0
+
+        while not stop.is_set():
+            obs = env.reset()
+            if not put(('reset', actor_id, to_shared(obs))):
+                break
+            R = 0
+            t = 0
+            while True:
+                # ------Policy synchronization------ #
+                if policy_version.value - local_version > max_policy_lag:
+                    with policy_lock:
+                        GRL_model.model.load_state_dict(policy.state_dict())
+                        local_version = policy_version.value
+
+                # ------Action generation------ #
+                if warmup_count <= warmup:  # Warmup
+                    action = np.random.choice(np.arange(num_outputs), num_agents)  # Random action
+                else:
+                    action = GRL_model.choose_action(obs)  # The agent interacts with the environment
+                action = np.asarray(action.cpu() if torch.is_tensor(action) else action)
+
+                obs_next, reward, done, info = env.step(action)
+                R += reward
+                t += 1
+                warmup_count += 1
+
+                reset = t == max_episode_len
+
+                # ------ send the interaction results to the learner ------ #
+                if not put(('step', actor_id, action, reward, to_shared(obs_next), done)):
+                    break
+
+                # ------ Observation update ------ #
+                obs = obs_next
+
+                if done or reset:
+                    put(('episode', actor_id, R, t))
+                    break
+    except Exception:
+        put(('error', actor_id, traceback.format_exc()))
+        # The shared memory of the results still in the queue lives in this process
+        stop.wait()
+    finally:
+        if env is not None:
+            env.terminate()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def Training_GRLModels_Async(GRL_Net, GRL_model, create_env, n_episodes, max_episode_len, save_dir, warmup, debug,
+                             num_actors=2, sync_interval=10, max_policy_lag=0, queue_size=1000):
+    """
+        This function is an asynchronous training function for the GRL model (DQN family).
+        Instead of alternating between one env.step and one learn, the environments
+        run in num_actors actor processes, while this (learner) process owns the
+        replay buffer and the optimizer:
+        1.Every actor creates its own environment and selects the actions with a local
+        copy of the policy, synchronized with the policy published by the learner.
+        2.The interaction results are sent through a bounded torch.multiprocessing
+        queue (the observations are moved through the shared memory).
+        3.The learner stores the transitions (per actor, so that the observations and
+        the n-step returns of an episode stay chained) and calls learn once per
+        transition as the synchronous training does. The policy is published every
+        sync_interval stored transitions.
+
+        The actors are forked (the environments are created in the actor processes and
+        their SUMO instances get their own port and network directory), the actions
+        are selected on the CPU.
+
+        Parameters:
+        --------
+        GRL_Net: the neural network used in the GRL model
+        GRL_model: the GRL model to be trained
+        create_env: the environment creation function (see make_create_env)
+        n_episodes: number of training rounds (summed over the actors)
+        max_episode_len: the maximum number of steps to train in a single step
+        save_dir: model save path
+        warmup: model free exploration steps (randomly selected actions, summed over the actors)
+        debug: model parameters related to debugging
+        num_actors: the number of actor processes
+        sync_interval: the number of stored transitions between two published policies
+        max_policy_lag: the number of published policy versions the policy of an actor
+        may be behind (0 to always act with the latest published policy)
+        queue_size: the maximum number of interaction results waiting in the queue
+    """
+    ctx = mp.get_context('fork')
+
+    # Shared copy of the policy, the actors select the actions on the CPU
+    policy = copy.deepcopy(GRL_model.model).to('cpu')
+    policy.device = 'cpu'
+    policy.share_memory()
+    policy_version = ctx.Value('i', 0)
+    policy_lock = ctx.Lock()
+
+    transitions = ctx.Queue(maxsize=queue_size)
+    stop = ctx.Event()
+
+    # The actors only get the action selection part of the GRL model
+    actor_model = make_actor_model(GRL_model)
+    actors = [ctx.Process(target=Actor_Process,
+                          args=(i, actor_model, create_env, policy, policy_version, policy_lock, transitions, stop,
+                                GRL_Net.num_outputs, GRL_Net.num_agents, max_episode_len,
+                                warmup // num_actors, max_policy_lag),
+                          daemon=True)
+              for i in range(num_actors)]
+
+    # The n-step returns are accumulated per actor
+    n_step_writers = [NStepWriter(GRL_model.n_steps, GRL_model.gamma) if GRL_model.n_step_writer is not None
+                      else None for _ in range(num_actors)]
+
+    # The following is the model training process
+    Rewards = []  # Initialize the reward matrix for data saving
+    Loss = []  # Initialize the Loss matrix for data storage
+    Episode_Steps = []  # Initialize the step matrix to hold the step lengths at task completion for each episode
+    Average_Q = []  # Initialize the average Q matrix to hold the average Q for each episode
+
+    print("#------------------------------------#")
+    print("#----------Training Begins-----------#")
+    print("#------------------------------------#")
+
+    for actor in actors:
+        actor.start()
+
+    last_obs = [None] * num_actors  # the newest observation of each actor
+    stored = 0
+    i = 0
+    try:
+        while i < n_episodes:
+            message = transitions.get()
+            kind, actor_id = message[:2]
+
+            if kind == 'error':
+                raise RuntimeError("Actor {} failed:\n{}".format(actor_id, message[2]))
+
+            if kind == 'reset':
+                last_obs[actor_id] = from_shared(message[2])
+
+            elif kind == 'step':
+                _, _, action, reward, obs_next, done = message
+                obs_next = from_shared(obs_next)
+
+                # ------ store the interaction results into the experience replay pool ------ #
+                # (every actor is a stream of its own, see ReplayBuffer.add)
+                if n_step_writers[actor_id] is None:
+                    GRL_model.memory.add(last_obs[actor_id], action, reward, obs_next, done, stream=actor_id)
+                else:
+                    for transition in n_step_writers[actor_id].add(last_obs[actor_id], action, reward,
+                                                                   obs_next, done):
+                        GRL_model.memory.add(*transition, stream=actor_id)
+                last_obs[actor_id] = obs_next
+                stored += 1
+
+                # ------ Policy updates ------ #
+                GRL_model.learn()
+
+                # ------ Policy publication ------ #
+                if stored % sync_interval == 0:
+                    with policy_lock:
+                        policy.load_state_dict(GRL_model.model.state_dict())
+                        policy_version.value += 1
+
+            elif kind == 'episode':
+                i += 1
+                if debug:
+                    print("#------------------------------------#")
+                    for parameters in GRL_Net.parameters():
+                        print("param:", parameters)
+                    print("#------------------------------------#")
+                # ------ records training data ------ #
+                R, t = message[2:]
+                training_data = GRL_model.get_statistics()
+                loss = training_data[0]
+                q = training_data[1]
+                Rewards.append(R)
+                Episode_Steps.append(t)
+                Loss.append(loss)
+                Average_Q.append(q)
+                print('Training Episode:', i, 'Actor:', actor_id, 'Reward:', R, 'Loss:', loss, 'Average_Q:', q)
+    finally:
+        stop.set()
+        # Drain the queue so that no actor stays blocked on it, the remaining
+        # results are discarded (their shared memory may be gone with their actor)
+        while any(actor.is_alive() for actor in actors):
+            try:
+                transitions.get(timeout=0.1)
+            except (queue.Empty, OSError):
+                pass
+        for actor in actors:
+            actor.join()
+    print('Training Finished.')
+
+    # Save model
+    GRL_model.save_model(save_dir)
+    # Save other data
+    np.save(save_dir + "/Rewards", Rewards)
+    np.save(save_dir + "/Episode_Steps", Episode_Steps)
+    np.save(save_dir + "/Loss", Loss)
+    np.save(save_dir + "/Average_Q", Average_Q)
@@ -1,5 +1,6 @@
 # This python file includes the training and testing functions for the GRL model
 import numpy as np
+from GRL_Utils.Vector_Env import VectorEnv
 
 
 def Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, save_dir, debug):
@@ -10,12 +11,16 @@ def Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, sav
         --------
         GRL_Net: the neural network used in the GRL model
         GRL_model: the GRL model to be trained
-        env: the simulation environment registered to gym
+        env: the simulation environment registered to gym, or a VectorEnv (see
+        Training_GRLModels_Vector)
         n_episodes: number of training rounds
         max_episode_len: the maximum number of steps to train in a single step
         save_dir: path to save the model
         debug: debug-related model parameters
     """
+    if isinstance(env, VectorEnv):
+        return Training_GRLModels_Vector(GRL_Net, GRL_model, env, n_episodes, save_dir, debug)
+
     # The following is the model training process
     Rewards = []  # Initialize the reward matrix for data saving
     Loss = []  # Initialize the Loss matrix for data saving
@@ -78,6 +83,77 @@ def Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, sav
     np.save(save_dir + "/Loss", Loss)
 
 
+def Training_GRLModels_Vector(GRL_Net, GRL_model, env, n_episodes, save_dir, debug):
+    """
+        This function is a training function for the GRL model with a VectorEnv.
+        The actions of all the environments are selected with one batched forward
+        pass and the model is updated once per step of the VectorEnv with the
+        stacked transitions. The last transition of an episode is learned with its
+        terminal observation (the value of the next state is dropped if done, kept
+        if the episode is truncated by the max_episode_len of the VectorEnv).
+
+        Parameter description:
+        --------
+        GRL_Net: the neural network used in the GRL model
+        GRL_model: the GRL model to be trained
+        env: the VectorEnv
+        n_episodes: number of training rounds (summed over the environments)
+        save_dir: path to save the model
+        debug: debug-related model parameters
+    """
+    # The following is the model training process
+    Rewards = []  # Initialize the reward matrix for data saving
+    Loss = []  # Initialize the Loss matrix for data saving
+    Episode_Steps = []  # Initialize the step matrix to hold the step length at task completion for each episode
+
+    print("#------------------------------------#")
+    print("#----------Training Begins-----------#")
+    print("#------------------------------------#")
+
+    obs = env.reset()
+    i = 0
+    while i < n_episodes:
+        # ------Action generation------ #
+        action = GRL_model.choose_action(obs)  # agent interacts with the environments
+
+        obs_next, reward, done, info = env.step(action)
+
+        # ------Model training------ #
+        GRL_model.learn(obs, reward, obs_next, done)
+
+        # ------Observation update------ #
+        obs = env.observation
+
+        # ------ Record training data ------ #
+        for k in range(env.num_envs):
+            if 'episode' not in info[k] or i == n_episodes:
+                continue
+            i += 1
+            # Print parameters in the network in real time if debugging is required
+            if debug:
+                print("#------------------------------------#")
+                for parameters in GRL_Net.parameters():
+                    print("param:", parameters)
+                print("#------------------------------------#")
+            R, t = info[k]['episode']
+            training_data = GRL_model.get_statistics()
+            loss = training_data[0]
+            Rewards.append(R)
+            Episode_Steps.append(t)
+            Loss.append(loss)
+
+            # ------ Print training information ------ #
+            print('Training Episode:', i, 'Env:', k, 'Reward:', R, 'Loss:', loss)
+    print('Training Finished.')
+
+    # Save model
+    GRL_model.save_model(save_dir)
+    # Save data from the training process
+    np.save(save_dir + "/Rewards", Rewards)
+    np.save(save_dir + "/Episode_Steps", Episode_Steps)
+    np.save(save_dir + "/Loss", Loss)
+
+
 def Testing_GRLModels(GRL_Net, GRL_model, env, test_episodes, load_dir, debug):
     """
         This function is a test function for a trained GRL model
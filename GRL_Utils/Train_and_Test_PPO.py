@@ -1,5 +1,6 @@
 # This python file includes the training and testing functions for the GRL model
 import numpy as np
+from GRL_Utils.Vector_Env import VectorEnv
 
 
 def Training_GRLModels(GRL_model, env, n_episodes, max_episode_len, save_dir, debug):
@@ -9,13 +10,17 @@ def Training_GRLModels(GRL_model, env, n_episodes, max_episode_len, save_dir, de
         Parameter description:
         --------
         GRL_model: the GRL model to be trained
-        env: the simulation environment registered to gym
+        env: the simulation environment registered to gym, or a VectorEnv (see
+        Training_GRLModels_Vector)
         n_episodes: the number of training rounds
         max_episode_len: the maximum number of steps to train in a single step
         save_dir: path to save the model
         warmup: model free exploration steps (randomly selected actions)
         debug: model parameters related to debugging
     """
+    if isinstance(env, VectorEnv):
+        return Training_GRLModels_Vector(GRL_model, env, n_episodes, save_dir, debug)
+
     # The following is the model training process
     Rewards = []  # Initialize the reward matrix for data saving
     Loss = []  # Initialize the Loss matrix for data storage
@@ -73,6 +78,78 @@ def Training_GRLModels(GRL_model, env, n_episodes, max_episode_len, save_dir, de
     np.save(save_dir + "/Loss", Loss)
 
 
+def Training_GRLModels_Vector(GRL_model, env, n_episodes, save_dir, debug):
+    """
+        This function is a training function for the GRL model with a VectorEnv.
+        The actions of all the environments are selected with one batched forward
+        pass and every step of the VectorEnv is stored as one step of the rollout,
+        so the rollout holds update_interval steps of each environment.
+        The episodes truncated by the max_episode_len of the VectorEnv are stored
+        as done, so that the advantage does not run into the next episode.
+
+        Parameter description:
+        --------
+        GRL_model: the GRL model to be trained
+        env: the VectorEnv
+        n_episodes: the number of training rounds (summed over the environments)
+        save_dir: path to save the model
+        debug: model parameters related to debugging
+    """
+    # The following is the model training process
+    Rewards = []  # Initialize the reward matrix for data saving
+    Loss = []  # Initialize the Loss matrix for data storage
+    Episode_Steps = []  # Initialize the step matrix to hold the step length at task completion for each episode
+
+    print("#------------------------------------#")
+    print("#----------Training Begins-----------#")
+    print("#------------------------------------#")
+
+    total_steps = 0
+    obs = env.reset()
+    i = 0
+    while i < n_episodes:
+        action, prob, val = GRL_model.choose_action(obs)
+        _, reward, done, info = env.step(action)
+        total_steps += 1
+
+        # ------Storing interaction results in PPOMemory------ #
+        episode_end = np.array(['episode' in elem for elem in info])
+        GRL_model.store_transition(obs, action, prob, val, reward, done | episode_end)
+
+        # ------Policy update------ #
+        if total_steps % GRL_model.update_interval == 0:
+            GRL_model.learn()
+
+        # ------Observation update------ #
+        obs = env.observation
+
+        # ------ Records training data ------ #
+        for k in np.flatnonzero(episode_end):
+            if i == n_episodes:
+                break
+            i += 1
+            if debug:
+                print("#------------------------------------#")
+                for parameters in GRL_model.actor_model.parameters():
+                    print("param:", parameters)
+                print("#------------------------------------#")
+            R, t = info[k]['episode']
+            training_data = GRL_model.get_statistics()
+            loss = training_data[0]
+            Rewards.append(R)
+            Episode_Steps.append(t)
+            Loss.append(loss)
+            print('Training Episode:', i, 'Env:', k, 'Reward:', R, 'Loss:', loss)
+    print('Training Finished.')
+
+    # Save model
+    GRL_model.save_model(save_dir)
+    # Save other data
+    np.save(save_dir + "/Rewards", Rewards)
+    np.save(save_dir + "/Episode_Steps", Episode_Steps)
+    np.save(save_dir + "/Loss", Loss)
+
+
 def Testing_GRLModels(GRL_model, env, test_episodes, load_dir, debug):
     """
         This function is a test function for a trained GRL model
@@ -1,5 +1,7 @@
 # The python file includes the training and testing functions for the GRL model
 import numpy as np
+from GRL_Library.common.n_step_writer import NStepWriter
+from GRL_Utils.Vector_Env import VectorEnv
 
 
 def Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, save_dir, warmup, debug):
@@ -10,13 +12,17 @@ def Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, sav
         --------
         GRL_Net: the neural network used in the GRL model
         GRL_model: the GRL model to be trained
-        env: the simulation environment registered to gym
+        env: the simulation environment registered to gym, or a VectorEnv (see
+        Training_GRLModels_Vector)
         n_episodes: number of training rounds
         max_episode_len: the maximum number of steps to train in a single step
         save_dir: model save path
         warmup: model free exploration steps (randomly selected actions)
         debug: model parameters related to debugging
     """
+    if isinstance(env, VectorEnv):
+        return Training_GRLModels_Vector(GRL_Net, GRL_model, env, n_episodes, save_dir, warmup, debug)
+
     # The following is the model training process
     Rewards = []  # Initialize the reward matrix for data saving
     Loss = []  # Initialize the Loss matrix for data storage
@@ -90,6 +96,138 @@ def Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, sav
     np.save(save_dir + "/Average_Q", Average_Q)
 
 
+def Training_GRLModels_Vector(GRL_Net, GRL_model, env, n_episodes, save_dir, warmup, debug):
+    """
+        This function is a training function for the GRL model with a VectorEnv.
+        The actions of all the environments are selected with one batched forward
+        pass, then every environment stores its transition and the model is updated
+        once per stored transition, as in the training with a single environment.
+        The episodes are limited by the max_episode_len of the VectorEnv.
+
+        Parameters:
+        --------
+        GRL_Net: the neural network used in the GRL model
+        GRL_model: the GRL model to be trained
+        env: the VectorEnv
+        n_episodes: number of training rounds (summed over the environments)
+        save_dir: model save path
+        warmup: model free exploration steps (randomly selected actions, summed over the environments)
+        debug: model parameters related to debugging
+    """
+    # The following is the model training process
+    Rewards = []  # Initialize the reward matrix for data saving
+    Loss = []  # Initialize the Loss matrix for data storage
+    Episode_Steps = []  # Initialize the step matrix to hold the step lengths at task completion for each episode
+    Average_Q = []  # Initialize the average Q matrix to hold the average Q for each episode
+
+    # The n-step returns are accumulated per environment
+    n_step_writers = [NStepWriter(GRL_model.n_steps, GRL_model.gamma) if GRL_model.n_step_writer is not None
+                      else None for _ in range(env.num_envs)]
+
+    # Define warmup steps
+    Warmup_Steps = warmup
+    # Define warmup step records
+    warmup_count = 0
+
+    print("#------------------------------------#")
+    print("#----------Training Begins-----------#")
+    print("#------------------------------------#")
+
+    obs = env.reset()
+    i = 0
+    while i < n_episodes:
+        # ------Action generation------ #
+        if warmup_count <= Warmup_Steps:  # Warmup
+            action = np.random.choice(
+                np.arange(GRL_Net.num_outputs), (env.num_envs, GRL_Net.num_agents))  # Random action
+        else:
+            action = GRL_model.choose_action(obs)  # The agent interacts with the environments
+
+        states = env.observations
+        _, reward, done, info = env.step(action)
+        warmup_count += env.num_envs
+
+        for k in range(env.num_envs):
+            # ------ store the interaction results into the experience replay pool ------ #
+            # (every environment is a stream of its own, see ReplayBuffer.add)
+            if n_step_writers[k] is None:
+                GRL_model.memory.add(states[k], action[k], reward[k], env.next_observations[k], done[k],
+                                     stream=k)
+            else:
+                for transition in n_step_writers[k].add(states[k], action[k], reward[k],
+                                                        env.next_observations[k], done[k]):
+                    GRL_model.memory.add(*transition, stream=k)
+
+            # ------ Policy updates ------ #
+            GRL_model.learn()
+
+            if 'episode' in info[k] and i < n_episodes:
+                i += 1
+                if debug:
+                    print("#------------------------------------#")
+                    for parameters in GRL_Net.parameters():
+                        print("param:", parameters)
+                    print("#------------------------------------#")
+                # ------ records training data ------ #
+                R, t = info[k]['episode']
+                training_data = GRL_model.get_statistics()
+                loss = training_data[0]
+                q = training_data[1]
+                Rewards.append(R)
+                Episode_Steps.append(t)
+                Loss.append(loss)
+                Average_Q.append(q)
+                print('Training Episode:', i, 'Env:', k, 'Reward:', R, 'Loss:', loss, 'Average_Q:', q)
+
+        # ------ Observation update ------ #
+        obs = env.observation
+    print('Training Finished.')
+
+    # Save model
+    GRL_model.save_model(save_dir)
+    # Save other data
+    np.save(save_dir + "/Rewards", Rewards)
+    np.save(save_dir + "/Episode_Steps", Episode_Steps)
+    np.save(save_dir + "/Loss", Loss)
+    np.save(save_dir + "/Average_Q", Average_Q)
+
+
+def Training_GRLModels_Dispatch(GRL_Net, GRL_model, create_env, env, n_episodes, max_episode_len, save_dir, warmup,
+                                debug, num_actors=0, num_envs=1):
+    """
+        This function trains the GRL model with the environments selected by num_actors
+        and num_envs:
+        1.num_actors > 0: actor/learner training, the environments run in num_actors
+        actor processes (see Training_GRLModels_Async).
+        2.num_envs > 1: the environments run in a VectorEnv of num_envs subprocesses,
+        their actions are selected in batches.
+        3.otherwise: the training with the single environment env.
+
+        Parameters:
+        --------
+        GRL_Net: the neural network used in the GRL model
+        GRL_model: the GRL model to be trained
+        create_env: the environment creation function (see make_create_env)
+        env: the simulation environment registered to gym (single environment training)
+        n_episodes: number of training rounds
+        max_episode_len: the maximum number of steps to train in a single step
+        save_dir: model save path
+        warmup: model free exploration steps (randomly selected actions)
+        debug: model parameters related to debugging
+        num_actors: the number of actor processes (0 for no actor/learner training)
+        num_envs: the number of environments of the VectorEnv
+    """
+    if num_actors > 0:
+        from GRL_Utils.Train_Async_Q import Training_GRLModels_Async
+        Training_GRLModels_Async(GRL_Net, GRL_model, create_env, n_episodes, max_episode_len, save_dir, warmup,
+                                 debug, num_actors=num_actors)
+    elif num_envs > 1:
+        with VectorEnv(create_env, num_envs, max_episode_len) as vector_env:
+            Training_GRLModels(GRL_Net, GRL_model, vector_env, n_episodes, max_episode_len, save_dir, warmup, debug)
+    else:
+        Training_GRLModels(GRL_Net, GRL_model, env, n_episodes, max_episode_len, save_dir, warmup, debug)
+
+
 def Testing_GRLModels(GRL_Net, GRL_model, env, test_episodes, load_dir, debug):
     """
         This function is a test function for a trained GRL model
@@ -0,0 +1,191 @@
+# The python file includes the vectorized environment running several simulations in subprocesses
+import multiprocessing as mp
+import shutil
+import tempfile
+import traceback
+import numpy as np
+from GRL_Library.common.replay_buffer import to_numpy, stack_observations
+
+
+def Env_Worker(env_id, create_env, connection, max_episode_len):
+    """
+        This function is the subprocess of an environment of the VectorEnv, it executes
+        the commands ('reset', 'step', 'close') received through its connection and
+        sends back (True, result), or (False, traceback) if the environment failed.
+        An episode ending with done or after max_episode_len steps is reset at once,
+        the step result then carries the episode statistics and the reset observation
+        in its info.
+
+        Parameters:
+        --------
+        env_id: the index of the environment
+        create_env: the environment creation function (see make_create_env)
+        connection: the worker end of the pipe to the VectorEnv
+        max_episode_len: the maximum number of steps in a single episode (None for no limit)
+    """
+    env = None
+    directory = None
+    try:
+        # The network files of this environment are generated in their own directory
+        # (removed when the worker exits), the TraCI port is allocated by flow when the
+        # simulation starts
+        directory = tempfile.mkdtemp(prefix='flow_env_{}_'.format(env_id))
+        tempfile.tempdir = directory
+        env = create_env()
+        R = 0
+        t = 0
+        while True:
+            command, data = connection.recv()
+            if command == 'reset':
+                R = 0
+                t = 0
+                connection.send((True, env.reset()))
+            elif command == 'step':
+                obs, reward, done, info = env.step(data)
+                info = dict(info or {})
+                R += reward
+                t += 1
+                if done or t == max_episode_len:
+                    info['episode'] = (R, t)
+                    info['TimeLimit.truncated'] = not done
+                    info['reset_observation'] = env.reset()
+                    R = 0
+                    t = 0
+                connection.send((True, (obs, reward, done, info)))
+            elif command == 'close':
+                break
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        if env is not None:
+            env.terminate()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+        connection.close()
+
+
+class VectorEnv(object):
+    """
+        Vectorized environment running num_envs environments (e.g. MergeEnv or the
+        FigureEight environment created by make_create_env) in forked subprocesses,
+        so that the simulations of the environments advance in parallel. Every
+        environment gets its own network directory and TraCI port.
+
+        The observations of the environments are stacked (BxNxF, BxNxN, BxN, see
+        stack_observations), so that the actions of all the environments are selected
+        with one batched forward pass of the GRL model. The episodes are reset
+        automatically:
+        1.step returns the stacked next observations, which are the terminal
+        observations for the environments whose episode has ended (done, or
+        max_episode_len reached with info['TimeLimit.truncated']). Their info
+        holds info['episode'] = (episode reward, episode length).
+        2.observation holds the stacked observations to select the next actions from,
+        i.e. the reset observations of the environments whose episode has ended.
+        observations and next_observations give the same observations per environment.
+    """
+
+    def __init__(self, create_env, num_envs, max_episode_len=None):
+        """
+            <Constructor>
+
+            Parameters:
+            --------
+            create_env: the environment creation function (see make_create_env)
+            num_envs: the number of environments
+            max_episode_len: the maximum number of steps in a single episode (None for no limit)
+        """
+        ctx = mp.get_context('fork')
+        self.num_envs = num_envs
+        self.connections = []
+        self.processes = []
+        for i in range(num_envs):
+            connection, worker_connection = ctx.Pipe()
+            process = ctx.Process(target=Env_Worker,
+                                  args=(i, create_env, worker_connection, max_episode_len),
+                                  daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+        self.closed = False
+
+        self.observations = None  # observation of each environment to select the next actions from
+        self.next_observations = None  # next observation of each environment returned by the last step
+        self.observation = None  # stacked observations
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _receive(self):
+        """
+            Receive the results of the last command from all the environments.
+        """
+        results = []
+        for i, connection in enumerate(self.connections):
+            success, result = connection.recv()
+            if not success:
+                raise RuntimeError("Environment {} failed:\n{}".format(i, result))
+            results.append(result)
+        return results
+
+    def reset(self):
+        """
+            <Reset function>
+            Reset all the environments and return their stacked observations.
+        """
+        for connection in self.connections:
+            connection.send(('reset', None))
+        self.observations = self._receive()
+        self.observation = stack_observations(self.observations)
+        return self.observation
+
+    def step(self, actions):
+        """
+            <Step function>
+            Perform one step in all the environments
+
+            Parameters:
+            --------
+            actions: the actions of the environments (BxN)
+
+            Returns:
+            --------
+            the stacked next observations, the rewards (B), the dones (B) and the infos (list)
+        """
+        for connection, action in zip(self.connections, to_numpy(actions)):
+            connection.send(('step', action))
+        next_observations, rewards, dones, infos = zip(*self._receive())
+
+        self.next_observations = list(next_observations)
+        next_observation = stack_observations(self.next_observations)
+
+        # The environments whose episode has ended continue from their reset observation
+        self.observations = [info.pop('reset_observation', obs) for obs, info in zip(next_observations, infos)]
+        if any('episode' in info for info in infos):
+            self.observation = stack_observations(self.observations)
+        else:
+            self.observation = next_observation
+
+        return next_observation, np.array(rewards, dtype=np.float64), np.array(dones), list(infos)
+
+    def close(self):
+        """
+            <Close function>
+            Terminate the environments and their subprocesses.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for connection in self.connections:
+            try:
+                connection.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process, connection in zip(self.processes, self.connections):
+            process.join()
+            connection.close()
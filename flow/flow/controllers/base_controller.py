@@ -76,10 +76,12 @@ class BaseController(metaclass=ABCMeta):
             'obey_speed_limit': self.get_obey_speed_limit_action
         }
         self.failsafes = []
+        self.failsafe_names = []
         if failsafe_list:
             for check in failsafe_list:
                 if check in failsafe_map:
                     self.failsafes.append(failsafe_map.get(check))
+                    self.failsafe_names.append(check)
                 else:
                     raise ValueError('Skipping {}, as it is not a valid failsafe.'.format(check))
 
@@ -96,6 +98,228 @@ class BaseController(metaclass=ABCMeta):
         """Return the acceleration of the controller."""
         pass
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """Return the accelerations of several controllers of this class.
+
+        This calls get_accel for every controller. The car-following models
+        override it with a computation vectorized over the vehicles.
+
+        Parameters
+        ----------
+        env : flow.envs.Env
+            state of the environment at the current time step
+        controllers : list of BaseController
+            controllers of this class
+
+        Returns
+        -------
+        numpy.ndarray
+            the acceleration of each controller, nan if no acceleration is
+            specified
+        """
+        accels = [controller.get_accel(env) for controller in controllers]
+        return np.array([np.nan if accel is None else accel
+                         for accel in accels], dtype=float)
+
+    @staticmethod
+    def _get_params(controllers, name):
+        """Return the values of a parameter of several controllers."""
+        return np.array([getattr(controller, name)
+                         for controller in controllers], dtype=float)
+
+    @staticmethod
+    def get_actions(env, controllers):
+        """Convert the accelerations of several controllers into actions.
+
+        This is the batched form of get_action. The controllers are grouped by
+        class, the accelerations of each class are computed at once with
+        get_accels, and the noise and the failsafes are applied to all the
+        vehicles of a class at once (see _apply_failsafes). The controllers of
+        classes overriding get_action are evaluated one at a time.
+
+        Parameters
+        ----------
+        env : flow.envs.Env
+            state of the environment at the current time step
+        controllers : list of BaseController
+            controllers of any class
+
+        Returns
+        -------
+        list of float or None
+            the action of each controller (see get_action)
+        """
+        actions = [None] * len(controllers)
+        groups = {}
+        for i, controller in enumerate(controllers):
+            groups.setdefault(type(controller), []).append(i)
+
+        for cls, indexes in groups.items():
+            group = [controllers[i] for i in indexes]
+            if cls.get_action is not BaseController.get_action:
+                group_actions = [controller.get_action(env)
+                                 for controller in group]
+            else:
+                group_actions = cls._get_class_actions(env, group)
+            for i, action in zip(indexes, group_actions):
+                actions[i] = action
+
+        return actions
+
+    @classmethod
+    def _get_class_actions(cls, env, controllers):
+        """Compute get_action for several controllers of this class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        actions = [None] * len(controllers)
+
+        # clear the current stored accels of these vehicles to None
+        env.k.vehicle.update_accel(veh_ids, None, noise=False, failsafe=False)
+        env.k.vehicle.update_accel(veh_ids, None, noise=False, failsafe=True)
+        env.k.vehicle.update_accel(veh_ids, None, noise=True, failsafe=False)
+        env.k.vehicle.update_accel(veh_ids, None, noise=True, failsafe=True)
+
+        # the vehicles that have just entered the network (and whose data is
+        # still not subscribed) and the vehicles in a junction are described
+        # by sumo
+        edges = env.k.vehicle.get_edge(veh_ids)
+        active = np.array([len(edge) > 0 and edge[0] != ":"
+                           for edge in edges], dtype=bool)
+        accel = np.full(len(controllers), np.nan)
+        if active.any():
+            accel[active] = cls.get_accels(
+                env, [controllers[i] for i in np.flatnonzero(active)])
+
+        # if no acceleration is specified, let sumo take over for the current
+        # time step
+        defined = np.flatnonzero(~np.isnan(accel))
+        if len(defined) == 0:
+            return actions
+        controllers = [controllers[i] for i in defined]
+        veh_ids = [veh_ids[i] for i in defined]
+        accel = accel[defined]
+
+        # store the acceleration without noise to each vehicle
+        # run fail safe if requested
+        env.k.vehicle.update_accel(
+            veh_ids, accel.tolist(), noise=False, failsafe=False)
+        env.k.vehicle.update_accel(
+            veh_ids, cls._apply_failsafes(env, controllers, veh_ids, accel)
+            .tolist(), noise=False, failsafe=True)
+
+        # add noise to the accelerations, if requested
+        noise = BaseController._get_params(controllers, "accel_noise")
+        noisy = noise > 0
+        if noisy.any():
+            accel = accel.copy()
+            accel[noisy] += np.sqrt(env.sim_step) * \
+                np.random.normal(0, noise[noisy])
+        env.k.vehicle.update_accel(
+            veh_ids, accel.tolist(), noise=True, failsafe=False)
+
+        # run the fail-safes, if requested
+        accel = cls._apply_failsafes(env, controllers, veh_ids, accel)
+        env.k.vehicle.update_accel(
+            veh_ids, accel.tolist(), noise=True, failsafe=True)
+
+        for i, action in zip(defined, accel.tolist()):
+            actions[i] = action
+        return actions
+
+    @staticmethod
+    def _apply_failsafes(env, controllers, veh_ids, accel):
+        """Run the failsafes of several controllers.
+
+        The vehicles for which a failsafe may modify the action are found at
+        once (see the _unsafe_* methods), the failsafe of the controller is
+        then only run for these vehicles (which also prints its warnings).
+
+        Returns
+        -------
+        numpy.ndarray
+            the modified form of the accelerations
+        """
+        accel = np.array(accel, dtype=float)
+        groups = {}
+        for i, controller in enumerate(controllers):
+            groups.setdefault(tuple(controller.failsafe_names), []).append(i)
+
+        for names, indexes in groups.items():
+            indexes = np.array(indexes)
+            group = [controllers[i] for i in indexes]
+            group_ids = [veh_ids[i] for i in indexes]
+            for j, name in enumerate(names):
+                unsafe = getattr(BaseController, "_unsafe_" + name)(
+                    env, group, group_ids, accel[indexes])
+                for i in indexes[unsafe]:
+                    accel[i] = controllers[i].failsafes[j](env, accel[i])
+
+        return accel
+
+    @staticmethod
+    def _unsafe_instantaneous(env, controllers, veh_ids, action):
+        """Return where the "instantaneous" failsafe modifies the actions."""
+        # if there is only one vehicle in the network, all actions are safe
+        if env.k.vehicle.num_vehicles == 1:
+            return np.zeros(len(veh_ids), dtype=bool)
+
+        # if there is no other vehicle in the lane, all actions are safe
+        has_leader = np.array([lead_id is not None for lead_id in
+                               env.k.vehicle.get_leader(veh_ids)], dtype=bool)
+
+        this_vel = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        sim_step = env.sim_step
+        next_vel = this_vel + action * sim_step
+        h = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        return has_leader & (next_vel > 0) & \
+            (h < sim_step * next_vel + this_vel * 1e-3
+             + 0.5 * this_vel * sim_step)
+
+    @staticmethod
+    def _unsafe_safe_velocity(env, controllers, veh_ids, action):
+        """Return where the "safe_velocity" failsafe may modify the actions.
+
+        This includes the vehicles above the safe velocity (warnings).
+        """
+        # if there is only one vehicle in the network, all actions are safe
+        if env.k.vehicle.num_vehicles == 1:
+            return np.zeros(len(veh_ids), dtype=bool)
+
+        # safe velocity computed by a subclass
+        if type(controllers[0]).safe_velocity is not \
+                BaseController.safe_velocity:
+            return np.ones(len(veh_ids), dtype=bool)
+
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.array(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        delay = BaseController._get_params(controllers, "delay")
+
+        v_safe = 2 * h / env.sim_step + (lead_vel - this_vel) \
+            - this_vel * (2 * delay)
+
+        return (this_vel + action * env.sim_step > v_safe) | \
+            (this_vel > v_safe)
+
+    @staticmethod
+    def _unsafe_feasible_accel(env, controllers, veh_ids, action):
+        """Return where the "feasible_accel" failsafe modifies the actions."""
+        max_accel = BaseController._get_params(controllers, "max_accel")
+        max_deaccel = BaseController._get_params(controllers, "max_deaccel")
+        return (action > max_accel) | (action < -max_deaccel)
+
+    @staticmethod
+    def _unsafe_obey_speed_limit(env, controllers, veh_ids, action):
+        """Return where the "obey_speed_limit" failsafe modifies actions."""
+        edge_speed_limit = np.array(
+            [env.k.network.speed_limit(edge)
+             for edge in env.k.vehicle.get_edge(veh_ids)], dtype=float)
+        this_vel = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+
+        return this_vel + action * env.sim_step > edge_speed_limit
+
     def get_action(self, env):
         """Convert the get_accel() acceleration into an action.
 
@@ -25,13 +25,43 @@ class BaseRouter(metaclass=ABCMeta):
         ID of the vehicle this controller is used for
     router_params : dict
         Dictionary of router params
+
+    Attributes
+    ----------
+    route_events : set of str or None
+        events of the vehicle kernel the router subscribes to: "edge" (the
+        vehicle changed edge or entered the network) and/or "lane" (the
+        vehicle changed lane). choose_route is then only called at the steps
+        these events are emitted for the vehicle, which suits routers whose
+        choice only depends on the edge and lane of the vehicle. If None,
+        choose_route is called at every step.
     """
 
+    route_events = None
+
     def __init__(self, veh_id, router_params):
         """Instantiate the base class for routing controllers."""
         self.veh_id = veh_id
         self.router_params = router_params
 
+    def has_route_event(self, env):
+        """Return whether choose_route must be called at the current step.
+
+        Parameters
+        ----------
+        env : flow.envs.Env
+            see flow/envs/base.py
+
+        Returns
+        -------
+        bool
+            True if the router subscribes to no events, or if one of its
+            events was emitted for the vehicle at the last update
+        """
+        if self.route_events is None:
+            return True
+        return bool(self.route_events & env.k.vehicle.get_events(self.veh_id))
+
     @abstractmethod
     def choose_route(self, env):
         """Return the routing method implemented by the controller.
@@ -6,7 +6,10 @@ in Flow to match various prominent car-following models that can be calibrated.
 
 Each controller includes the function ``get_accel(self, env) -> acc`` which,
 using the current state of the world and existing parameters, uses the control
-model to return a vehicle acceleration.
+model to return a vehicle acceleration. The IDM, OVM, BCM, Linear OVM, Gipps
+and Bando controllers also include the batched form
+``get_accels(cls, env, controllers) -> accs``, which computes the accelerations
+of all the vehicles of a model at once (see BaseController.get_actions).
 """
 import math
 import numpy as np
@@ -181,6 +184,32 @@ class BCMController(BaseController):
             self.k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
             self.k_c * (self.v_des - this_vel)
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """See parent class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        k_d, k_v, k_c, v_des, max_accel = (
+            cls._get_params(controllers, name)
+            for name in ("k_d", "k_v", "k_c", "v_des", "max_accel"))
+
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.array(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+
+        trail_ids = env.k.vehicle.get_follower(veh_ids)
+        trail_vel = np.array(env.k.vehicle.get_speed(trail_ids), dtype=float)
+
+        headway = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        footway = np.array(env.k.vehicle.get_headway(trail_ids), dtype=float)
+
+        accel = k_d * (headway - footway) + \
+            k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
+            k_c * (v_des - this_vel)
+
+        # no car ahead
+        no_leader = np.array([not lead_id for lead_id in lead_ids], dtype=bool)
+        return np.where(no_leader, max_accel, accel)
+
 
 class LACController(BaseController):
     """Linear Adaptive Cruise Control.
@@ -339,6 +368,34 @@ class OVMController(BaseController):
 
         return self.alpha * (v_h - this_vel) + self.beta * h_dot
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """See parent class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        alpha, beta, h_st, h_go, v_max, max_accel = (
+            cls._get_params(controllers, name)
+            for name in ("alpha", "beta", "h_st", "h_go", "v_max",
+                         "max_accel"))
+
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.array(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        h_dot = lead_vel - this_vel
+
+        # V function here - input: h, output : Vh
+        v_h = np.where(
+            h <= h_st, 0,
+            np.where(h < h_go,
+                     v_max / 2 * (1 - np.cos(np.pi * (h - h_st) /
+                                             (h_go - h_st))),
+                     v_max))
+
+        # no car ahead
+        no_leader = np.array([not lead_id for lead_id in lead_ids], dtype=bool)
+        return np.where(no_leader, max_accel,
+                        alpha * (v_h - this_vel) + beta * h_dot)
+
 
 class LinearOVM(BaseController):
     """Linear OVM controller.
@@ -411,6 +468,25 @@ class LinearOVM(BaseController):
 
         return (v_h - this_vel) / self.adaptation
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """See parent class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        v_max, adaptation, h_st = (
+            cls._get_params(controllers, name)
+            for name in ("v_max", "adaptation", "h_st"))
+
+        this_vel = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        # V function here - input: h, output : Vh
+        alpha = 1.689  # the average value from Nakayama paper
+        v_h = np.where(h < h_st, 0,
+                       np.where(h <= h_st + v_max / alpha,
+                                alpha * (h - h_st), v_max))
+
+        return (v_h - this_vel) / adaptation
+
 
 class IDMController(BaseController):
     """Intelligent Driver Model (IDM) controller.
@@ -499,6 +575,32 @@ class IDMController(BaseController):
 
         return self.a * (1 - (v / self.v0)**self.delta - (s_star / h)**2)
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """See parent class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        v0, T, a, b, delta, s0 = (
+            cls._get_params(controllers, name)
+            for name in ("v0", "T", "a", "b", "delta", "s0"))
+
+        v = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        h = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        # in order to deal with ZeroDivisionError
+        h[np.abs(h) < 1e-3] = 1e-3
+
+        # no car ahead
+        no_leader = np.array([lead_id is None or lead_id == ''
+                              for lead_id in lead_ids], dtype=bool)
+        lead_vel = np.array(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        s_star = np.where(
+            no_leader, 0,
+            s0 + np.maximum(0, v * T + v * (v - lead_vel) /
+                            (2 * np.sqrt(a * b))))
+
+        return a * (1 - (v / v0)**delta - (s_star / h)**2)
+
 
 class SimCarFollowingController(BaseController):
     """Controller whose actions are purely defined by the simulator.
@@ -601,6 +703,30 @@ class GippsController(BaseController):
 
         return (v_next-v)/env.sim_step
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """See parent class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        v_desired, acc, b, b_l, s0, tau = (
+            cls._get_params(controllers, name)
+            for name in ("v_desired", "acc", "b", "b_l", "s0", "tau"))
+
+        v = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        v_l = np.array(env.k.vehicle.get_speed(
+            env.k.vehicle.get_leader(veh_ids)), dtype=float)
+
+        # get velocity dynamics
+        v_acc = v + (2.5 * acc * tau * (
+                1 - (v / v_desired)) * np.sqrt(0.025 + (v / v_desired)))
+        v_safe = (tau * b) + np.sqrt(((tau**2) * (b**2)) - (
+                b * ((2 * (h-s0)) - (tau * v) - ((v_l**2) / b_l))))
+
+        # as min, a nan safe velocity is ignored
+        v_next = np.fmin(np.fmin(v_acc, v_safe), v_desired)
+
+        return (v_next-v)/env.sim_step
+
 
 class BandoFTLController(BaseController):
     """Bando follow-the-leader controller.
@@ -679,9 +805,36 @@ class BandoFTLController(BaseController):
         s = env.k.vehicle.get_headway(self.veh_id)
         return self.accel_func(v, v_l, s)
 
+    @classmethod
+    def get_accels(cls, env, controllers):
+        """See parent class."""
+        veh_ids = [controller.veh_id for controller in controllers]
+        v_max, alpha, beta, h_st, max_accel = (
+            cls._get_params(controllers, name)
+            for name in ("v_max", "alpha", "beta", "h_st", "max_accel"))
+        want_max_accel = np.array(
+            [controller.want_max_accel for controller in controllers],
+            dtype=bool)
+
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        v_l = np.array(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        v = np.array(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        s = np.array(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        accel = cls._accel_func(v, v_l, s, v_max, alpha, beta, h_st)
+
+        # no car ahead
+        no_leader = np.array([not lead_id for lead_id in lead_ids], dtype=bool)
+        return np.where(no_leader & want_max_accel, max_accel, accel)
+
     def accel_func(self, v, v_l, s):
         """Compute the acceleration function."""
-        v_h = self.v_max * ((np.tanh(s/self.h_st-2)+np.tanh(2))/(1+np.tanh(2)))
+        return self._accel_func(v, v_l, s, self.v_max, self.alpha, self.beta,
+                                self.h_st)
+
+    @staticmethod
+    def _accel_func(v, v_l, s, v_max, alpha, beta, h_st):
+        """Compute the acceleration function (of scalars or arrays)."""
+        v_h = v_max * ((np.tanh(s/h_st-2)+np.tanh(2))/(1+np.tanh(2)))
         s_dot = v_l - v
-        u = self.alpha * (v_h - v) + self.beta * s_dot/(s**2)
+        u = alpha * (v_h - v) + beta * s_dot/(s**2)
         return u
@@ -83,6 +83,9 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         self.__non_internal_length = None  # total length of non-internal edges
         self.rts = None
         self.cfg = None
+        # edge/lane pairs in front of and behind each edge/lane pair, see
+        # next_edge_chain and prev_edge_chain
+        self._edge_chains = {}
 
     def generate_network(self, network):
         """See parent class.
@@ -99,6 +102,7 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         """
         # store the network object in the network variable
         self.network = network
+        self._edge_chains = {}
         self.orig_name = network.orig_name
         self.name = network.name
 
@@ -326,6 +330,57 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         except KeyError:
             return []
 
+    def next_edge_chain(self, edge, lane):
+        """Return the chain of edge/lane pairs in front of an edge/lane.
+
+        The chain follows the first next edge/lane pair of every edge/lane, for
+        at most as many steps as there are edges and junctions in the network.
+        It is computed once per edge/lane pair.
+
+        Returns
+        -------
+        list of (str, int, float)
+            the edge/lane pairs, with the distance from the start of the given
+            edge to their start
+        """
+        return self._edge_chain(edge, lane, forward=True)
+
+    def prev_edge_chain(self, edge, lane):
+        """Return the chain of edge/lane pairs behind an edge/lane.
+
+        The chain follows the first previous edge/lane pair of every edge/lane,
+        for at most as many steps as there are edges and junctions in the
+        network. It is computed once per edge/lane pair.
+
+        Returns
+        -------
+        list of (str, int, float)
+            the edge/lane pairs, with the distance from their start to the
+            start of the given edge
+        """
+        return self._edge_chain(edge, lane, forward=False)
+
+    def _edge_chain(self, edge, lane, forward):
+        """Compute (or return the stored) chain of an edge/lane pair."""
+        key = (edge, lane, forward)
+        if key not in self._edge_chains:
+            chain = []
+            distance = 0
+            for _ in range(len(self._edge_list) + len(self._junction_list)):
+                pairs = self.next_edge(edge, lane) if forward \
+                    else self.prev_edge(edge, lane)
+                if len(pairs) == 0:
+                    break
+                if forward:
+                    distance += self.edge_length(edge)
+                    edge, lane = pairs[0]
+                else:
+                    edge, lane = pairs[0]
+                    distance += self.edge_length(edge)
+                chain.append((edge, lane, distance))
+            self._edge_chains[key] = chain
+        return self._edge_chains[key]
+
     # TODO: nodes should have a traffic light option
     def generate_net(self,
                      net_params,
@@ -84,7 +84,8 @@ class TraCISimulation(KernelSimulation):
             tc.VAR_DELTA_T,
             tc.VAR_LOADED_VEHICLES_NUMBER,
             tc.VAR_DEPARTED_VEHICLES_NUMBER,
-            tc.VAR_ARRIVED_VEHICLES_NUMBER
+            tc.VAR_ARRIVED_VEHICLES_NUMBER,
+            tc.VAR_COLLIDING_VEHICLES_NUMBER
         ])
 
     def simulation_step(self):
@@ -153,7 +154,10 @@ class TraCISimulation(KernelSimulation):
     def check_collision(self):
         """See parent class."""
         # return self.kernel_api.simulation.getStartingTeleportNumber() != 0
-        return self.kernel_api.simulation.getCollidingVehiclesNumber()
+        # the number of colliding vehicles is part of the simulation
+        # subscription, so no additional call to sumo is needed
+        return self.kernel_api.simulation.getSubscriptionResults()[
+            tc.VAR_COLLIDING_VEHICLES_NUMBER]
 
     def start_simulation(self, network, sim_params):
         """Start a sumo simulation instance.
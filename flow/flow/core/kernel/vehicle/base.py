@@ -592,6 +592,26 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """
         pass
 
+    def get_events(self, veh_id):
+        """Return the events emitted for a vehicle at the last update.
+
+        The events are "edge" (the vehicle changed edge, or entered the
+        network) and "lane" (the vehicle changed lane). Routing controllers
+        that subscribe to these events are only called after them, see
+        flow.controllers.base_routing_controller.BaseRouter. By default, both
+        events are emitted for every vehicle at every step.
+
+        Parameters
+        ----------
+        veh_id : str
+            vehicle id
+
+        Returns
+        -------
+        set of str
+        """
+        return {"edge", "lane"}
+
     @abstractmethod
     def get_lane_headways(self, veh_id, error=list()):
         """Return the lane headways of the specified vehicles.
@@ -757,7 +777,11 @@ class KernelVehicle(object, metaclass=ABCMeta):
 
     @abstractmethod
     def update_accel(self, veh_id, accel, noise=True, failsafe=True):
-        """Update stored acceleration of vehicle with veh_id."""
+        """Update stored acceleration of vehicle with veh_id.
+
+        veh_id may also be a list of vehicles, accel is then a list of
+        accelerations or a single acceleration for all of them.
+        """
         pass
 
     @abstractmethod
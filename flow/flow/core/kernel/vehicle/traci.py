@@ -10,8 +10,6 @@ import warnings
 from flow.controllers.car_following_models import SimCarFollowingController
 from flow.controllers.rlcontroller import RLController
 from flow.controllers.lane_change_controllers import SimLaneChangeController
-from bisect import bisect_left
-import itertools
 from copy import deepcopy
 
 # colors for vehicles
@@ -66,8 +64,15 @@ class TraCIVehicle(KernelVehicle):
         # contain the minGap attribute of each type of vehicle
         self.minGap = {}
 
-        # list of vehicle ids located in each edge in the network
-        self._ids_by_edge = dict()
+        # length of each type of vehicle, read from sumo once per type
+        self._type_lengths = {}
+
+        # vehicles of each lane sorted by position (see _sort_lanes), and
+        # whether the lane leaders/followers of the rl vehicles must be
+        # computed again (see _multi_lane_headways), both are computed on
+        # first use after every update
+        self._lane_order = None
+        self._lane_headways_stale = True
 
         # number of vehicles that entered the network for every time-step
         self._num_departed = []
@@ -88,6 +93,22 @@ class TraCIVehicle(KernelVehicle):
         # old speeds used to compute accelerations
         self.previous_speeds = {}
 
+        # columnar state of the vehicles, rebuilt at every update: the row of
+        # each vehicle and one array per state variable, so that the getters
+        # of lists of vehicles are single indexed reads (see _get_column)
+        self._rows = {}
+        self._columns = {}
+
+        # integer codes of the edges (stored by the "edge" column), and the
+        # terms of the x position on each edge (see get_x_by_id)
+        self._edge_codes = {}
+        self._edge_ids = np.zeros(0, dtype=object)
+        self._edge_x = np.zeros((0, 2))
+
+        # events emitted for each vehicle at the last update ("edge" and/or
+        # "lane", see get_events)
+        self._events = {}
+
     def initialize(self, vehicles):
         """Initialize vehicle state information.
 
@@ -107,6 +128,14 @@ class TraCIVehicle(KernelVehicle):
         self.num_not_departed = 0
 
         self.__vehicles.clear()
+        self._rows = {}
+        self._columns = {}
+        self._edge_codes = {}
+        self._edge_ids = np.zeros(0, dtype=object)
+        self._edge_x = np.zeros((0, 2))
+        self._events = {}
+        self._lane_order = None
+        self._lane_headways_stale = True
         for typ in vehicles.initial:
             for i in range(typ['num_vehicles']):
                 veh_id = '{}_{}'.format(typ['veh_id'], i)
@@ -136,11 +165,14 @@ class TraCIVehicle(KernelVehicle):
         """
         # copy over the previous speeds
 
+        # the subscription results of all vehicles are collected at once (the
+        # dictionary of traci is reused by the next simulation step, so the
+        # results of the known vehicles are copied into a new one)
+        all_obs = self.kernel_api.vehicle.getAllSubscriptionResults()
         vehicle_obs = {}
         for veh_id in self.__ids:
             self.previous_speeds[veh_id] = self.get_speed(veh_id)
-            vehicle_obs[veh_id] = \
-                self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+            vehicle_obs[veh_id] = all_obs.get(veh_id)
         sim_obs = self.kernel_api.simulation.getSubscriptionResults()
 
         arrived_rl_ids = []
@@ -169,8 +201,7 @@ class TraCIVehicle(KernelVehicle):
                 # updated
                 pass
             else:
-                veh_type = self.kernel_api.vehicle.getTypeID(veh_id)
-                obs = self._add_departed(veh_id, veh_type)
+                obs = self._add_departed(veh_id)
                 # add the subscription information of the new vehicle
                 vehicle_obs[veh_id] = obs
 
@@ -257,27 +288,192 @@ class TraCIVehicle(KernelVehicle):
         # update the sumo observations variable
         self.__sumo_obs = vehicle_obs.copy()
 
-        # update the lane leaders data for each vehicle
-        self._multi_lane_headways()
+        # update the columnar state of the vehicles, and emit the events of
+        # the vehicles that changed edge or lane since the last update
+        prev_rows, prev_columns = self._rows, self._columns
+        self._update_columns()
+        self._update_events(prev_rows, prev_columns, reset)
+
+        # the lane leaders data is computed again when first requested
+        self._lane_order = None
+        self._lane_headways_stale = True
 
         # make sure the rl vehicle list is still sorted
         self.__rl_ids.sort()
 
-    def _add_departed(self, veh_id, veh_type):
+    def _update_columns(self):
+        """Rebuild the columnar state of the vehicles.
+
+        Every vehicle with sumo observations gets a row in the "speed",
+        "lane", "position", "edge" (edge codes), "leader", "headway" and
+        "last_lc" columns. Vehicles without observations get no row, so that
+        the getters return the error value for them.
+        """
+        ids = [veh_id for veh_id in self.__ids if self.__sumo_obs.get(veh_id)]
+        obs = [self.__sumo_obs[veh_id] for veh_id in ids]
+        vehicles = [self.__vehicles.get(veh_id, {}) for veh_id in ids]
+
+        self._rows = {veh_id: row for row, veh_id in enumerate(ids)}
+        self._columns = {
+            "speed": np.array(
+                [o.get(tc.VAR_SPEED, -1001) for o in obs], dtype=float),
+            "lane": np.array(
+                [o.get(tc.VAR_LANE_INDEX, -1001) for o in obs], dtype=int),
+            "position": np.array(
+                [o.get(tc.VAR_LANEPOSITION, -1001) for o in obs], dtype=float),
+            "edge": np.array(
+                [self._edge_code(o.get(tc.VAR_ROAD_ID, "")) for o in obs],
+                dtype=int),
+            "leader": np.array(
+                [veh.get("leader") for veh in vehicles] + [None],
+                dtype=object)[:-1],
+            "headway": np.array(
+                [veh.get("headway", -1001) for veh in vehicles], dtype=float),
+            "last_lc": np.array(
+                [veh.get("last_lc", -float("inf")) for veh in vehicles],
+                dtype=float),
+            "length": np.array(
+                [veh.get("length", -1001) for veh in vehicles], dtype=float),
+        }
+
+    def _update_events(self, prev_rows, prev_columns, reset):
+        """Emit the edge-change and lane-change events of the last step.
+
+        A vehicle gets the "edge" event if its edge differs from its edge at
+        the previous update, and the "lane" event if its lane does. Vehicles
+        that were not in the network at the previous update (or all vehicles
+        after a reset) get both events.
+
+        Parameters
+        ----------
+        prev_rows : dict
+            rows of the vehicles at the previous update
+        prev_columns : dict
+            columnar state of the vehicles at the previous update
+        reset : bool
+            specifies whether the simulator was reset in the last simulation
+            step
+        """
+        ids = list(self._rows)
+        if reset or not prev_rows:
+            self._events = {veh_id: {"edge", "lane"} for veh_id in ids}
+            return
+
+        prev = np.fromiter((prev_rows.get(veh_id, -1) for veh_id in ids),
+                           dtype=int, count=len(ids))
+        new = prev < 0
+        prev[new] = 0
+        edge_changed = new | (
+            self._columns["edge"] != prev_columns["edge"][prev])
+        lane_changed = new | (
+            self._columns["lane"] != prev_columns["lane"][prev])
+
+        self._events = {}
+        for i in np.flatnonzero(edge_changed):
+            self._events[ids[i]] = {"edge"}
+        for i in np.flatnonzero(lane_changed):
+            self._events.setdefault(ids[i], set()).add("lane")
+
+    def _edge_code(self, edge):
+        """Return the integer code of an edge (new edges get the next code)."""
+        code = self._edge_codes.get(edge)
+        if code is None:
+            code = len(self._edge_codes)
+            self._edge_codes[edge] = code
+            self._edge_ids = np.append(self._edge_ids, None)
+            self._edge_ids[code] = edge
+            # the x terms are computed when first needed (see get_x_by_id)
+            self._edge_x = np.vstack([self._edge_x, [np.nan, np.nan]])
+        return code
+
+    def _get_rows(self, veh_ids):
+        """Return the rows of the vehicles, and the mask of unknown vehicles.
+
+        The unknown vehicles are given the row 0, their values must be replaced
+        by the error value.
+        """
+        rows = np.fromiter((self._rows.get(veh_id, -1) for veh_id in veh_ids),
+                           dtype=int, count=len(veh_ids))
+        missing = rows < 0
+        rows[missing] = 0
+        return rows, missing
+
+    def _get_column(self, column, veh_ids, error):
+        """Return the values of a state column for a list of vehicles.
+
+        Parameters
+        ----------
+        column : str
+            name of the column, see _update_columns
+        veh_ids : list of str or numpy.ndarray
+            vehicle identifiers
+        error : any
+            value returned for the vehicles that are not in the network
+
+        Returns
+        -------
+        list
+            the value of each vehicle
+        """
+        rows, missing = self._get_rows(veh_ids)
+        if missing.all():
+            return [error] * len(rows)
+        values = self._columns[column][rows]
+        if column == "edge":
+            values = self._edge_ids[values]
+        values = values.tolist()
+        for i in np.flatnonzero(missing):
+            values[i] = error
+        return values
+
+    def _set_column(self, column, veh_id, value):
+        """Set the value of a state column for a vehicle (if it has a row)."""
+        row = self._rows.get(veh_id)
+        if row is not None:
+            if column == "edge":
+                value = self._edge_code(value)
+            self._columns[column][row] = value
+
+    def _add_departed(self, veh_id, veh_type=None):
         """Add a vehicle that entered the network from an inflow or reset.
 
+        The vehicle is subscribed first, and its type and initial state are
+        read from the subscription results returned by sumo with the
+        subscription, instead of one getter call (and round-trip) each.
+
         Parameters
         ----------
         veh_id: str
             name of the vehicle
-        veh_type: str
-            type of vehicle, as specified to sumo
+        veh_type: str, optional
+            type of vehicle, as specified to sumo. Read from the subscription
+            results if not given
 
         Returns
         -------
         dict
             subscription results from the new vehicle
         """
+        # subscribe the new vehicle
+        self.kernel_api.vehicle.subscribe(veh_id, [
+            tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
+            tc.VAR_ROAD_ID,
+            tc.VAR_SPEED,
+            tc.VAR_EDGES,
+            tc.VAR_POSITION,
+            tc.VAR_ANGLE,
+            tc.VAR_SPEED_WITHOUT_TRACI,
+            tc.VAR_FUELCONSUMPTION,
+            tc.VAR_DISTANCE,
+            tc.VAR_TYPE
+        ])
+        self.kernel_api.vehicle.subscribeLeader(veh_id, 2000)
+
+        # get the subscription results from the new vehicle
+        new_obs = self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+
+        if veh_type is None:
+            veh_type = new_obs[tc.VAR_TYPE]
         if veh_type not in self.type_parameters:
             raise KeyError("Entering vehicle is not a valid type.")
 
@@ -327,23 +523,12 @@ class TraCIVehicle(KernelVehicle):
                 if lc_controller[0] != SimLaneChangeController:
                     self.__controlled_lc_ids.append(veh_id)
 
-        # subscribe the new vehicle
-        self.kernel_api.vehicle.subscribe(veh_id, [
-            tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
-            tc.VAR_ROAD_ID,
-            tc.VAR_SPEED,
-            tc.VAR_EDGES,
-            tc.VAR_POSITION,
-            tc.VAR_ANGLE,
-            tc.VAR_SPEED_WITHOUT_TRACI,
-            tc.VAR_FUELCONSUMPTION,
-            tc.VAR_DISTANCE
-        ])
-        self.kernel_api.vehicle.subscribeLeader(veh_id, 2000)
-
-        # some constant vehicle parameters to the vehicles class
-        self.__vehicles[veh_id]["length"] = self.kernel_api.vehicle.getLength(
-            veh_id)
+        # some constant vehicle parameters to the vehicles class (the length
+        # is the length of the type, which is only read once)
+        if veh_type not in self._type_lengths:
+            self._type_lengths[veh_type] = \
+                self.kernel_api.vehicle.getLength(veh_id)
+        self.__vehicles[veh_id]["length"] = self._type_lengths[veh_type]
 
         # set the "last_lc" parameter of the vehicle
         self.__vehicles[veh_id]["last_lc"] = -float("inf")
@@ -364,24 +549,14 @@ class TraCIVehicle(KernelVehicle):
 
         # get initial state info
         self.__sumo_obs[veh_id] = dict()
-        self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = \
-            self.kernel_api.vehicle.getRoadID(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = \
-            self.kernel_api.vehicle.getLanePosition(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = \
-            self.kernel_api.vehicle.getLaneIndex(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_SPEED] = \
-            self.kernel_api.vehicle.getSpeed(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_FUELCONSUMPTION] = \
-            self.kernel_api.vehicle.getFuelConsumption(veh_id)
+        for var in (tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION, tc.VAR_LANE_INDEX,
+                    tc.VAR_SPEED, tc.VAR_FUELCONSUMPTION):
+            self.__sumo_obs[veh_id][var] = new_obs[var]
 
         # make sure that the order of rl_ids is kept sorted
         self.__rl_ids.sort()
         self.num_rl_vehicles = len(self.__rl_ids)
 
-        # get the subscription results from the new vehicle
-        new_obs = self.kernel_api.vehicle.getSubscriptionResults(veh_id)
-
         return new_obs
 
     def reset(self):
@@ -404,6 +579,9 @@ class TraCIVehicle(KernelVehicle):
 
         if veh_id in self.__sumo_obs:
             del self.__sumo_obs[veh_id]
+        self._rows.pop(veh_id, None)
+        self._lane_order = None
+        self._lane_headways_stale = True
 
         # remove it from all other id lists (if it is there)
         if veh_id in self.__human_ids:
@@ -424,10 +602,14 @@ class TraCIVehicle(KernelVehicle):
     def test_set_speed(self, veh_id, speed):
         """Set the speed of the specified vehicle."""
         self.__sumo_obs[veh_id][tc.VAR_SPEED] = speed
+        self._set_column("speed", veh_id, speed)
 
     def test_set_edge(self, veh_id, edge):
         """Set the speed of the specified vehicle."""
         self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = edge
+        self._set_column("edge", veh_id, edge)
+        self._lane_order = None
+        self._lane_headways_stale = True
 
     def set_follower(self, veh_id, follower):
         """Set the follower of the specified vehicle."""
@@ -436,6 +618,7 @@ class TraCIVehicle(KernelVehicle):
     def set_headway(self, veh_id, headway):
         """Set the headway of the specified vehicle."""
         self.__vehicles[veh_id]["headway"] = headway
+        self._set_column("headway", veh_id, headway)
 
     def get_orientation(self, veh_id):
         """See parent class."""
@@ -495,7 +678,7 @@ class TraCIVehicle(KernelVehicle):
         """See parent class."""
         if isinstance(edges, (list, np.ndarray)):
             return sum([self.get_ids_by_edge(edge) for edge in edges], [])
-        return self._ids_by_edge.get(edges, []) or []
+        return self._sort_lanes()["ids_by_edge"].get(edges, [])
 
     def get_inflow_rate(self, time_span):
         """See parent class."""
@@ -556,7 +739,7 @@ class TraCIVehicle(KernelVehicle):
     def get_speed(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_speed(vehID, error) for vehID in veh_id]
+            return self._get_column("speed", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_SPEED, error)
 
     def get_default_speed(self, veh_id, error=-1001):
@@ -569,19 +752,19 @@ class TraCIVehicle(KernelVehicle):
     def get_position(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_position(vehID, error) for vehID in veh_id]
+            return self._get_column("position", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANEPOSITION, error)
 
     def get_edge(self, veh_id, error=""):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_edge(vehID, error) for vehID in veh_id]
+            return self._get_column("edge", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_ROAD_ID, error)
 
     def get_lane(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_lane(vehID, error) for vehID in veh_id]
+            return self._get_column("lane", veh_id, error)
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANE_INDEX, error)
 
     def get_route(self, veh_id, error=None):
@@ -595,13 +778,13 @@ class TraCIVehicle(KernelVehicle):
     def get_length(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_length(vehID, error) for vehID in veh_id]
+            return self._get_column("length", veh_id, error)
         return self.__vehicles.get(veh_id, {}).get("length", error)
 
     def get_leader(self, veh_id, error=""):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_leader(vehID, error) for vehID in veh_id]
+            return self._get_column("leader", veh_id, error)
         return self.__vehicles.get(veh_id, {}).get("leader", error)
 
     def get_follower(self, veh_id, error=""):
@@ -613,13 +796,17 @@ class TraCIVehicle(KernelVehicle):
     def get_headway(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_headway(vehID, error) for vehID in veh_id]
+            return self._get_column("headway", veh_id, error)
         return self.__vehicles.get(veh_id, {}).get("headway", error)
 
     def get_last_lc(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_headway(vehID, error) for vehID in veh_id]
+            # the non RL vehicles get the error value
+            rl_ids = set(self.__rl_ids)
+            last_lc = self._get_column("last_lc", veh_id, error)
+            return [lc if vehID in rl_ids else error
+                    for vehID, lc in zip(veh_id, last_lc)]
 
         # print("veh_id:", veh_id)
         # print("__rl_ids:", self.__rl_ids)
@@ -629,7 +816,7 @@ class TraCIVehicle(KernelVehicle):
                           ' {}.'.format(veh_id, error))
             return error
         else:
-            return self.__vehicles.get(veh_id, {}).get("headway", error)
+            return self.__vehicles.get(veh_id, {}).get("last_lc", error)
 
     def get_acc_controller(self, veh_id, error=None):
         """See parent class."""
@@ -654,6 +841,10 @@ class TraCIVehicle(KernelVehicle):
             ]
         return self.__vehicles.get(veh_id, {}).get("router", error)
 
+    def get_events(self, veh_id):
+        """See parent class."""
+        return self._events.get(veh_id, frozenset())
+
     def set_lane_headways(self, veh_id, lane_headways):
         """Set the lane headways of the specified vehicle."""
         self.__vehicles[veh_id]["lane_headways"] = lane_headways
@@ -664,6 +855,8 @@ class TraCIVehicle(KernelVehicle):
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_headways(vehID, error) for vehID in veh_id]
+        if self._lane_headways_stale:
+            self._multi_lane_headways()
         return self.__vehicles.get(veh_id, {}).get("lane_headways", error)
 
     def get_lane_leaders_speed(self, veh_id, error=None):
@@ -688,6 +881,8 @@ class TraCIVehicle(KernelVehicle):
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_leaders(vehID, error) for vehID in veh_id]
+        if self._lane_headways_stale:
+            self._multi_lane_headways()
         return self.__vehicles[veh_id]["lane_leaders"]
 
     def set_lane_tailways(self, veh_id, lane_tailways):
@@ -700,6 +895,8 @@ class TraCIVehicle(KernelVehicle):
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_tailways(vehID, error) for vehID in veh_id]
+        if self._lane_headways_stale:
+            self._multi_lane_headways()
         return self.__vehicles.get(veh_id, {}).get("lane_tailways", error)
 
     def set_lane_followers(self, veh_id, lane_followers):
@@ -712,166 +909,206 @@ class TraCIVehicle(KernelVehicle):
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_followers(vehID, error) for vehID in veh_id]
+        if self._lane_headways_stale:
+            self._multi_lane_headways()
         return self.__vehicles.get(veh_id, {}).get("lane_followers", error)
 
-    def _multi_lane_headways(self):
-        """Compute multi-lane data for all vehicles.
-
-        This includes the lane leaders/followers/headways/tailways/
-        leader velocity/follower velocity for all
-        vehicles in the network.
-        """
-        edge_list = self.master_kernel.network.get_edge_list()
-        junction_list = self.master_kernel.network.get_junction_list()
-        tot_list = edge_list + junction_list
-        num_edges = (len(self.master_kernel.network.get_edge_list()) + len(
-            self.master_kernel.network.get_junction_list()))
-
-        # maximum number of lanes in the network
-        max_lanes = max([self.master_kernel.network.num_lanes(edge_id)
-                         for edge_id in tot_list])
-
-        # Key = edge id
-        # Element = list, with the ith element containing tuples with the name
-        #           and position of all vehicles in lane i
-        edge_dict = dict.fromkeys(tot_list)
-
-        # add the vehicles to the edge_dict element
-        for veh_id in self.get_ids():
-            edge = self.get_edge(veh_id)
-            lane = self.get_lane(veh_id)
-            pos = self.get_position(veh_id)
-            if edge:
-                if edge_dict[edge] is None:
-                    edge_dict[edge] = [[] for _ in range(max_lanes)]
-                edge_dict[edge][lane].append((veh_id, pos))
-
-        # sort all lanes in each edge by position
-        for edge in tot_list:
-            if edge_dict[edge] is None:
-                del edge_dict[edge]
-            else:
-                for lane in range(max_lanes):
-                    edge_dict[edge][lane].sort(key=lambda x: x[1])
-
-        for veh_id in self.get_rl_ids():
-            # collect the lane leaders, followers, headways, and tailways for
-            # each vehicle
-            edge = self.get_edge(veh_id)
-            if edge:
-                headways, tailways, leaders, followers = \
-                    self._multi_lane_headways_util(veh_id, edge_dict,
-                                                   num_edges)
-
-                # add the above values to the vehicles class
-                self.set_lane_headways(veh_id, headways)
-                self.set_lane_tailways(veh_id, tailways)
-                self.set_lane_leaders(veh_id, leaders)
-                self.set_lane_followers(veh_id, followers)
-
-        self._ids_by_edge = dict().fromkeys(edge_list)
-
-        for edge_id in edge_dict:
-            edges = list(itertools.chain.from_iterable(edge_dict[edge_id]))
-            # check for edges with no vehicles
-            if len(edges) > 0:
-                edges, _ = zip(*edges)
-                self._ids_by_edge[edge_id] = list(edges)
-            else:
-                self._ids_by_edge[edge_id] = []
+    def _sort_lanes(self):
+        """Sort the vehicles of each lane by position.
 
-    def _multi_lane_headways_util(self, veh_id, edge_dict, num_edges):
-        """Compute multi-lane data for the specified vehicle.
-
-        Parameters
-        ----------
-        veh_id : str
-            name of the vehicle
-        edge_dict : dict < list<tuple> >
-            Key = Edge name
-                Index = lane index
-                Element = list sorted by position of (vehicle id, position)
+        The vehicles of the network (with an edge) are sorted at once by edge,
+        lane and position. The result is stored until the next update.
 
         Returns
         -------
-        headway : list<float>
-            Index = lane index
-            Element = headway at this lane
-        tailway : list<float>
-            Index = lane index
-            Element = tailway at this lane
-        lead_speed : list<str>
-            Index = lane index
-            Element = speed of leader at this lane
-        follow_speed : list<str>
-            Index = lane index
-            Element = speed of follower at this lane
-        leader : list<str>
-            Index = lane index
-            Element = leader at this lane
-        follower : list<str>
-            Index = lane index
-            Element = follower at this lane
+        dict
+            * "ids", "rows", "edges" (edge codes), "lanes", "positions",
+              "lengths": the sorted vehicles and their state
+            * "lane_keys": sorted lane keys (edge code * num_lanes + lane) of
+              the vehicles
+            * "keys": sorted integer keys of the vehicles, ordered as their
+              (lane key, position), see _lane_search_keys
+            * "sorted_positions": all the positions, sorted
+            * "segments": Key = lane key, Element = (start, end) of the
+              vehicles of the lane in the sorted arrays
+            * "num_lanes": number of lanes of the lane keys
+            * "ids_by_edge": Key = edge id, Element = the ids of the vehicles
+              on the edge
         """
-        this_pos = self.get_position(veh_id)
-        this_edge = self.get_edge(veh_id)
-        this_lane = self.get_lane(veh_id)
-        num_lanes = self.master_kernel.network.num_lanes(this_edge)
-
-        # set default values for all output values
-        headway = [1000] * num_lanes
-        tailway = [1000] * num_lanes
-        leader = [""] * num_lanes
-        follower = [""] * num_lanes
-
-        for lane in range(num_lanes):
-            # check the vehicle's current  edge for lane leaders and followers
-            if len(edge_dict[this_edge][lane]) > 0:
-                ids, positions = zip(*edge_dict[this_edge][lane])
-                ids = list(ids)
-                positions = list(positions)
-                index = bisect_left(positions, this_pos)
-
-                # if you are at the end or the front of the edge, the lane
-                # leader is in the edges in front of you
-                if (lane == this_lane and index < len(positions) - 1) \
-                        or (lane != this_lane and index < len(positions)):
-                    # check if the index does not correspond to the current
-                    # vehicle
-                    if ids[index] == veh_id:
-                        leader[lane] = ids[index + 1]
-                        headway[lane] = (positions[index + 1] - this_pos -
-                                         self.get_length(leader[lane]))
-                    else:
-                        leader[lane] = ids[index]
-                        headway[lane] = (positions[index] - this_pos
-                                         - self.get_length(leader[lane]))
-
-                # you are in the back of the queue, the lane follower is in the
-                # edges behind you
-                if index > 0:
-                    follower[lane] = ids[index - 1]
-                    tailway[lane] = (this_pos - positions[index - 1]
-                                     - self.get_length(veh_id))
-
-            # if lane leader not found, check next edges
-            if leader[lane] == "":
-                headway[lane], leader[lane] = self._next_edge_leaders(
-                    veh_id, edge_dict, lane, num_edges)
-
-            # if lane follower not found, check previous edges
-            if follower[lane] == "":
-                tailway[lane], follower[lane] = self._prev_edge_followers(
-                    veh_id, edge_dict, lane, num_edges)
-
-        return headway, tailway, leader, follower
-
-    def _next_edge_leaders(self, veh_id, edge_dict, lane, num_edges):
+        if self._lane_order is not None:
+            return self._lane_order
+
+        ids = np.array(list(self._rows.keys()) + [None], dtype=object)[:-1]
+        rows = np.fromiter(self._rows.values(), dtype=int, count=len(ids))
+        if len(rows) > 0:
+            edges = self._columns["edge"][rows]
+            lanes = self._columns["lane"][rows]
+            # vehicles without an edge (e.g. teleported) are not in any lane
+            keep = (self._edge_ids[edges] != "") & (lanes >= 0)
+            ids, rows, edges, lanes = \
+                ids[keep], rows[keep], edges[keep], lanes[keep]
+        else:
+            edges = lanes = rows
+        positions = self._columns["position"][rows] if len(rows) > 0 \
+            else np.zeros(0)
+
+        num_lanes = int(lanes.max()) + 1 if len(lanes) > 0 else 1
+        lane_keys = edges * num_lanes + lanes
+        order = np.lexsort((positions, lane_keys))
+        ids, rows, edges, lanes, positions, lane_keys = \
+            ids[order], rows[order], edges[order], lanes[order], \
+            positions[order], lane_keys[order]
+
+        lane_order = {
+            "ids": ids,
+            "rows": rows,
+            "edges": edges,
+            "lanes": lanes,
+            "positions": positions,
+            "lengths": self._columns["length"][rows] if len(rows) > 0
+            else np.zeros(0),
+            "lane_keys": lane_keys,
+            "sorted_positions": np.sort(positions),
+            "num_lanes": num_lanes,
+        }
+        lane_order["keys"] = self._lane_search_keys(
+            lane_order, lane_keys, positions)
+
+        unique, starts, counts = np.unique(
+            lane_keys, return_index=True, return_counts=True)
+        lane_order["segments"] = dict(zip(
+            unique.tolist(), zip(starts.tolist(), (starts + counts).tolist())))
+
+        unique, starts = np.unique(edges, return_index=True)
+        ends = np.append(starts[1:], len(ids))
+        lane_order["ids_by_edge"] = {
+            self._edge_ids[code]: ids[start:end].tolist()
+            for code, start, end in zip(unique, starts, ends)}
+
+        self._lane_order = lane_order
+        return lane_order
+
+    @staticmethod
+    def _lane_search_keys(lane_order, lane_keys, positions):
+        """Return integer keys ordered as (lane key, position).
+
+        The positions are replaced by their rank among the positions of the
+        vehicles, so that searching the key of a position in "keys" gives the
+        index of bisect_left in the positions of its lane.
+        """
+        ranks = np.searchsorted(lane_order["sorted_positions"], positions)
+        return lane_keys * (len(lane_order["sorted_positions"]) + 1) + ranks
+
+    def _lane_segment(self, lane_order, edge, lane):
+        """Return the (start, end) of the vehicles of a lane, None if empty."""
+        code = self._edge_codes.get(edge)
+        if code is None or not 0 <= lane < lane_order["num_lanes"]:
+            return None
+        return lane_order["segments"].get(code * lane_order["num_lanes"]
+                                          + lane)
+
+    def _multi_lane_headways(self):
+        """Compute multi-lane data for all rl vehicles.
+
+        This includes the lane leaders/followers/headways/tailways for all rl
+        vehicles in the network. It is computed when these values are first
+        requested after an update. The lane leaders and followers in all the
+        lanes of the edges of the rl vehicles are searched at once in the
+        sorted lanes (see _sort_lanes), the next (previous) edges are only
+        searched when the leader (follower) is not on the same edge, see
+        _next_edge_leaders and _prev_edge_followers.
+        """
+        self._lane_headways_stale = False
+        lane_order = self._sort_lanes()
+        network = self.master_kernel.network
+
+        # position of the rl vehicles in the sorted vehicles
+        sorted_index = np.full(len(self._columns.get("edge", [])), -1)
+        sorted_index[lane_order["rows"]] = np.arange(len(lane_order["rows"]))
+        rl_ids = [veh_id for veh_id in self.__rl_ids
+                  if veh_id in self._rows
+                  and sorted_index[self._rows[veh_id]] >= 0]
+        if not rl_ids:
+            return
+        rl_index = sorted_index[[self._rows[veh_id] for veh_id in rl_ids]]
+
+        # one query per rl vehicle and lane of its edge
+        edge_lanes = np.array([
+            max(network.num_lanes(self._edge_ids[code]), 0)
+            for code in lane_order["edges"][rl_index]], dtype=int)
+        query = np.repeat(rl_index, edge_lanes)
+        lane = np.arange(len(query)) - \
+            np.repeat(np.cumsum(edge_lanes) - edge_lanes, edge_lanes)
+        this_pos = lane_order["positions"][query]
+
+        # (start, end) of the vehicles of the lane and the index of
+        # bisect_left of the position of the rl vehicle in the lane
+        lane_keys = lane_order["edges"][query] * lane_order["num_lanes"] + lane
+        start = np.searchsorted(lane_order["lane_keys"], lane_keys, "left")
+        end = np.searchsorted(lane_order["lane_keys"], lane_keys, "right")
+        index = np.searchsorted(
+            lane_order["keys"],
+            self._lane_search_keys(lane_order, lane_keys, this_pos), "left")
+        empty = lane >= lane_order["num_lanes"]
+        start[empty], end[empty], index[empty] = 0, 0, 0
+
+        # if you are at the end or the front of the edge, the lane leader is
+        # in the edges in front of you (if the index corresponds to the
+        # current vehicle, its leader is the next one)
+        same_lane = lane == lane_order["lanes"][query]
+        has_leader = np.where(same_lane, index < end - 1, index < end)
+        leader_index = np.minimum(np.where(index == query, index + 1, index),
+                                  len(lane_order["ids"]) - 1)
+        headway = np.where(
+            has_leader,
+            lane_order["positions"][leader_index] - this_pos
+            - lane_order["lengths"][leader_index], 1000.)
+        leader = np.where(has_leader, lane_order["ids"][leader_index], "")
+
+        # you are in the back of the queue, the lane follower is in the edges
+        # behind you
+        has_follower = index > start
+        follower_index = np.maximum(index - 1, 0)
+        tailway = np.where(
+            has_follower,
+            this_pos - lane_order["positions"][follower_index]
+            - lane_order["lengths"][query], 1000.)
+        follower = np.where(has_follower,
+                            lane_order["ids"][follower_index], "")
+
+        # if lane leader/follower not found, check next/previous edges
+        for i in np.flatnonzero(~has_leader):
+            headway[i], leader[i] = self._next_edge_leaders(
+                lane_order, query[i], lane[i])
+        for i in np.flatnonzero(~has_follower):
+            tailway[i], follower[i] = self._prev_edge_followers(
+                lane_order, query[i], lane[i])
+
+        # add the above values to the vehicles class
+        splits = np.cumsum(edge_lanes)[:-1]
+        for veh_id, headways, tailways, leaders, followers in zip(
+                rl_ids, np.split(headway, splits), np.split(tailway, splits),
+                np.split(leader, splits), np.split(follower, splits)):
+            self.set_lane_headways(veh_id, headways.tolist())
+            self.set_lane_tailways(veh_id, tailways.tolist())
+            self.set_lane_leaders(veh_id, leaders.tolist())
+            self.set_lane_followers(veh_id, followers.tolist())
+
+    def _next_edge_leaders(self, lane_order, index, lane):
         """Search for leaders in the next edge.
 
         Looks to the edges/junctions in front of the vehicle's current edge
-        for potential leaders. This is currently done by only looking one
-        edge/junction forwards.
+        for potential leaders, along the chain of next edge/lane pairs of the
+        network (see next_edge_chain).
+
+        Parameters
+        ----------
+        lane_order : dict
+            the sorted vehicles, see _sort_lanes
+        index : int
+            index of the vehicle in the sorted vehicles
+        lane : int
+            lane of the current edge to search the leader of
 
         Returns
         -------
@@ -880,43 +1117,36 @@ class TraCIVehicle(KernelVehicle):
         leader : str
             lane leader for the specified lane
         """
-        pos = self.get_position(veh_id)
-        edge = self.get_edge(veh_id)
-
-        headway = 1000  # env.network.length
-        leader = ""
-        add_length = 0  # length increment in headway
-
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(self.master_kernel.network.next_edge(edge, lane)) == 0:
-                break
-
-            add_length += self.master_kernel.network.edge_length(edge)
-            edge, lane = self.master_kernel.network.next_edge(edge, lane)[0]
-
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    leader = edge_dict[edge][lane][0][0]
-                    headway = edge_dict[edge][lane][0][1] - pos + add_length \
-                        - self.get_length(leader)
-            except KeyError:
-                # current edge has no vehicles, so move on
-                # print(traceback.format_exc())
-                continue
-
-            # stop if a lane follower is found
-            if leader != "":
-                break
-
-        return headway, leader
-
-    def _prev_edge_followers(self, veh_id, edge_dict, lane, num_edges):
+        pos = lane_order["positions"][index]
+        edge = self._edge_ids[lane_order["edges"][index]]
+
+        for next_edge, next_lane, add_length in \
+                self.master_kernel.network.next_edge_chain(edge, lane):
+            segment = self._lane_segment(lane_order, next_edge, next_lane)
+            # stop if a lane leader is found
+            if segment is not None:
+                first = segment[0]
+                return (lane_order["positions"][first] - pos + add_length
+                        - lane_order["lengths"][first],
+                        lane_order["ids"][first])
+
+        return 1000, ""
+
+    def _prev_edge_followers(self, lane_order, index, lane):
         """Search for followers in the previous edge.
 
         Looks to the edges/junctions behind the vehicle's current edge for
-        potential followers. This is currently done by only looking one
-        edge/junction backwards.
+        potential followers, along the chain of previous edge/lane pairs of
+        the network (see prev_edge_chain).
+
+        Parameters
+        ----------
+        lane_order : dict
+            the sorted vehicles, see _sort_lanes
+        index : int
+            index of the vehicle in the sorted vehicles
+        lane : int
+            lane of the current edge to search the follower of
 
         Returns
         -------
@@ -925,36 +1155,20 @@ class TraCIVehicle(KernelVehicle):
         follower : str
             lane follower for the specified lane
         """
-        pos = self.get_position(veh_id)
-        edge = self.get_edge(veh_id)
-
-        tailway = 1000  # env.network.length
-        follower = ""
-        add_length = 0  # length increment in headway
-
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(self.master_kernel.network.prev_edge(edge, lane)) == 0:
-                break
-
-            edge, lane = self.master_kernel.network.prev_edge(edge, lane)[0]
-            add_length += self.master_kernel.network.edge_length(edge)
-
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    tailway = pos - edge_dict[edge][lane][-1][1] + add_length \
-                              - self.get_length(veh_id)
-                    follower = edge_dict[edge][lane][-1][0]
-            except KeyError:
-                # current edge has no vehicles, so move on
-                # print(traceback.format_exc())
-                continue
+        pos = lane_order["positions"][index]
+        edge = self._edge_ids[lane_order["edges"][index]]
 
+        for prev_edge, prev_lane, add_length in \
+                self.master_kernel.network.prev_edge_chain(edge, lane):
+            segment = self._lane_segment(lane_order, prev_edge, prev_lane)
             # stop if a lane follower is found
-            if follower != "":
-                break
+            if segment is not None:
+                last = segment[1] - 1
+                return (pos - lane_order["positions"][last] + add_length
+                        - lane_order["lengths"][index],
+                        lane_order["ids"][last])
 
-        return tailway, follower
+        return 1000, ""
 
     def apply_acceleration(self, veh_ids, acc, smooth=True):
         """See parent class."""
@@ -1017,14 +1231,50 @@ class TraCIVehicle(KernelVehicle):
             route_choices = [route_choices]
 
         for i, veh_id in enumerate(veh_ids):
-            if route_choices[i] is not None:
+            if route_choices[i] is not None and \
+                    not self._is_current_route(veh_id, route_choices[i]):
                 self.kernel_api.vehicle.setRoute(
                     vehID=veh_id, edgeList=route_choices[i])
 
+    def _is_current_route(self, veh_id, route):
+        """Return whether a route choice leaves the route of a vehicle as is.
+
+        This is the case if the route is the current route of the vehicle, or
+        the part of it starting with the current edge (if that edge appears
+        only once in the current route), so that no setRoute command needs to
+        be sent.
+        """
+        route = list(route)
+        current_route = list(self.get_route(veh_id))
+        if route == current_route:
+            return True
+        edge = self.get_edge(veh_id)
+        if current_route.count(edge) != 1:
+            return False
+        return current_route[current_route.index(edge):] == route
+
     def get_x_by_id(self, veh_id):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_x_by_id(vehID) for vehID in veh_id]
+            rows, missing = self._get_rows(veh_id)
+            if missing.all():
+                return [0.] * len(rows)
+            codes = self._columns["edge"][rows]
+            # network.get_x is affine in the position on an edge, its terms
+            # are computed once per edge
+            for code in np.unique(codes[np.isnan(self._edge_x[codes, 0])]):
+                edge = self._edge_ids[code]
+                if edge == '':
+                    self._edge_x[code] = 0.
+                else:
+                    get_x = self.master_kernel.network.get_x
+                    start = get_x(edge, 0.)
+                    self._edge_x[code] = start, get_x(edge, 1.) - start
+            x = self._edge_x[codes, 0] + \
+                self._edge_x[codes, 1] * self._columns["position"][rows]
+            # occurs when a vehicle crashes is teleported for some other reason
+            x[missing] = 0.
+            return x.tolist()
         if self.get_edge(veh_id) == '':
             # occurs when a vehicle crashes is teleported for some other reason
             return 0.
@@ -1162,6 +1412,12 @@ class TraCIVehicle(KernelVehicle):
         else:
             metric_name += '_no_failsafe'
 
+        if isinstance(veh_id, (list, np.ndarray)):
+            if not isinstance(accel, (list, np.ndarray)):
+                accel = [accel] * len(veh_id)
+            for vehID, acc in zip(veh_id, accel):
+                self.__vehicles[vehID][metric_name] = acc
+            return
         self.__vehicles[veh_id][metric_name] = accel
 
     def get_realized_accel(self, veh_id):
@@ -24,6 +24,7 @@ import sumolib
 
 from flow.core.util import ensure_dir
 from flow.core.kernel import Kernel
+from flow.controllers.base_controller import BaseController
 from flow.utils.exceptions import FatalFlowError
 
 
@@ -327,14 +328,13 @@ class Env(gym.Env, metaclass=ABCMeta):
             self.step_counter += 1
 
             # perform acceleration actions for controlled human-driven vehicles
-            if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    action = self.k.vehicle.get_acc_controller(
-                        veh_id).get_action(self)
-                    accel.append(action)
-                self.k.vehicle.apply_acceleration(
-                    self.k.vehicle.get_controlled_ids(), accel)
+            # (the actions of the controllers of each class are computed at
+            # once)
+            controlled_ids = self.k.vehicle.get_controlled_ids()
+            if len(controlled_ids) > 0:
+                accel = BaseController.get_actions(
+                    self, self.k.vehicle.get_acc_controller(controlled_ids))
+                self.k.vehicle.apply_acceleration(controlled_ids, accel)
 
             # perform lane change actions for controlled human-driven vehicles
             if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
@@ -352,11 +352,12 @@ class Env(gym.Env, metaclass=ABCMeta):
             routing_ids = []
             routing_actions = []
             for veh_id in self.k.vehicle.get_ids():
-                if self.k.vehicle.get_routing_controller(veh_id) \
-                        is not None:
+                route_contr = self.k.vehicle.get_routing_controller(veh_id)
+                # routers subscribed to edge/lane events are only called
+                # after these events (see BaseRouter.route_events)
+                if route_contr is not None and \
+                        route_contr.has_route_event(self):
                     routing_ids.append(veh_id)
-                    route_contr = self.k.vehicle.get_routing_controller(
-                        veh_id)
                     routing_actions.append(route_contr.choose_route(self))
 
             self.k.vehicle.choose_routes(routing_ids, routing_actions)
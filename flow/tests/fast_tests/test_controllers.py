@@ -10,6 +10,7 @@ from flow.controllers.car_following_models import IDMController, \
     OVMController, BCMController, LinearOVM, CFMController, LACController, \
     GippsController, BandoFTLController
 from flow.controllers import FollowerStopper, PISaturation, NonLocalFollowerStopper
+from flow.controllers import BaseController
 from tests.setup_scripts import ring_road_exp_setup
 import os
 import numpy as np
@@ -120,6 +121,21 @@ class TestBCMController(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
+    def test_get_actions(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [5, 10, 15, 20, 25]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_actions(
+            self.env, self.env.k.vehicle.get_acc_controller(ids))
+
+        expected_accel = [-12., 13., 13., 13., 13.]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
 
 class TestOVMController(unittest.TestCase):
     """
@@ -175,6 +191,21 @@ class TestOVMController(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
+    def test_get_actions(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [0, 10, 5, 5, 5]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_actions(
+            self.env, self.env.k.vehicle.get_acc_controller(ids))
+
+        expected_accel = [0., 20.319073, 3.772339, 3.772339, 3.772339]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
 
 class TestLinearOVM(unittest.TestCase):
     """
@@ -225,6 +256,21 @@ class TestLinearOVM(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
+    def test_get_actions(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [5, 10, 10, 15, 0]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_actions(
+            self.env, self.env.k.vehicle.get_acc_controller(ids))
+
+        expected_accel = [0., 12.992308, 12.992308, 25.984615, 0.]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
 
 class TestIDMController(unittest.TestCase):
     """
@@ -284,6 +330,21 @@ class TestIDMController(unittest.TestCase):
             for veh_id in ids
         ]
 
+    def test_get_actions(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [10, 20, 30, 40, 50]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_actions(
+            self.env, self.env.k.vehicle.get_acc_controller(ids))
+
+        expected_accel = [0.96, 0.99, 0.995556, 0.9975, 0.9984]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
 
 class TestInstantaneousFailsafe(unittest.TestCase):
     """
@@ -933,6 +994,21 @@ class TestGippsController(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
+    def test_get_actions(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [2, 4, 6, 8, 10]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_actions(
+            self.env, self.env.k.vehicle.get_acc_controller(ids))
+
+        expected_accel = [0., 5.929271, 5.929271, 5.929271, 5.929271]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
 
 class TestBandoFTLController(unittest.TestCase):
     """
@@ -987,6 +1063,21 @@ class TestBandoFTLController(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
+    def test_get_actions(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [2, 4, 6, 8, 10]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_actions(
+            self.env, self.env.k.vehicle.get_acc_controller(ids))
+
+        expected_accel = [1.649129, 7.853475, 14.057821, 15.70695, 15.959713]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
 
 if __name__ == '__main__':
     unittest.main()
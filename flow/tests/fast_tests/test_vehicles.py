@@ -1,5 +1,8 @@
 import unittest
+from unittest import mock
 import os
+import warnings
+from bisect import bisect_left
 import numpy as np
 
 from flow.core.params import VehicleParams
@@ -9,8 +12,10 @@ from flow.controllers.car_following_models import IDMController, \
     SimCarFollowingController
 from flow.controllers.lane_change_controllers import StaticLaneChanger
 from flow.controllers.rlcontroller import RLController
+from flow.controllers.routing_controllers import ContinuousRouter
 
-from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup
+from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup, \
+    variable_lanes_exp_setup
 
 os.environ["TEST_FLAG"] = "True"
 
@@ -543,6 +548,158 @@ class TestMultiLaneData(unittest.TestCase):
         # TODO(ak): add test
         pass
 
+    def test_variable_lanes(self):
+        """
+        Compare the above mentioned methods and get_ids_by_edge() with the
+        per-vehicle computation on a ring whose edges have 1 to 4 lanes, with
+        lanes that do not exist on the next edge and empty edges.
+        """
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(RLController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=8,
+            initial_speed=0)
+
+        # the "bottom" (1 lane) and "top" (2 lanes) edges start empty
+        initial_config = InitialConfig(spacing="custom")
+        initial_config.additional_params = {
+            "start_positions": [("left", 5), ("left", 20), ("left", 40),
+                                ("left", 10), ("left", 30), ("right", 15),
+                                ("right", 35), ("right", 25)],
+            "start_lanes": [0, 1, 3, 2, 0, 0, 2, 1]}
+
+        env, _, _ = variable_lanes_exp_setup(
+            vehicles=vehicles, initial_config=initial_config)
+        env.reset()
+
+        for _ in range(50):
+            expected, expected_ids_by_edge = reference_multi_lane_data(env.k)
+            self.assertTrue(len(expected) > 0)
+            for veh_id, (headways, tailways, leaders, followers) in \
+                    expected.items():
+                np.testing.assert_array_almost_equal(
+                    env.k.vehicle.get_lane_headways(veh_id), headways)
+                np.testing.assert_array_almost_equal(
+                    env.k.vehicle.get_lane_tailways(veh_id), tailways)
+                self.assertListEqual(
+                    list(env.k.vehicle.get_lane_leaders(veh_id)), leaders)
+                self.assertListEqual(
+                    list(env.k.vehicle.get_lane_followers(veh_id)),
+                    followers)
+            for edge, ids in expected_ids_by_edge.items():
+                self.assertListEqual(env.k.vehicle.get_ids_by_edge(edge), ids)
+            env.step(rl_actions=None)
+
+        env.terminate()
+
+
+def reference_multi_lane_data(k):
+    """Compute the multi-lane data of the RL vehicles one vehicle at a time.
+
+    This is the reference computation of the lane leaders, followers,
+    headways and tailways: the vehicles of each lane are sorted by position,
+    and the edges in front of (behind) a vehicle are walked one at a time
+    until a leader (follower) is found.
+
+    Parameters
+    ----------
+    k : flow.core.kernel.Kernel
+        the kernel of the environment
+
+    Returns
+    -------
+    dict
+        key = RL vehicle id, element = (headways, tailways, leaders,
+        followers), with one element per lane of the vehicle's edge
+    dict
+        key = edge, element = ids of the vehicles on the edge, by lane and
+        position
+    """
+    edge_list = k.network.get_edge_list()
+    tot_list = edge_list + k.network.get_junction_list()
+    num_edges = len(tot_list)
+    max_lanes = max(k.network.num_lanes(edge) for edge in tot_list)
+
+    edge_dict = {}
+    for veh_id in k.vehicle.get_ids():
+        edge = k.vehicle.get_edge(veh_id)
+        if edge:
+            edge_dict.setdefault(edge, [[] for _ in range(max_lanes)])
+            edge_dict[edge][k.vehicle.get_lane(veh_id)].append(
+                (veh_id, k.vehicle.get_position(veh_id)))
+    for lanes in edge_dict.values():
+        for lane in lanes:
+            lane.sort(key=lambda x: x[1])
+
+    def next_leader(edge, lane, pos):
+        add_length = 0
+        for _ in range(num_edges):
+            if len(k.network.next_edge(edge, lane)) == 0:
+                break
+            add_length += k.network.edge_length(edge)
+            edge, lane = k.network.next_edge(edge, lane)[0]
+            if edge in edge_dict and len(edge_dict[edge][lane]) > 0:
+                leader, leader_pos = edge_dict[edge][lane][0]
+                return (leader_pos - pos + add_length
+                        - k.vehicle.get_length(leader)), leader
+        return 1000, ""
+
+    def prev_follower(veh_id, edge, lane, pos):
+        add_length = 0
+        for _ in range(num_edges):
+            if len(k.network.prev_edge(edge, lane)) == 0:
+                break
+            edge, lane = k.network.prev_edge(edge, lane)[0]
+            add_length += k.network.edge_length(edge)
+            if edge in edge_dict and len(edge_dict[edge][lane]) > 0:
+                follower, follower_pos = edge_dict[edge][lane][-1]
+                return (pos - follower_pos + add_length
+                        - k.vehicle.get_length(veh_id)), follower
+        return 1000, ""
+
+    data = {}
+    for veh_id in k.vehicle.get_rl_ids():
+        edge = k.vehicle.get_edge(veh_id)
+        if not edge:
+            continue
+        this_lane = k.vehicle.get_lane(veh_id)
+        pos = k.vehicle.get_position(veh_id)
+        num_lanes = k.network.num_lanes(edge)
+        headways, tailways = [1000] * num_lanes, [1000] * num_lanes
+        leaders, followers = [""] * num_lanes, [""] * num_lanes
+
+        for lane in range(num_lanes):
+            if len(edge_dict[edge][lane]) > 0:
+                ids, positions = zip(*edge_dict[edge][lane])
+                index = bisect_left(positions, pos)
+                if (lane == this_lane and index < len(positions) - 1) \
+                        or (lane != this_lane and index < len(positions)):
+                    # skip the vehicle itself
+                    lead = index + 1 if ids[index] == veh_id else index
+                    leaders[lane] = ids[lead]
+                    headways[lane] = positions[lead] - pos \
+                        - k.vehicle.get_length(ids[lead])
+                if index > 0:
+                    followers[lane] = ids[index - 1]
+                    tailways[lane] = pos - positions[index - 1] \
+                        - k.vehicle.get_length(veh_id)
+            if leaders[lane] == "":
+                headways[lane], leaders[lane] = next_leader(edge, lane, pos)
+            if followers[lane] == "":
+                tailways[lane], followers[lane] = prev_follower(
+                    veh_id, edge, lane, pos)
+
+        data[veh_id] = (headways, tailways, leaders, followers)
+
+    ids_by_edge = {
+        edge: [veh_id for lane in edge_dict.get(edge, [])
+               for veh_id, _ in lane]
+        for edge in edge_list}
+
+    return data, ids_by_edge
+
 
 class TestIdsByEdge(unittest.TestCase):
     """
@@ -568,6 +725,193 @@ class TestIdsByEdge(unittest.TestCase):
         self.assertCountEqual(ids, expected_ids)
 
 
+class TestRouteEvents(unittest.TestCase):
+    """
+    Tests the edge-change and lane-change events of the vehicles, and the
+    routing commands sent by choose_routes().
+    """
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="rl",
+            acceleration_controller=(RLController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=1)
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=4)
+
+        net_params = NetParams(additional_params={
+            "length": 230,
+            "lanes": 2,
+            "speed_limit": 30,
+            "resolution": 40
+        })
+
+        self.env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles, net_params=net_params)
+        self.env.reset()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_events_after_reset(self):
+        """All vehicles get both events after a reset."""
+        for veh_id in self.env.k.vehicle.get_ids():
+            self.assertEqual(set(self.env.k.vehicle.get_events(veh_id)),
+                             {"edge", "lane"})
+
+    def test_events_on_change(self):
+        """The events are only emitted when the edge or lane changes."""
+        k = self.env.k.vehicle
+        num_events = {"edge": 0, "lane": 0, "none": 0}
+
+        for step in range(100):
+            previous = {veh_id: (k.get_edge(veh_id), k.get_lane(veh_id))
+                        for veh_id in k.get_ids()}
+            if step % 20 == 0:
+                k.apply_lane_change(
+                    "rl_0", 1 if k.get_lane("rl_0") == 0 else -1)
+            self.env.step(rl_actions=None)
+
+            for veh_id in k.get_ids():
+                expected = set()
+                if k.get_edge(veh_id) != previous[veh_id][0]:
+                    expected.add("edge")
+                if k.get_lane(veh_id) != previous[veh_id][1]:
+                    expected.add("lane")
+                self.assertEqual(set(k.get_events(veh_id)), expected)
+                for event in expected or ["none"]:
+                    num_events[event] += 1
+
+        # the vehicles changed edge and lane, and mostly stayed put
+        self.assertGreater(num_events["edge"], 0)
+        self.assertGreater(num_events["lane"], 0)
+        self.assertGreater(num_events["none"], num_events["edge"])
+
+    def test_events_on_departure(self):
+        """A vehicle entering the network gets both events."""
+        k = self.env.k.vehicle
+        k.add("test_new", "test", "top", 0, 1, 0)
+
+        for _ in range(10):
+            self.env.step(rl_actions=None)
+            if "test_new" in k.get_ids():
+                break
+        self.assertIn("test_new", k.get_ids())
+        self.assertEqual(set(k.get_events("test_new")), {"edge", "lane"})
+
+    def test_choose_routes(self):
+        """setRoute is only sent if the route choice changes the route."""
+        k = self.env.k.vehicle
+        veh_id = "test_0"
+
+        # move to an edge that is not the first edge of the route
+        for _ in range(200):
+            route = list(k.get_route(veh_id))
+            edge = k.get_edge(veh_id)
+            if edge in route[1:]:
+                break
+            self.env.step(rl_actions=None)
+        self.assertIn(edge, route[1:])
+
+        vehicle_api = k.kernel_api.vehicle
+        with mock.patch.object(vehicle_api, "setRoute",
+                               wraps=vehicle_api.setRoute) as set_route:
+            # the current route, and its part starting with the current edge
+            k.choose_routes([veh_id], [route])
+            k.choose_routes([veh_id], [route[route.index(edge):]])
+            k.choose_routes([veh_id], [None])
+            set_route.assert_not_called()
+
+            # a new route
+            k.choose_routes([veh_id], [[edge]])
+            set_route.assert_called_once_with(vehID=veh_id, edgeList=[edge])
+
+
+class TestListGetters(unittest.TestCase):
+    """
+    Tests that the list getters, which read the columnar state store, agree
+    with the scalar getters.
+    """
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="rl",
+            acceleration_controller=(RLController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=2)
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=6)
+
+        net_params = NetParams(additional_params={
+            "length": 230,
+            "lanes": 2,
+            "speed_limit": 30,
+            "resolution": 40
+        })
+
+        self.env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles, net_params=net_params)
+        self.env.reset()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def assert_getters_agree(self):
+        k = self.env.k.vehicle
+        # a vehicle that is not in the network gets the error value
+        veh_ids = k.get_ids() + ["missing"]
+
+        for getter in (k.get_speed, k.get_lane, k.get_position, k.get_edge,
+                       k.get_leader, k.get_headway):
+            expected = [getter(veh_id, error=-1) for veh_id in veh_ids]
+            self.assertListEqual(list(getter(veh_ids, error=-1)), expected)
+            self.assertListEqual(
+                list(getter(np.array(veh_ids), error=-1)), expected)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = [k.get_last_lc(veh_id) for veh_id in veh_ids]
+        self.assertListEqual(list(k.get_last_lc(veh_ids)), expected)
+
+        np.testing.assert_array_almost_equal(
+            k.get_x_by_id(veh_ids),
+            [k.get_x_by_id(veh_id) for veh_id in veh_ids])
+
+    def test_list_getters(self):
+        """The list getters agree with the scalar getters at every step."""
+        k = self.env.k.vehicle
+        self.assert_getters_agree()
+
+        for step in range(50):
+            if step % 10 == 0:
+                for veh_id in k.get_rl_ids():
+                    k.apply_lane_change(
+                        veh_id, 1 if k.get_lane(veh_id) == 0 else -1)
+            self.env.step(rl_actions=None)
+            self.assert_getters_agree()
+
+    def test_set_headway(self):
+        """A headway set by set_headway is read by the list getter."""
+        k = self.env.k.vehicle
+        veh_ids = k.get_ids()
+
+        k.set_headway(veh_ids[0], 123.)
+        self.assertEqual(k.get_headway(veh_ids[0]), 123.)
+        self.assertEqual(k.get_headway(veh_ids)[0], 123.)
+        self.assertEqual(k.get_headway(veh_ids[:1]), [123.])
+
+
 class TestObservedIDs(unittest.TestCase):
     """Tests the observed_ids methods, which are used for visualization."""
 
@@ -791,3 +791,12 @@ class VariableLanesNetwork(RingNetwork):
         }]
 
         return edges
+
+    @staticmethod
+    def gen_custom_start_pos(cls, net_params, initial_config, num_vehicles):
+        """Generate a user defined set of starting positions.
+
+        This method is just used for testing.
+        """
+        return initial_config.additional_params["start_positions"], \
+            initial_config.additional_params["start_lanes"]
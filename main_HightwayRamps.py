@@ -23,6 +23,11 @@ DEBUG = False
 RENDER = False
 #RENDER = True
 
+# Number of actor processes of the actor/learner training (0 for the synchronous training)
+NUM_ACTORS = 0
+# Number of environments of the vectorized training (1 for a single environment)
+NUM_ENVS = 1
+
 NEAREST_MERGE = False
 # NEAREST_MERGE = True
 
@@ -147,5 +152,5 @@ from GRL_Experiment.Exp_HighwayRamps.HR_D3QN_GAT import Experiment
 exp = Experiment(flow_params)
 exp.run(num_HVs=NUM_HUMAN, num_AVs=NUM_AVs,
         training=TRAINING, testing=TESTING,
-        Graph=Enable_Graph)
+        Graph=Enable_Graph, num_actors=NUM_ACTORS, num_envs=NUM_ENVS)
 